@@ -16,6 +16,7 @@ from datetime import datetime
 import uuid
 from pathlib import Path
 import tempfile
+import argparse
 
 # 导入共享工具库
 try:
@@ -25,14 +26,16 @@ except ImportError:
     sys.exit(1)
 
 # 全局变量
-INSTALL_DIR = Path.home() / ".agsb"  # 用户主目录下的隐藏文件夹，避免root权限
-CONFIG_FILE = INSTALL_DIR / "config.json"
+# --instance NAME 选择实例 (默认 ~/.agsb)，必须在计算路径常量之前从 sys.argv 中取出
+INSTANCE = shared_utils.pop_instance_arg(sys.argv)
+INSTALL_DIR = shared_utils.argosb_instance_dir(INSTANCE)  # 用户主目录下的隐藏文件夹，避免root权限
+CONFIG_FILE = INSTALL_DIR / "config.json" # 旧版配置文件，仅在首次打开状态库时导入
 SB_PID_FILE = INSTALL_DIR / "sbpid.log"
 ARGO_PID_FILE = INSTALL_DIR / "sbargopid.log"
 LIST_FILE = INSTALL_DIR / "list.txt"
+ALL_NODES_FILE = INSTALL_DIR / "allnodes.txt" # 节点导出文件，状态以 state.db 为准
 LOG_FILE = INSTALL_DIR / "argo.log"
 DEBUG_LOG = INSTALL_DIR / "python_debug.log"
-CUSTOM_DOMAIN_FILE = INSTALL_DIR / "custom_domain.txt" # 存储最终使用的域名
 NGINX_SNIPPET_FILE = INSTALL_DIR / "nginx_agsb_snippet.conf" # 用于存放生成的Nginx配置片段
 # 使用共享工具库中的函数
 check_nginx_installed = shared_utils.check_nginx_installed
@@ -41,17 +44,62 @@ download_file = shared_utils.download_file
 download_binary = shared_utils.download_binary
 generate_vmess_link = shared_utils.generate_vmess_link
 get_system_arch = shared_utils.get_system_arch
+ARGOSB_INSTALL = shared_utils.argosb_install_name(INSTANCE)
+
+_state_store = None
+
+def get_state_store():
+    """打开当前实例目录下的 state.db (首次打开时自动导入旧的 JSON/TXT 状态文件)"""
+    global _state_store
+    if _state_store is None:
+        _state_store = shared_utils.open_argosb_state(INSTALL_DIR)
+    return _state_store
+
+def is_installed():
+    """已安装：状态库中有安装记录，或存在尚未迁移的旧配置文件"""
+    if not shared_utils.argosb_state_exists(INSTALL_DIR):
+        return False
+    return get_state_store().get_install(ARGOSB_INSTALL) is not None
+
+def get_perf_options(args=None):
+    """sing-box 性能参数：命令行 > 环境变量 > 安装时保存的值"""
+    saved = get_state_store().get_install(ARGOSB_INSTALL) if INSTALL_DIR.exists() else None
+    return shared_utils.load_singbox_perf_options(args, saved=(saved or {}).get("perf"))
+
+def get_protocols(args=None):
+    """入站协议列表：命令行 > 环境变量 > 安装时保存的值"""
+    saved = get_state_store().get_install(ARGOSB_INSTALL) if INSTALL_DIR.exists() else None
+    return shared_utils.load_protocols(args, saved=list((saved or {}).get("protocols") or []))
+
+def get_protocol_ports(port_vm_ws):
+    """{协议名: 回环端口}，旧安装只有 vmess-ws"""
+    config = get_state_store().get_install(ARGOSB_INSTALL) or {}
+    return config.get("protocols") or {"vmess-ws": port_vm_ws}
+
+def uses_path_routing():
+    """命名隧道或 Nginx 协同模式下按路径分流，所有协议都可经隧道访问"""
+    config = get_state_store().get_install(ARGOSB_INSTALL) or {}
+    return bool(config.get("argo_token")) or check_nginx_installed()
 
 # 添加命令行参数解析
 def parse_args():
     parser = argparse.ArgumentParser(description="ArgoSB Python3 一键脚本 (支持自定义域名和Argo Token)")
     parser.add_argument("action", nargs="?", default="install",
-                        choices=["install", "status", "update", "del", "uninstall", "cat"],
-                        help="操作类型: install(安装), status(状态), update(更新), del(卸载), cat(查看节点)")
+                        choices=["install", "status", "update", "del", "uninstall", "cat", "bench", "bench-proto", "user", "optimize", "tune", "ingress"],
+                        help="操作类型: install(安装), status(状态), update(更新), del(卸载), cat(查看节点), bench(多路复用延迟测试), bench-proto(协议吞吐/CPU测试), user(多用户管理), optimize(优选IP), tune(隧道传输测速), ingress(命名隧道本地路由)")
     parser.add_argument("--domain", "-d", dest="agn", help="设置自定义域名 (例如: xxx.trycloudflare.com 或 your.custom.domain)")
     parser.add_argument("--uuid", "-u", help="设置自定义UUID")
     parser.add_argument("--port", "-p", dest="vmpt", type=int, help="设置自定义Vmess端口")
     parser.add_argument("--agk", "--token", dest="agk", help="设置 Argo Tunnel Token (用于Cloudflare Zero Trust命名隧道)")
+    # 实际值已在模块加载时由 pop_instance_arg 取出，这里只用于 --help 展示
+    parser.add_argument("--instance", default=INSTANCE, help="实例名，不同实例使用独立的目录/UUID/域名/Token (默认 default 即 ~/.agsb)")
+    parser.add_argument("--all", action="store_true", help="status: 汇总检查所有实例")
+    parser.add_argument("params", nargs="*", help="user 子命令参数: add NAME [UUID] | del NAME | list")
+    shared_utils.add_protocol_arguments(parser)
+    shared_utils.add_singbox_perf_arguments(parser)
+    shared_utils.add_edge_scan_arguments(parser)
+    shared_utils.add_cloudflared_tune_arguments(parser)
+    shared_utils.add_ingress_arguments(parser)
 
     return parser.parse_args()
 
@@ -80,6 +128,8 @@ def print_usage():
     print("  \033[36mpython3 script.py cat\033[0m                 - 查看单行节点列表")
     print("  \033[36mpython3 script.py update\033[0m              - 更新脚本")
     print("  \033[36mpython3 script.py del\033[0m                 - 卸载服务")
+    print("  \033[36mpython3 script.py status --all\033[0m       - 一次检查所有实例")
+    print("  \033[36mpython3 script.py --instance NAME ...\033[0m - 在独立实例 ~/.agsb-NAME 中执行任意命令")
     print()
     print("\033[33m支持的环境变量:\033[0m")
     print("  \033[36mexport vmpt=12345\033[0m                       - 设置自定义Vmess端口")
@@ -104,7 +154,8 @@ def generate_links(domain, port_vm_ws, uuid_str):
     write_debug_log(f"生成链接: domain={domain}, port_vm_ws={port_vm_ws}, uuid_str={uuid_str}")
 
     ws_path = f"/{uuid_str[:8]}-vm" # 使用UUID前8位作为路径一部分，增加一点变化性
-    ws_path_full = f"{ws_path}?ed=2048"
+    perf = get_perf_options()
+    ws_path_full = shared_utils.ws_path_with_early_data(ws_path, perf)
     write_debug_log(f"WebSocket路径: {ws_path_full}")
 
     hostname = socket.gethostname()[:10] # 限制主机名长度
@@ -112,18 +163,12 @@ def generate_links(domain, port_vm_ws, uuid_str):
     link_names = []
     link_configs_for_json_output = [] # 用于未来可能的JSON输出
 
-    # Cloudflare优选IP和端口
-    cf_ips_tls = {
-        "104.16.0.0": "443", "104.17.0.0": "8443", "104.18.0.0": "2053",
-        "104.19.0.0": "2083", "104.20.0.0": "2087"
-    }
-    cf_ips_http = {
-        "104.21.0.0": "80", "104.22.0.0": "8085", "104.24.0.0": "8880"
-    }
+    # Cloudflare优选IP和端口：优先使用 optimize 扫描结果，未扫描或已过期时使用默认地址
+    cf_ips_tls, cf_ips_http, optimized = shared_utils.get_edge_endpoints(get_state_store())
 
     # === TLS节点 ===
-    for ip, port_cf in cf_ips_tls.items():
-        ps_name = f"VMWS-TLS-{hostname}-{ip.split('.')[2]}-{port_cf}"
+    for ip, port_cf in cf_ips_tls:
+        ps_name = f"VMWS-TLS-{hostname}-{ip.split('.')[2]}-{port_cf}" if not optimized else f"VMWS-TLS-{hostname}-{ip}-{port_cf}"
         config = {
             "ps": ps_name, "add": ip, "port": port_cf, "id": uuid_str, "aid": "0",
             "net": "ws", "type": "none", "host": domain, "path": ws_path_full,
@@ -134,8 +179,8 @@ def generate_links(domain, port_vm_ws, uuid_str):
         link_configs_for_json_output.append(config)
 
     # === 非TLS节点 ===
-    for ip, port_cf in cf_ips_http.items():
-        ps_name = f"VMWS-HTTP-{hostname}-{ip.split('.')[2]}-{port_cf}"
+    for ip, port_cf in cf_ips_http:
+        ps_name = f"VMWS-HTTP-{hostname}-{ip.split('.')[2]}-{port_cf}" if not optimized else f"VMWS-HTTP-{hostname}-{ip}-{port_cf}"
         config = {
             "ps": ps_name, "add": ip, "port": port_cf, "id": uuid_str, "aid": "0",
             "net": "ws", "type": "none", "host": domain, "path": ws_path_full,
@@ -168,12 +213,30 @@ def generate_links(domain, port_vm_ws, uuid_str):
     link_names.append(f"HTTP-Direct-{domain}-80")
     link_configs_for_json_output.append(direct_http_config)
 
-    # 保存所有链接到文件
-    (INSTALL_DIR / "allnodes.txt").write_text("\n".join(all_links) + "\n")
-    (INSTALL_DIR / "jh.txt").write_text("\n".join(all_links) + "\n") 
+    # 其余协议复用同一组优选地址；独立模式下只有主协议经隧道可达
+    served = shared_utils.served_protocols(list(get_protocol_ports(port_vm_ws)), uses_path_routing())
+    vmess_configs = link_configs_for_json_output
+    if "vmess-ws" not in served:
+        all_links, link_names, link_configs_for_json_output = [], [], []
+    for name, link, config in shared_utils.extra_protocol_links(vmess_configs, served, f"/{uuid_str[:8]}", perf):
+        all_links.append(link)
+        link_names.append(name)
+        link_configs_for_json_output.append(config)
 
-    # 保存域名到文件
-    CUSTOM_DOMAIN_FILE.write_text(domain)
+    # 节点与最终域名写入状态库 (同一事务)，allnodes.txt 仅作为纯链接导出
+    store = get_state_store()
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM nodes WHERE install = ?", (ARGOSB_INSTALL,))
+        conn.executemany("INSERT INTO nodes (install, position, name, link) VALUES (?, ?, ?, ?)",
+                         [(ARGOSB_INSTALL, i, name, link) for i, (name, link) in enumerate(zip(link_names, all_links))])
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('custom_domain', ?)", (domain,))
+    ALL_NODES_FILE.write_text("\n".join(all_links) + "\n")
+    # vmess:// 链接无法携带多路复用参数，另行导出匹配的客户端配置
+    shared_utils.write_client_mux_exports(INSTALL_DIR, link_configs_for_json_output, get_perf_options())
+    # 节点模板用于 user 命令为附加用户生成各自的节点与订阅
+    store = get_state_store()
+    store.update_install(ARGOSB_INSTALL, link_templates=link_configs_for_json_output)
+    shared_utils.export_user_links(store, ARGOSB_INSTALL, INSTALL_DIR, link_configs_for_json_output)
 
     # 创建LIST_FILE (带颜色) - 这个文件主要用于 status 命令
     list_content_color_file = [] # 使用不同的变量名以避免混淆
@@ -223,7 +286,7 @@ def generate_links(domain, port_vm_ws, uuid_str):
     
     print("\033[36m├───────────────────────────────────────────────────────────────┤\033[0m")
     print(f"\033[36m│ \033[32m详细节点信息及操作指南已保存到: \033[0m{LIST_FILE}")
-    print(f"\033[36m│ \033[32m单行节点列表 (纯链接) 已保存到: \033[0m{INSTALL_DIR / 'allnodes.txt'}")
+    print(f"\033[36m│ \033[32m单行节点列表 (纯链接) 已保存到: \033[0m{ALL_NODES_FILE}")
     print("\033[36m│ \033[32m使用 \033[33mpython3 " + os.path.basename(__file__) + " status\033[32m 查看详细状态和节点\033[0m")
     print("\033[36m│ \033[32m使用 \033[33mpython3 " + os.path.basename(__file__) + " cat\033[32m 查看所有单行节点\033[0m")
     print("\033[36m│ \033[32m使用 \033[33mpython3 " + os.path.basename(__file__) + " del\033[32m 删除所有节点\033[0m")
@@ -277,17 +340,18 @@ def install(args):
     if not port_vm_ws_str:
         port_vm_ws_str = input(f"请输入自定义Vmess端口 (例如: 49999, 10000-65535, 留空则随机生成): ").strip()
     
+    preferred_port = None
     if port_vm_ws_str:
         try:
-            port_vm_ws = int(port_vm_ws_str)
-            if not (10000 <= port_vm_ws <= 65535):
+            preferred_port = int(port_vm_ws_str)
+            if not (10000 <= preferred_port <= 65535):
                 print("端口号无效，将使用随机端口。")
-                port_vm_ws = random.randint(10000, 65535)
+                preferred_port = None
         except ValueError:
             print("端口输入非数字，将使用随机端口。")
-            port_vm_ws = random.randint(10000, 65535)
-    else:
-        port_vm_ws = random.randint(10000, 65535)
+    protocols = get_protocols(args)
+    # 跳过已绑定端口、DNAT 跳跃范围和其他安装的预留，并把结果预留到状态库
+    port_vm_ws = shared_utils.allocate_port(get_state_store(), ARGOSB_INSTALL, protocols[0], preferred=preferred_port)
     print(f"使用 Vmess 本地端口: {port_vm_ws}")
     write_debug_log(f"Vmess Port: {port_vm_ws}")
 
@@ -336,6 +400,8 @@ def install(args):
     write_debug_log(f"检测到通用架构: {arch}, sing-box适用架构: {sb_arch}, cloudflared适用架构: {cf_arch}")
     # sing-box
     singbox_path = INSTALL_DIR / "sing-box"
+    # 多实例共用缓存目录中的二进制，命中时不再下载
+    shared_utils.link_cached_binary("sing-box", singbox_path)
     if not singbox_path.exists():
         try:
             print("获取sing-box最新版本号...")
@@ -382,6 +448,8 @@ def install(args):
 
     # cloudflared
     cloudflared_path = INSTALL_DIR / "cloudflared"
+    # 多实例共用缓存目录中的二进制，命中时不再下载
+    shared_utils.link_cached_binary("cloudflared", cloudflared_path)
     if not cloudflared_path.exists():
         # 使用处理过的 cf_arch 
         cf_url = f"https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-{cf_arch}"
@@ -392,19 +460,39 @@ def install(args):
                 print("cloudflared 备用下载也失败，退出安装")
                 sys.exit(1)
 
+    shared_utils.cache_binary("sing-box", singbox_path)
+    shared_utils.cache_binary("cloudflared", cloudflared_path)
+
     # --- 配置和启动 ---
+    perf = get_perf_options(args)
+    try:
+        ingress_rules = [shared_utils.parse_ingress_rule(spec) for spec in (args.ingress or [])]
+    except ValueError as e:
+        print(f"\033[31m{e}\033[0m")
+        sys.exit(1)
+    if args.ingress_config and not argo_token:
+        print("⚠️ ingress 配置仅适用于命名隧道 (Argo Token)，临时隧道将忽略该选项")
     config_data = {
         "uuid_str": uuid_str,
         "port_vm_ws": port_vm_ws,
         "argo_token": argo_token, # Will be None if not provided
         "custom_domain_agn": custom_domain, # Will be None if not provided
+        "perf": perf,
+        "ingress": {"enabled": bool(args.ingress_config), "rules": ingress_rules},
         "install_date": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config_data, f, indent=2)
-    write_debug_log(f"生成配置文件: {CONFIG_FILE} with data: {config_data}")
+    store = get_state_store()
+    store.put_install_with_ports(ARGOSB_INSTALL, config_data, [(port_vm_ws, protocols[0], 'tcp')])
+    # 主协议使用上面的端口，其余协议各分配一个回环端口
+    protocol_ports = shared_utils.allocate_protocol_ports(store, ARGOSB_INSTALL, protocols, port_vm_ws)
+    store.update_install(ARGOSB_INSTALL, protocols=protocol_ports)
+    print(f"✅ 入站协议: {', '.join(f'{name}:{port}' for name, port in protocol_ports.items())}")
+    write_debug_log(f"安装配置已写入状态库: {store.path} with data: {config_data}")
 
-    create_sing_box_config(port_vm_ws, uuid_str)
+    create_sing_box_config(port_vm_ws, uuid_str, perf)
+    shared_utils.apply_tcp_buffer_sysctls(perf)
+    # 首次安装时测速选择 cloudflared 协议与 IP 版本，之后沿用保存的结果
+    shared_utils.tune_cloudflared(store, ARGOSB_INSTALL, args, force=False)
     create_startup_script() # Now reads from config for token
     setup_autostart()
     start_services()
@@ -466,22 +554,23 @@ def uninstall():
     print("开始卸载服务...")
     
     # 停止服务
-    for pid_file_path in [SB_PID_FILE, ARGO_PID_FILE]:
-        if pid_file_path.exists():
+    if INSTALL_DIR.exists():
+        store = get_state_store()
+        for service_name, pid_file_path in [("sing-box", SB_PID_FILE), ("cloudflared", ARGO_PID_FILE)]:
             try:
-                pid = pid_file_path.read_text().strip()
+                pid = shared_utils.sync_service_pid(store, service_name, pid_file_path)
                 if pid:
-                    print(f"正在停止进程 PID: {pid} (来自 {pid_file_path.name})")
+                    print(f"正在停止进程 PID: {pid} ({service_name})")
                     os.system(f"kill {pid} 2>/dev/null || true")
             except Exception as e:
-                print(f"停止进程时出错 ({pid_file_path.name}): {e}")
+                print(f"停止进程时出错 ({service_name}): {e}")
+        store.close()
     time.sleep(1) # 给进程一点时间退出
 
     # 强制停止 (如果还在运行)
     print("尝试强制终止可能残留的 sing-box 和 cloudflared 进程...")
-    os.system("pkill -9 -f 'sing-box run -c sb.json' 2>/dev/null || true")
-    os.system("pkill -9 -f 'cloudflared tunnel --url' 2>/dev/null || true") # Quick Tunnel
-    os.system("pkill -9 -f 'cloudflared tunnel --no-autoupdate run --token' 2>/dev/null || true") # Named Tunnel
+    # 按工作目录匹配，只结束本实例的进程，不影响其他实例
+    shared_utils.kill_instance_processes(INSTALL_DIR)
 
     # 移除crontab项
     try:
@@ -550,21 +639,24 @@ def upgrade():
 
 # 检查脚本运行状态
 def check_status():
-    sb_running = SB_PID_FILE.exists() and os.path.exists(f"/proc/{SB_PID_FILE.read_text().strip()}")
-    cf_running = ARGO_PID_FILE.exists() and os.path.exists(f"/proc/{ARGO_PID_FILE.read_text().strip()}")
+    installed = is_installed()
+    store = get_state_store() if installed else None
+    sb_running = installed and shared_utils.sync_service_pid(store, "sing-box", SB_PID_FILE) is not None
+    cf_running = installed and shared_utils.sync_service_pid(store, "cloudflared", ARGO_PID_FILE) is not None
+    links = store.get_links(ARGOSB_INSTALL) if installed else []
 
-    if sb_running and cf_running and LIST_FILE.exists():
+    if sb_running and cf_running and links:
         print("\033[36m╭───────────────────────────────────────────────────────────────╮\033[0m")
         print("\033[36m│                \033[33m✨ ArgoSB 运行状态 ✨                    \033[36m│\033[0m")
         print("\033[36m├───────────────────────────────────────────────────────────────┤\033[0m")
         print("\033[36m│ \033[32m服务状态: \033[33m正在运行 (sing-box & cloudflared)\033[0m")
         
         domain_to_display = "未知"
-        if CUSTOM_DOMAIN_FILE.exists():
-            domain_to_display = CUSTOM_DOMAIN_FILE.read_text().strip()
+        if store.get_setting("custom_domain"):
+            domain_to_display = store.get_setting("custom_domain")
             print(f"\033[36m│ \033[32m当前使用域名: \033[0m{domain_to_display}")
-        elif CONFIG_FILE.exists(): # Fallback to config if custom_domain.txt not there
-            config = json.loads(CONFIG_FILE.read_text())
+        else: # Fallback to install config if no final domain recorded
+            config = store.get_install(ARGOSB_INSTALL) or {}
             if config.get("custom_domain_agn"):
                  domain_to_display = config["custom_domain_agn"]
                  print(f"\033[36m│ \033[32m配置域名 (agn): \033[0m{domain_to_display}")
@@ -579,13 +671,10 @@ def check_status():
              print("\033[36m│ \033[31m域名信息未找到或未生成，请检查配置或日志。\033[0m")
 
         print("\033[36m├───────────────────────────────────────────────────────────────┤\033[0m")
-        if (INSTALL_DIR / "allnodes.txt").exists():
-            print("\033[36m│ \033[33m节点链接 (部分示例):\033[0m")
-            with open(INSTALL_DIR / "allnodes.txt", 'r') as f:
-                links = f.read().splitlines()
-                for i in range(min(3, len(links))):
-                    print(f"\033[36m│ \033[0m{links[i][:70]}...") # 打印部分链接
-            if len(links) > 3:
+        print("\033[36m│ \033[33m节点链接 (部分示例):\033[0m")
+        for i in range(min(3, len(links))):
+            print(f"\033[36m│ \033[0m{links[i][:70]}...") # 打印部分链接
+        if len(links) > 3:
                 print("\033[36m│ \033[32m... 更多节点请使用 'cat' 命令查看 ...\033[0m")
         print("\033[36m╰───────────────────────────────────────────────────────────────╯\033[0m")
         return True
@@ -593,7 +682,7 @@ def check_status():
     status_msgs = []
     if not sb_running: status_msgs.append("sing-box 未运行")
     if not cf_running: status_msgs.append("cloudflared 未运行")
-    if not LIST_FILE.exists(): status_msgs.append("节点信息文件未生成")
+    if not links: status_msgs.append("节点信息未生成")
 
     print("\033[36m╭───────────────────────────────────────────────────────────────╮\033[0m")
     print("\033[36m│                \033[33m✨ ArgoSB 运行状态 ✨                    \033[36m│\033[0m")
@@ -611,37 +700,28 @@ def check_status():
 
 
 # 创建sing-box配置
-def create_sing_box_config(port_vm_ws, uuid_str):
+def create_sing_box_config(port_vm_ws, uuid_str, perf=None):
     write_debug_log(f"创建sing-box配置，端口: {port_vm_ws}, UUID: {uuid_str}")
-    ws_path = f"/{uuid_str[:8]}-vm" # 和 generate_links 中的路径保持一致
-
-    config_dict = {
-        "log": {"level": "info", "timestamp": True},
-        "inbounds": [{
-            "type": "vmess", "tag": "vmess-in", "listen": "127.0.0.1",
-            "listen_port": port_vm_ws, "tcp_fast_open": True, "sniff": True,
-            "sniff_override_destination": True, "proxy_protocol": False, # No proxy protocol from local cloudflared
-            "users": [{"uuid": uuid_str, "alterId": 0}], # alterId 0 is common now
-            "transport": {
-                "type": "ws", "path": ws_path,
-                "max_early_data": 2048, "early_data_header_name": "Sec-WebSocket-Protocol"
-            }
-        }],
-        "outbounds": [{"type": "direct", "tag": "direct"}]
-    }
+    path_prefix = f"/{uuid_str[:8]}" # 各协议路径为 前缀-后缀，和 generate_links 中的路径保持一致
+
+    # 多路复用、早期数据与 TCP 参数由 shared_utils 统一生成
+    perf = perf or get_perf_options()
+    # 所有用户共用同一组入站，用户数只影响 users 数组长度
+    users = shared_utils.get_singbox_users(get_state_store(), ARGOSB_INSTALL, uuid_str)
+    config_dict = shared_utils.build_singbox_server_config(get_protocol_ports(port_vm_ws), users, path_prefix, perf)
     sb_config_file = INSTALL_DIR / "sb.json"
     with open(sb_config_file, 'w') as f:
         json.dump(config_dict, f, indent=2)
-    write_debug_log(f"sing-box配置已写入文件: {sb_config_file}")
+    write_debug_log(f"sing-box配置已写入文件: {sb_config_file}, 性能参数: {perf}")
     return True
 
 # 创建启动脚本
 def create_startup_script():
-    if not CONFIG_FILE.exists():
-        print("配置文件 config.json 不存在，无法创建启动脚本。请先执行安装。")
+    config = get_state_store().get_install(ARGOSB_INSTALL)
+    if not config:
+        print("状态库中没有安装配置，无法创建启动脚本。请先执行安装。")
         return
 
-    config = json.loads(CONFIG_FILE.read_text())
     port_vm_ws = config["port_vm_ws"]
     uuid_str = config["uuid_str"]
     argo_token = config.get("argo_token") # Safely get token, might be None
@@ -659,10 +739,23 @@ echo $! > {SB_PID_FILE.name}
     nginx_installed = check_nginx_installed()
     # 和 sing-box 配置中的路径保持一致
     ws_path = f"/{uuid_str[:8]}-vm" 
+    path_prefix = f"/{uuid_str[:8]}"
+    protocol_ports = get_protocol_ports(port_vm_ws)
+    # gRPC 需要 cloudflared 以 HTTP/2 连接源站
+    origin_flags = shared_utils.cloudflared_origin_flags(shared_utils.served_protocols(list(protocol_ports), uses_path_routing()))
     # cloudflared启动脚本
     cf_start_script_path = INSTALL_DIR / "start_cf.sh"
     cf_cmd_base = f"./cloudflared tunnel --no-autoupdate"
-    if argo_token:
+    cf_profile = shared_utils.load_cloudflared_profile(get_state_store())
+    cf_flags = shared_utils.cloudflared_tunnel_flags(cf_profile)
+    ingress = config.get("ingress") or {}
+    ingress_mode = bool(argo_token and ingress.get("enabled"))
+    if ingress_mode:
+        # 命名隧道 + 本地 ingress：协议路径直连 sing-box，其余请求交给 Nginx (如有)
+        print("🧭 检测到Argo Token且启用了ingress配置，将以【Ingress模式】运行。协议路径直连sing-box。")
+        cloudflared_url = None
+        nginx_needed = False
+    elif argo_token:
         # 命名隧道模式，通常需要配合 Nginx 使用
         print("🤝 检测到Argo Token，将以【Nginx协同模式】运行。Cloudflared将指向Nginx。")
         cloudflared_url = "http://localhost:80"
@@ -675,7 +768,7 @@ echo $! > {SB_PID_FILE.name}
     else:
         # 临时隧道，且没有 Nginx
         print("🚀 将以【独立模式】运行。Cloudflared将直连sing-box。")
-        ws_path_for_url = f"{ws_path}?ed=2048"
+        ws_path_for_url = shared_utils.ws_path_with_early_data(ws_path, get_perf_options())
         cloudflared_url = f"http://localhost:{port_vm_ws}{ws_path_for_url}"
         nginx_needed = False
 
@@ -687,24 +780,23 @@ echo $! > {SB_PID_FILE.name}
 # 例如: include {os.path.abspath(NGINX_SNIPPET_FILE)};
 
 # 将特定路径的WebSocket流量转发给sing-box
-location = {ws_path} {{
-    proxy_pass http://127.0.0.1:{port_vm_ws};
-    proxy_http_version 1.1;
-    proxy_set_header Upgrade $http_upgrade;
-    proxy_set_header Connection "upgrade";
-    proxy_set_header Host $host;
-    proxy_set_header X-Real-IP $remote_addr;
-    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-}}
-"""
+{shared_utils.render_nginx_locations(protocol_ports, path_prefix)}"""
         with open(NGINX_SNIPPET_FILE, "w") as f:
             f.write(nginx_snippet)
         print(f"✅ 已生成Nginx配置片段: {NGINX_SNIPPET_FILE}")
     # 根据模式构建最终的cloudflared命令
-    if argo_token: # 使用命名隧道
-        cf_cmd = f"{cf_cmd_base} run --token {argo_token}"
+    if ingress_mode: # 命名隧道 + 本地 ingress 配置
+        hostname = config.get("custom_domain_agn") or get_state_store().get_setting("custom_domain")
+        rules = shared_utils.build_cloudflared_ingress(
+            protocol_ports, path_prefix, hostname, ingress.get("rules") or [], cf_profile,
+            fallback="http://localhost:80" if nginx_installed else "http_status:404")
+        ingress_path = shared_utils.write_cloudflared_ingress(INSTALL_DIR, argo_token, rules)
+        print(f"✅ 已生成cloudflared ingress配置: {ingress_path} ({len(rules)} 条规则)")
+        cf_cmd = f"{cf_cmd_base} {cf_flags} --config {ingress_path.name} run"
+    elif argo_token: # 使用命名隧道
+        cf_cmd = f"{cf_cmd_base} {cf_flags} run --token {argo_token}"
     else: # 临时隧道
-        cf_cmd = f"{cf_cmd_base} --url {cloudflared_url} --edge-ip-version auto --protocol http2"
+        cf_cmd = f"{cf_cmd_base} {cf_flags} --url {cloudflared_url}{origin_flags}"
     
     cf_start_content = f'''#!/bin/bash
 cd {INSTALL_DIR.resolve()}
@@ -714,7 +806,7 @@ echo $! > {ARGO_PID_FILE.name}
     cf_start_script_path.write_text(cf_start_content)
     os.chmod(cf_start_script_path, 0o755)
     
-    write_debug_log(f"启动脚本已创建/更新 (Nginx协同模式: {nginx_needed})")
+    write_debug_log(f"启动脚本已创建/更新 (Nginx协同模式: {nginx_needed}, Ingress模式: {ingress_mode})")
 
 # 启动服务
 def start_services():
@@ -726,6 +818,11 @@ def start_services():
     
     print("等待服务启动 (约5秒)...")
     time.sleep(5)
+    # 启动脚本写下的 PID 同步到状态库
+    store = get_state_store()
+    for service_name, pid_file_path in [("sing-box", SB_PID_FILE), ("cloudflared", ARGO_PID_FILE)]:
+        pid = shared_utils.sync_service_pid(store, service_name, pid_file_path)
+        write_debug_log(f"{service_name} PID: {pid}")
     write_debug_log("服务启动命令已执行。")
 
 # 获取tunnel域名 (仅用于Quick Tunnel)
@@ -752,6 +849,122 @@ def get_tunnel_domain():
     write_debug_log("获取tunnel域名超时。")
     return None
 
+# Cloudflare 优选 IP
+def run_optimize(args):
+    if args.selftest:
+        sys.exit(0 if shared_utils.selftest_edge_scanner() else 1)
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if INSTALL_DIR.exists() else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装。\033[0m")
+        sys.exit(1)
+    domain = store.get_setting("custom_domain") or config.get("custom_domain_agn") or get_tunnel_domain()
+    if not shared_utils.optimize_edges(store, args, sni=domain):
+        sys.exit(1)
+    if domain:
+        print("🔄 使用优选 IP 重新生成节点...")
+        generate_links(domain, config["port_vm_ws"], config["uuid_str"])
+    else:
+        print("⚠️ 无法确定域名，优选结果将在下次生成节点时生效")
+
+# cloudflared 传输测速
+def run_tune_tunnel(args):
+    store = get_state_store()
+    if not INSTALL_DIR.exists() or not store.get_install(ARGOSB_INSTALL):
+        print("\033[31m未检测到安装，请先安装。\033[0m")
+        sys.exit(1)
+    shared_utils.tune_cloudflared(store, ARGOSB_INSTALL, args)
+    create_startup_script()
+    print("✅ 已按新参数重新生成 start_cf.sh，重启 cloudflared 后生效")
+    if not store.get_install(ARGOSB_INSTALL).get("argo_token"):
+        print("⚠️ 临时隧道重启后域名会变化，重启后请运行 status 重新生成节点")
+
+# 命名隧道本地 ingress 路由
+def run_ingress(args):
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if INSTALL_DIR.exists() else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装。\033[0m")
+        sys.exit(1)
+    if not config.get("argo_token"):
+        print("\033[31mingress 配置仅适用于命名隧道，请使用 --agk 重新安装。\033[0m")
+        sys.exit(1)
+    ingress = config.get("ingress") or {"enabled": False, "rules": []}
+    if args.ingress_config is not None:
+        ingress["enabled"] = args.ingress_config
+    if args.ingress:
+        try:
+            ingress["rules"] = [shared_utils.parse_ingress_rule(spec) for spec in args.ingress]
+        except ValueError as e:
+            print(f"\033[31m{e}\033[0m")
+            sys.exit(1)
+    store.update_install(ARGOSB_INSTALL, ingress=ingress)
+    print(f"🧭 Ingress模式: {'启用' if ingress['enabled'] else '关闭'}")
+    for rule in ingress["rules"]:
+        print(f"   {rule.get('hostname', '*')}{rule.get('path', '')} → {rule['service']}")
+    create_startup_script()
+    # 命名隧道域名固定，可以直接重启 cloudflared 使新路由生效
+    pid = shared_utils.sync_service_pid(store, "cloudflared", ARGO_PID_FILE)
+    if pid:
+        os.system(f"kill {pid} 2>/dev/null || true")
+        time.sleep(1)
+    subprocess.run(str(INSTALL_DIR / "start_cf.sh"), shell=True)
+    time.sleep(2)
+    if shared_utils.sync_service_pid(store, "cloudflared", ARGO_PID_FILE):
+        print("✅ cloudflared 已按新配置重启")
+    else:
+        print(f"\033[31mcloudflared 启动失败，请检查 {LOG_FILE}\033[0m")
+
+# 多用户管理
+def manage_users(params):
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if INSTALL_DIR.exists() else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装。\033[0m")
+        sys.exit(1)
+    if not shared_utils.user_command(store, ARGOSB_INSTALL, params):
+        return
+    # 重新生成 sing-box 配置与各用户节点，再通知 sing-box 热重载
+    create_sing_box_config(config["port_vm_ws"], config["uuid_str"])
+    exported = shared_utils.export_user_links(store, ARGOSB_INSTALL, INSTALL_DIR, config.get("link_templates") or [])
+    if not config.get("link_templates"):
+        print("⚠️ 尚未生成节点模板，请先运行 status 或重新安装后再导出用户节点")
+    else:
+        print(f"📄 已更新 {exported} 个用户的节点文件: {INSTALL_DIR / 'users'}/<用户名>/allnodes.txt, sub.txt")
+    shared_utils.reload_singbox(INSTALL_DIR / "sing-box", INSTALL_DIR / "sb.json", SB_PID_FILE)
+
+# 多路复用基准测试
+def run_mux_benchmark(args, rounds=50):
+    singbox_path = INSTALL_DIR / "sing-box"
+    if not singbox_path.exists():
+        print("\033[31m未找到 sing-box，请先安装。\033[0m")
+        sys.exit(1)
+    perf = get_perf_options(args)
+    if perf["mux"] == "off":
+        perf["mux"] = "smux" # 基准测试总是对比开启多路复用的情况
+    print(f"⏱️ 正在测试新建连接延迟 ({rounds} 次/模式)...")
+    try:
+        results = shared_utils.benchmark_singbox_mux(singbox_path, INSTALL_DIR / "bench", perf, rounds)
+    except Exception as e:
+        print(f"\033[31m基准测试失败: {e}\033[0m")
+        sys.exit(1)
+    shared_utils.print_mux_benchmark(results)
+
+# 协议吞吐与 CPU 开销基准测试
+def run_protocol_benchmark(args, size_mb=64):
+    singbox_path = INSTALL_DIR / "sing-box"
+    if not singbox_path.exists():
+        print("\033[31m未找到 sing-box，请先安装。\033[0m")
+        sys.exit(1)
+    protocols = shared_utils.parse_protocol_list(args.protocols) if args.protocols else list(shared_utils.ARGOSB_PROTOCOLS)
+    print(f"📊 正在测试 {len(protocols)} 个协议的吞吐与 CPU 开销 ({size_mb}MB/协议)...")
+    try:
+        results = shared_utils.benchmark_singbox_throughput(singbox_path, INSTALL_DIR / "bench", protocols, get_perf_options(args), size_mb)
+    except Exception as e:
+        print(f"\033[31m基准测试失败: {e}\033[0m")
+        sys.exit(1)
+    shared_utils.print_throughput_benchmark(results, size_mb)
+
 # 主函数
 def main():
     print_info()
@@ -764,15 +977,29 @@ def main():
     elif args.action == "update":
         upgrade()
     elif args.action == "status":
+        if args.all:
+            sys.exit(0 if shared_utils.print_instances_status() else 1)
         check_status()
+    elif args.action == "bench":
+        run_mux_benchmark(args)
+    elif args.action == "optimize":
+        run_optimize(args)
+    elif args.action == "tune":
+        run_tune_tunnel(args)
+    elif args.action == "ingress":
+        run_ingress(args)
+    elif args.action == "user":
+        manage_users(args.params)
+    elif args.action == "bench-proto":
+        run_protocol_benchmark(args)
     elif args.action == "cat":
-        all_nodes_path = INSTALL_DIR / "allnodes.txt"
-        if all_nodes_path.exists():
-            print(all_nodes_path.read_text().strip())
+        links = get_state_store().get_links(ARGOSB_INSTALL) if INSTALL_DIR.exists() else []
+        if links:
+            print("\n".join(links))
         else:
-            print(f"\033[31m节点文件 {all_nodes_path} 未找到。请先安装或运行 status。\033[0m")
+            print(f"\033[31m状态库中没有节点信息。请先安装或运行 status。\033[0m")
     else: # 默认行为，通常是 'install' 或者检查后提示
-        if INSTALL_DIR.exists() and CONFIG_FILE.exists() and SB_PID_FILE.exists() and ARGO_PID_FILE.exists():
+        if is_installed():
             print("\033[33m检测到ArgoSB可能已安装并正在运行。\033[0m")
             if check_status():
                  print("\033[32m如需重新安装，请先执行卸载: python3 " + os.path.basename(__file__) + " del\033[0m")
@@ -787,7 +1014,7 @@ if __name__ == "__main__":
     script_name = os.path.basename(__file__)
     if len(sys.argv) == 1: # 如果只运行脚本名，没有其他参数
         # 检查是否已安装，如果已安装且在运行，显示status，否则进行安装
-        if INSTALL_DIR.exists() and CONFIG_FILE.exists() and SB_PID_FILE.exists() and ARGO_PID_FILE.exists():
+        if is_installed():
             print(f"\033[33m检测到 ArgoSB 可能已安装。显示当前状态。\033[0m")
             print(f"\033[33m如需重新安装，请运行: python3 {script_name} install\033[0m")
             print(f"\033[33m如需卸载，请运行: python3 {script_name} del\033[0m")
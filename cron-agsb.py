@@ -25,14 +25,16 @@ except ImportError:
     sys.exit(1)
 
 # 全局变量
-INSTALL_DIR = Path.home() / ".agsb"  # 用户主目录下的隐藏文件夹，避免root权限
-CONFIG_FILE = INSTALL_DIR / "config.json"
+# --instance NAME 选择实例 (默认 ~/.agsb)，必须在计算路径常量之前从 sys.argv 中取出
+INSTANCE = shared_utils.pop_instance_arg(sys.argv)
+INSTALL_DIR = shared_utils.argosb_instance_dir(INSTANCE)  # 用户主目录下的隐藏文件夹，避免root权限
+CONFIG_FILE = INSTALL_DIR / "config.json" # 旧版配置文件，仅在首次打开状态库时导入
 SB_PID_FILE = INSTALL_DIR / "sbpid.log"
 ARGO_PID_FILE = INSTALL_DIR / "sbargopid.log"
 LIST_FILE = INSTALL_DIR / "list.txt"
 LOG_FILE = INSTALL_DIR / "argo.log"
 DEBUG_LOG = INSTALL_DIR / "python_debug.log"
-UPLOAD_API = "https://file.zmkk.fun/api/upload"  # 文件上传API
+UPLOAD_API = os.environ.get("UPLOAD_API") or shared_utils.UPLOAD_API  # 文件上传API (可用环境变量指向本地替身服务器)
 NGINX_SNIPPET_FILE = INSTALL_DIR / "nginx_agsb_snippet.conf" # 用于存放生成的Nginx配置片段
 
 # 从共享库中直接赋值函数，保持脚本其余部分代码不变
@@ -42,97 +44,66 @@ download_file = shared_utils.download_file
 download_binary = shared_utils.download_binary
 generate_vmess_link = shared_utils.generate_vmess_link
 get_system_arch = shared_utils.get_system_arch
+ARGOSB_INSTALL = shared_utils.argosb_install_name(INSTANCE)
+
+_state_store = None
+
+def get_state_store():
+    """打开当前实例目录下的 state.db (首次打开时自动导入旧的 JSON/TXT 状态文件)"""
+    global _state_store
+    if _state_store is None:
+        _state_store = shared_utils.open_argosb_state(INSTALL_DIR)
+    return _state_store
+
+def get_perf_options():
+    """sing-box 性能参数：环境变量覆盖安装时保存的值"""
+    saved = get_state_store().get_install(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else None
+    return shared_utils.load_singbox_perf_options(saved=(saved or {}).get("perf"))
+
+def get_protocols():
+    """入站协议列表 (环境变量 protocols 覆盖安装时保存的值)"""
+    saved = get_state_store().get_install(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else None
+    return shared_utils.load_protocols(saved=list((saved or {}).get("protocols") or []))
+
+def get_protocol_ports(port_vm_ws):
+    """{协议名: 回环端口}，旧安装只有 vmess-ws"""
+    config = get_state_store().get_install(ARGOSB_INSTALL) or {}
+    return config.get("protocols") or {"vmess-ws": port_vm_ws}
+
+def uses_path_routing():
+    """Nginx 协同模式下按路径分流，所有协议都可经隧道访问"""
+    return check_nginx_installed()
 
 # 上传订阅到API服务器
-def upload_to_api(subscription_content):
+def upload_to_api(subscription_content, force=False):
     """
     将订阅内容上传到API服务器
+    内容与上次成功上传一致时跳过；失败的上传进入重试队列，下次运行时补传
     :param subscription_content: 订阅内容
-    :return: 成功返回True，失败返回False
+    :param force: 内容未变化时也重新上传
+    :return: 上传成功或内容未变化返回True，失败返回False
     """
-    try:
-        # 确保requests库已导入
-        if 'requests' not in sys.modules:
-            print("\033[36m│ \033[31m未能导入requests库，跳过上传\033[0m")
-            return False
-            
-        write_debug_log("开始上传订阅内容到API服务器")
-        
-        # 生成当前时间作为文件名（精确到秒）
-        current_time = datetime.now().strftime('%Y%m%d%H%M%S')
-        temp_file = INSTALL_DIR / f"{current_time}.txt"
-        
-        # 将订阅内容写入临时文件
-        try:
-            with open(str(temp_file), 'w') as f:
-                f.write(subscription_content)
-        except Exception as e:
-            write_debug_log(f"创建临时文件失败: {e}")
-            print(f"\033[36m│ \033[31m创建临时文件失败: {e}\033[0m")
-            return False
-            
-        # 构建multipart表单数据
-        try:
-            files = {
-                'file': (f"{current_time}.txt", open(str(temp_file), 'rb'))
-            }
-            
-            # 发送请求
-            write_debug_log(f"正在上传文件到API: {UPLOAD_API}")
-            response = requests.post(UPLOAD_API, files=files)
-            
-            # 关闭文件
-            files['file'][1].close()
-            
-            # 删除临时文件
-            if os.path.exists(str(temp_file)):
-                os.remove(str(temp_file))
-            
-            # 检查响应
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if result.get('success') or result.get('url'):
-                        url = result.get('url', '')
-                        write_debug_log(f"上传成功，URL: {url}")
-                        print(f"\033[36m│ \033[32m订阅已成功上传，URL: {url}\033[0m")
-                        
-                        # 保存URL到文件
-                        url_file = INSTALL_DIR / "subscription_url.txt"
-                        with open(str(url_file), 'w') as f:
-                            f.write(url)
-                            
-                        return True
-                    else:
-                        write_debug_log(f"API返回错误: {result}")
-                        print(f"\033[36m│ \033[31mAPI返回错误: {result}\033[0m")
-                        return False
-                except Exception as e:
-                    write_debug_log(f"解析API响应失败: {e}")
-                    print(f"\033[36m│ \033[31m解析API响应失败: {e}\033[0m")
-                    return False
-            else:
-                write_debug_log(f"上传失败，状态码: {response.status_code}")
-                print(f"\033[36m│ \033[31m上传失败，状态码: {response.status_code}\033[0m")
-                return False
-                
-        except Exception as e:
-            write_debug_log(f"上传过程中出错: {e}")
-            print(f"\033[36m│ \033[31m上传过程中出错: {e}\033[0m")
-            
-            # 清理临时文件
-            if os.path.exists(str(temp_file)):
-                try:
-                    os.remove(str(temp_file))
-                except:
-                    pass
-                    
-            return False
-            
-    except Exception as e:
-        write_debug_log(f"上传订阅到API服务器失败: {e}")
-        print(f"\033[36m│ \033[31m上传订阅到API服务器失败: {e}\033[0m")
-        return False
+    write_debug_log("开始上传订阅内容到API服务器")
+    store = get_state_store()
+    # 文件名沿用上传时间 (精确到秒)，变化检测按固定的 key 进行
+    file_name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}.txt"
+    result = shared_utils.upload_content(subscription_content, file_name, INSTALL_DIR / shared_utils.UPLOAD_QUEUE_DIR,
+                                         store=store, api=UPLOAD_API, force=force, key="subscription")
+    for retried in result["retried"]:
+        if retried["status"] == "uploaded":
+            print(f"\033[36m│ \033[32m已补传上次失败的上传: {retried['file_name']}\033[0m")
+    if result["status"] == "uploaded":
+        write_debug_log(f"上传成功，URL: {result['url']}")
+        print(f"\033[36m│ \033[32m订阅已成功上传，URL: {result['url']}\033[0m")
+        store.set_setting("subscription_url", result["url"])
+        return True
+    if result["status"] == "unchanged":
+        write_debug_log("订阅内容未变化，跳过上传")
+        print(f"\033[36m│ \033[32m订阅内容未变化，跳过上传，URL: {store.get_setting('subscription_url') or '(未知)'}\033[0m")
+        return True
+    write_debug_log(f"上传失败，已加入重试队列: {result['error']}")
+    print(f"\033[36m│ \033[31m上传失败，已加入重试队列，下次运行时补传: {result['error']}\033[0m")
+    return False
 
 # 测试API连接
 def test_api_connection():
@@ -141,20 +112,16 @@ def test_api_connection():
     :return: 连接正常返回True，异常返回False
     """
     try:
-        if 'requests' not in sys.modules:
-            print("\033[31m未安装requests库，请先安装: pip install requests\033[0m")
-            return False
-            
         print("正在测试API服务器连接...")
         
-        # 尝试访问API服务器
-        response = requests.get(UPLOAD_API.rsplit('/', 1)[0])  # 获取API基础URL
+        # 复用上传器的连接池访问API基础URL
+        status_code = shared_utils.get_uploader(UPLOAD_API).check()
         
-        if response.status_code == 200:
-            print(f"\033[32mAPI服务器连接正常，状态码: {response.status_code}\033[0m")
+        if status_code == 200:
+            print(f"\033[32mAPI服务器连接正常，状态码: {status_code}\033[0m")
             return True
         else:
-            print(f"\033[31mAPI服务器连接异常，状态码: {response.status_code}\033[0m")
+            print(f"\033[31mAPI服务器连接异常，状态码: {status_code}\033[0m")
             return False
     except Exception as e:
         print(f"\033[31m测试API服务器连接出错: {e}\033[0m")
@@ -181,6 +148,18 @@ def print_usage():
     print("  \033[36mpython3 agsb.py cat\033[0m          - 查看单行节点列表")
     print("  \033[36mpython3 agsb.py update\033[0m       - 更新脚本")
     print("  \033[36mpython3 agsb.py del\033[0m          - 卸载服务")
+    print("  \033[36mpython3 agsb.py bench\033[0m        - 测试多路复用对新建连接延迟的影响")
+    print("  \033[36mpython3 agsb.py user add NAME [UUID]\033[0m - 添加用户 (del NAME 删除，list 列出)，sing-box 热重载")
+    print("  \033[36mpython3 agsb.py optimize\033[0m     - 扫描 Cloudflare 优选 IP 并重新生成节点 (--help 查看参数)")
+    print("  \033[36mpython3 agsb.py tune\033[0m         - 测速选择 cloudflared 协议/IP 版本并重新生成启动脚本 (--help 查看参数)")
+    print("  \033[36mpython3 agsb.py status --all\033[0m - 一次检查所有实例")
+    print("  \033[36mpython3 agsb.py upload\033[0m       - 上传订阅 (内容未变化时跳过，--force 强制，--selftest 用本地替身自检)")
+    print("  \033[36mpython3 agsb.py <命令> --instance NAME\033[0m - 在独立实例 ~/.agsb-NAME 中执行命令 (也可 export instance=NAME)")
+    print("  \033[36mpython3 agsb.py bench-proto\033[0m  - 测试各协议的吞吐与 CPU 开销")
+    print("\033[33m入站协议 (环境变量):\033[0m protocols=vmess-ws,vless-ws,vless-httpupgrade,vless-grpc,trojan-ws,trojan-httpupgrade")
+    print("  首个为主协议；独立模式只有主协议可用，其余协议需要 Nginx 按路径分流")
+    print("\033[33m性能参数 (环境变量):\033[0m mux=smux|yamux|h2mux|off mux_padding=1 brutal_up/brutal_down=Mbps")
+    print("  ed=早期数据大小(默认2048) keepalive=30s keepalive_interval=15s tcpbuf=1")
     print("  \033[36mpython3 agsb.py testapi\033[0m      - 测试API服务器连接")
     print()
 
@@ -202,7 +181,8 @@ def generate_links(domain, port_vm_ws, uuid_str):
     
     # VMess WebSocket 配置
     ws_path = f"/{uuid_str}-vm"  # WebSocket路径和前面保持一致
-    ws_path_full = f"{ws_path}?ed=2048" # 添加额外参数
+    perf = get_perf_options()
+    ws_path_full = shared_utils.ws_path_with_early_data(ws_path, perf) # 早期数据大小与服务端一致
     write_debug_log(f"WebSocket路径: {ws_path_full}")
     
     hostname = socket.gethostname()
@@ -210,162 +190,60 @@ def generate_links(domain, port_vm_ws, uuid_str):
     link_names = []  # 存储链接名称
     link_configs = []  # 存储节点配置信息
     
-    # === TLS节点 ===
-    # 443端口 - 104.16.0.0
-    config1 = {
-        "ps": f"vmess-ws-tls-argo-{hostname}-443",
-        "add": "104.16.0.0",
-        "port": "443",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": "tls",
-        "sni": domain
-    }
-    vmatls_link1 = generate_vmess_link(config1)
-    all_links.append(vmatls_link1)
-    link_names.append("TLS-443-104.16.0.0")
-    link_configs.append(config1)
-    
-    # 8443端口 - 104.17.0.0
-    config2 = {
-        "ps": f"vmess-ws-tls-argo-{hostname}-8443",
-        "add": "104.17.0.0",
-        "port": "8443",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": "tls",
-        "sni": domain
-    }
-    vmatls_link2 = generate_vmess_link(config2)
-    all_links.append(vmatls_link2)
-    link_names.append("TLS-8443-104.17.0.0")
-    link_configs.append(config2)
-    
-    # 2053端口 - 104.18.0.0
-    config3 = {
-        "ps": f"vmess-ws-tls-argo-{hostname}-2053",
-        "add": "104.18.0.0",
-        "port": "2053",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": "tls",
-        "sni": domain
-    }
-    vmatls_link3 = generate_vmess_link(config3)
-    all_links.append(vmatls_link3)
-    link_names.append("TLS-2053-104.18.0.0")
-    link_configs.append(config3)
-    
-    # 2083端口 - 104.19.0.0
-    config4 = {
-        "ps": f"vmess-ws-tls-argo-{hostname}-2083",
-        "add": "104.19.0.0",
-        "port": "2083",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": "tls",
-        "sni": domain
-    }
-    vmatls_link4 = generate_vmess_link(config4)
-    all_links.append(vmatls_link4)
-    link_names.append("TLS-2083-104.19.0.0")
-    link_configs.append(config4)
+    # 节点地址优先使用 optimize 扫描出的优选 IP，未扫描或已过期时使用默认地址
+    tls_endpoints, http_endpoints, optimized = shared_utils.get_edge_endpoints(get_state_store())
     
-    # 2087端口 - 104.20.0.0
-    config5 = {
-        "ps": f"vmess-ws-tls-argo-{hostname}-2087",
-        "add": "104.20.0.0",
-        "port": "2087",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": "tls",
-        "sni": domain
-    }
-    vmatls_link5 = generate_vmess_link(config5)
-    all_links.append(vmatls_link5)
-    link_names.append("TLS-2087-104.20.0.0")
-    link_configs.append(config5)
+    # === TLS节点 ===
+    for ip, port_cf in tls_endpoints:
+        tag = f"{ip}-{port_cf}" if optimized else port_cf
+        config = {
+            "ps": f"vmess-ws-tls-argo-{hostname}-{tag}",
+            "add": ip,
+            "port": port_cf,
+            "id": uuid_str,
+            "aid": "0",
+            "net": "ws",
+            "type": "none",
+            "host": domain,
+            "path": ws_path_full,
+            "tls": "tls",
+            "sni": domain
+        }
+        all_links.append(generate_vmess_link(config))
+        link_names.append(f"TLS-{port_cf}-{ip}")
+        link_configs.append(config)
     
     # === 非TLS节点 ===
-    # 80端口 - 104.21.0.0
-    config6 = {
-        "ps": f"vmess-ws-argo-{hostname}-80",
-        "add": "104.21.0.0",
-        "port": "80",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": ""
-    }
-    vma_link7 = generate_vmess_link(config6)
-    all_links.append(vma_link7)
-    link_names.append("WS-80-104.21.0.0")
-    link_configs.append(config6)
-    
-    # 8085端口 - 104.22.0.0
-    config7 = {
-        "ps": f"vmess-ws-argo-{hostname}-8085",
-        "add": "104.22.0.0",
-        "port": "8085",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": ""
-    }
-    vma_link8 = generate_vmess_link(config7)
-    all_links.append(vma_link8)
-    link_names.append("WS-8085-104.22.0.0")
-    link_configs.append(config7)
-    
-    # 8880端口 - 104.24.0.0
-    config8 = {
-        "ps": f"vmess-ws-argo-{hostname}-8880",
-        "add": "104.24.0.0",
-        "port": "8880",
-        "id": uuid_str,
-        "aid": "0",
-        "net": "ws",
-        "type": "none",
-        "host": domain,
-        "path": ws_path_full,
-        "tls": ""
-    }
-    vma_link9 = generate_vmess_link(config8)
-    all_links.append(vma_link9)
-    link_names.append("WS-8880-104.24.0.0")
-    link_configs.append(config8)
+    for ip, port_cf in http_endpoints:
+        tag = f"{ip}-{port_cf}" if optimized else port_cf
+        config = {
+            "ps": f"vmess-ws-argo-{hostname}-{tag}",
+            "add": ip,
+            "port": port_cf,
+            "id": uuid_str,
+            "aid": "0",
+            "net": "ws",
+            "type": "none",
+            "host": domain,
+            "path": ws_path_full,
+            "tls": ""
+        }
+        all_links.append(generate_vmess_link(config))
+        link_names.append(f"WS-{port_cf}-{ip}")
+        link_configs.append(config)
     
-    # 保存所有链接到临时文件
-    jh_file = INSTALL_DIR / "jh.txt"
-    with open(str(jh_file), 'w') as f:
-        for link in all_links:
-            f.write(f"{link}\n")
+    # 其余协议复用同一组优选地址；独立模式下只有主协议经隧道可达
+    served = shared_utils.served_protocols(list(get_protocol_ports(port_vm_ws)), uses_path_routing())
+    vmess_configs = link_configs
+    if "vmess-ws" not in served:
+        all_links, link_names, link_configs = [], [], []
+    for name, link, config in shared_utils.extra_protocol_links(vmess_configs, served, f"/{uuid_str}", perf):
+        all_links.append(link)
+        link_names.append(name)
+        link_configs.append(config)
+
+    # 节点写入状态库，allnodes.txt 仅作为纯链接导出
+    get_state_store().set_nodes(ARGOSB_INSTALL, list(zip(link_names, all_links)))
     
     # 生成一个所有节点的纯文本文件，一行一个节点，没有任何分割
     all_nodes_file = INSTALL_DIR / "allnodes.txt"
@@ -373,6 +251,13 @@ def generate_links(domain, port_vm_ws, uuid_str):
         for link in all_links:
             f.write(f"{link}\n")
     
+    # vmess:// 链接无法携带多路复用参数，另行导出匹配的客户端配置
+    shared_utils.write_client_mux_exports(INSTALL_DIR, link_configs, perf)
+    # 节点模板用于 user 命令为附加用户生成各自的节点与订阅
+    store = get_state_store()
+    store.update_install(ARGOSB_INSTALL, link_templates=link_configs)
+    shared_utils.export_user_links(store, ARGOSB_INSTALL, INSTALL_DIR, link_configs)
+    
     # 创建一个合并的订阅内容
     all_content = "\n".join(all_links)
     all_links_b64 = base64.b64encode(all_content.encode()).decode()
@@ -429,7 +314,7 @@ def generate_links(domain, port_vm_ws, uuid_str):
         f.write(f"{all_links_b64}\n\n")
         
         f.write("---------------------------------------------------------\n")
-        f.write("单行节点文件路径: ~/.agsb/allnodes.txt\n")
+        f.write(f"单行节点文件路径: {INSTALL_DIR / 'allnodes.txt'}\n")
         f.write("使用方法:\n")
         f.write("查看节点信息: python3 agsb.py status\n")
         f.write("查看所有节点(一行一个): python3 agsb.py cat\n")
@@ -459,8 +344,8 @@ def generate_links(domain, port_vm_ws, uuid_str):
         f.write("```\n\n")
         
         f.write("## 单行格式节点文件\n\n")
-        f.write("如果您需要每行一个节点的格式，可以查看文件: `~/.agsb/allnodes.txt`\n\n")
-        f.write("```bash\ncat ~/.agsb/allnodes.txt\n```\n\n")
+        f.write(f"如果您需要每行一个节点的格式，可以查看文件: `{INSTALL_DIR / 'allnodes.txt'}`\n\n")
+        f.write(f"```bash\ncat {INSTALL_DIR / 'allnodes.txt'}\n```\n\n")
         
         f.write("## 使用方法\n\n")
         f.write("- 查看节点信息: `python3 agsb.py status`\n")
@@ -494,7 +379,7 @@ def generate_links(domain, port_vm_ws, uuid_str):
     print(f"\033[36m│ \033[32mVMess端口: \033[0m{port_vm_ws}")
     print(f"\033[36m│ \033[32mWebSocket路径: \033[0m{ws_path_full}")
     print("\033[36m├───────────────────────────────────────────────────────────────┤\033[0m")
-    print("\033[36m│ \033[33m所有节点列表 (一行一个版本保存在: ~/.agsb/allnodes.txt):\033[0m")
+    print(f"\033[36m│ \033[33m所有节点列表 (一行一个版本保存在: {INSTALL_DIR / 'allnodes.txt'}):\033[0m")
     
     # 直接连续打印所有节点，中间没有分隔
     for link in all_links:
@@ -552,6 +437,8 @@ def install():
     
     # 下载 sing-box
     singbox_path = str(INSTALL_DIR / "sing-box")
+    # 多实例共用缓存目录中的二进制，命中时不再下载
+    shared_utils.link_cached_binary("sing-box", singbox_path)
     if not os.path.exists(singbox_path):
         sbname = f"sing-box-{sbcore}-linux-{arch}"
         singbox_url = f"https://github.com/SagerNet/sing-box/releases/download/v{sbcore}/{sbname}.tar.gz"
@@ -597,6 +484,8 @@ def install():
     
     # 下载 cloudflared
     cloudflared_path = str(INSTALL_DIR / "cloudflared")
+    # 多实例共用缓存目录中的二进制，命中时不再下载
+    shared_utils.link_cached_binary("cloudflared", cloudflared_path)
     if not os.path.exists(cloudflared_path):
         cloudflared_url = f"https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-{arch}"
         
@@ -612,25 +501,40 @@ def install():
                 print("cloudflared 备用下载也失败，退出安装")
                 sys.exit(1)
     
+    shared_utils.cache_binary("sing-box", singbox_path)
+    shared_utils.cache_binary("cloudflared", cloudflared_path)
+
     # 生成配置
     uuid_str = str(uuid.uuid4())
-    port_vm_ws = random.randint(10000, 65535)  # 随机生成端口
+    protocols = get_protocols()
+    # 跳过已绑定端口、DNAT 跳跃范围和其他安装的预留，并把结果预留到状态库
+    port_vm_ws = shared_utils.allocate_port(get_state_store(), ARGOSB_INSTALL, protocols[0])
+    
+    perf = get_perf_options()
     
     # 创建配置文件
     config_data = {
         "uuid_str": uuid_str,
         "port_vm_ws": port_vm_ws,
+        "perf": perf,
         "install_date": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    with open(str(CONFIG_FILE), 'w') as f:
-        json.dump(config_data, f, indent=2)
+    store = get_state_store()
+    store.put_install_with_ports(ARGOSB_INSTALL, config_data, [(port_vm_ws, protocols[0], 'tcp')])
+    # 主协议使用上面的端口，其余协议各分配一个回环端口
+    protocol_ports = shared_utils.allocate_protocol_ports(store, ARGOSB_INSTALL, protocols, port_vm_ws)
+    store.update_install(ARGOSB_INSTALL, protocols=protocol_ports)
+    print(f"✅ 入站协议: {', '.join(f'{name}:{port}' for name, port in protocol_ports.items())}")
     
-    write_debug_log(f"生成配置文件: {CONFIG_FILE}")
+    write_debug_log(f"安装配置已写入状态库: {store.path}")
     write_debug_log(f"UUID: {uuid_str}, 端口: {port_vm_ws}")
     
     # 创建 sing-box 配置
-    create_sing_box_config(port_vm_ws, uuid_str)
+    create_sing_box_config(port_vm_ws, uuid_str, perf)
+    shared_utils.apply_tcp_buffer_sysctls(perf)
+    # 首次安装时测速选择 cloudflared 协议与 IP 版本，之后沿用保存的结果
+    shared_utils.tune_cloudflared(store, ARGOSB_INSTALL, force=False)
     
     # 创建启动脚本
     create_startup_script(port_vm_ws, uuid_str)
@@ -659,7 +563,7 @@ def setup_autostart():
         # 过滤掉已有的相关crontab条目
         filtered_lines = []
         for line in lines:
-            if ".agsb/start_sb.sh" not in line and ".agsb/start_cf.sh" not in line:
+            if str(INSTALL_DIR / "start_sb.sh") not in line and str(INSTALL_DIR / "start_cf.sh") not in line:
                 filtered_lines.append(line)
         
         # 添加新的开机自启动条目
@@ -703,17 +607,10 @@ def uninstall():
         # 等待1秒让进程有机会终止
         time.sleep(1)
         
-        # 如果进程还在运行，尝试强制终止
-        sing_box_running = subprocess.run("pgrep -f 'sing-box'", shell=True, stdout=subprocess.PIPE).returncode == 0
-        cloudflared_running = subprocess.run("pgrep -f 'cloudflared'", shell=True, stdout=subprocess.PIPE).returncode == 0
-            
-        if sing_box_running:
-            print("尝试强制终止sing-box进程...")
-            os.system("pkill -9 -f 'sing-box' 2>/dev/null || true")
-        
-        if cloudflared_running:
-            print("尝试强制终止cloudflared进程...")
-            os.system("pkill -9 -f 'cloudflared' 2>/dev/null || true")
+        # 如果进程还在运行，强制终止本实例目录下的 sing-box/cloudflared (不影响其他实例)
+        leftover = shared_utils.kill_instance_processes(INSTALL_DIR)
+        if leftover:
+            print("已强制终止残留进程: {}".format(leftover))
     except Exception as e:
         print("停止服务时出错: {}，但将继续卸载...".format(e))
     
@@ -723,7 +620,7 @@ def uninstall():
         lines = crontab_list.split('\n')
         filtered_lines = []
         for line in lines:
-            if ".agsb/start_sb.sh" not in line and ".agsb/start_cf.sh" not in line:
+            if str(INSTALL_DIR / "start_sb.sh") not in line and str(INSTALL_DIR / "start_cf.sh") not in line:
                 filtered_lines.append(line)
         
         new_crontab = '\n'.join(filtered_lines).strip() + '\n'
@@ -781,8 +678,11 @@ def upgrade():
 def check_status():
     try:
         # 检查进程是否存在
-        sing_box_running = subprocess.run("pgrep -f 'sing-box'", shell=True, stdout=subprocess.PIPE).returncode == 0
-        cloudflared_running = subprocess.run("pgrep -f 'cloudflared'", shell=True, stdout=subprocess.PIPE).returncode == 0
+        # 按当前实例的 PID 文件判断，其他实例的进程不算在内；未安装时不创建状态库
+        store = get_state_store() if shared_utils.argosb_state_exists(INSTALL_DIR) else None
+        pids = shared_utils.instance_service_pids(INSTALL_DIR, store)
+        sing_box_running = pids["sing-box"] is not None
+        cloudflared_running = pids["cloudflared"] is not None
         
         if sing_box_running and cloudflared_running and os.path.exists(str(LIST_FILE)):
             print("\033[36m╭───────────────────────────────────────────────────────────────╮\033[0m")
@@ -835,14 +735,12 @@ def check_status():
                         print(f"\033[36m│ \033[0m{line}")
             
             # 直接打印所有节点的链接，不添加前缀
-            all_nodes_file = INSTALL_DIR / "allnodes.txt"
-            if os.path.exists(str(all_nodes_file)):
+            all_links = get_state_store().get_links(ARGOSB_INSTALL)
+            if all_links:
                 print("\033[36m│ \033[0m")
                 print("\033[36m│ \033[33m直接格式节点链接:\033[0m")
-                with open(str(all_nodes_file), 'r') as f:
-                    all_links = f.read().splitlines()
-                    for link in all_links:
-                        print(link)
+                for link in all_links:
+                    print(link)
             
             print("\033[36m╰───────────────────────────────────────────────────────────────╯\033[0m")
             
@@ -872,54 +770,23 @@ def check_status():
         return False
 
 # 创建sing-box配置
-def create_sing_box_config(port_vm_ws, uuid_str):
+def create_sing_box_config(port_vm_ws, uuid_str, perf=None):
     write_debug_log(f"创建sing-box配置，端口: {port_vm_ws}, UUID: {uuid_str}")
     
-    ws_path = f"/{uuid_str}-vm"  # WebSocket路径
-    write_debug_log(f"WebSocket路径: {ws_path}")
+    path_prefix = f"/{uuid_str}"  # 各协议路径为 前缀-后缀，vmess 仍为 /{uuid}-vm
+    write_debug_log(f"路径前缀: {path_prefix}")
     
-    # 创建配置字符串 - 保持与原始shell脚本一致的格式
-    config_str = '''{
-  "log": {
-    "level": "info",
-    "timestamp": true
-  },
-  "inbounds": [
-    {
-      "type": "vmess",
-      "tag": "vmess-in",
-      "listen": "127.0.0.1",
-      "listen_port": %d,
-      "tcp_fast_open": true,
-      "sniff": true,
-      "sniff_override_destination": true,
-      "proxy_protocol": false,
-      "users": [
-        {
-          "uuid": "%s",
-          "alterId": 0
-        }
-      ],
-      "transport": {
-        "type": "ws",
-        "path": "%s",
-        "max_early_data": 2048,
-        "early_data_header_name": "Sec-WebSocket-Protocol"
-      }
-    }
-  ],
-  "outbounds": [
-    {
-      "type": "direct",
-      "tag": "direct"
-    }
-  ]
-}''' % (port_vm_ws, uuid_str, ws_path)
+    # 多路复用、早期数据与 TCP 参数由 shared_utils 统一生成
+    perf = perf or get_perf_options()
+    # 所有用户共用同一组入站，用户数只影响 users 数组长度
+    users = shared_utils.get_singbox_users(get_state_store(), ARGOSB_INSTALL, uuid_str)
+    config = shared_utils.build_singbox_server_config(get_protocol_ports(port_vm_ws), users, path_prefix, perf)
+    write_debug_log(f"sing-box性能参数: {perf}")
     
     # 写入配置文件
     sb_config_file = INSTALL_DIR / "sb.json"
     with open(str(sb_config_file), 'w') as f:
-        f.write(config_str)
+        json.dump(config, f, indent=2)
     
     write_debug_log(f"sing-box配置已写入文件: {sb_config_file}")
     
@@ -939,7 +806,12 @@ cd {INSTALL_DIR}
     nginx_installed = check_nginx_installed()
     # 和 sing-box 配置中的路径保持一致
     ws_path = f"/{uuid_str}-vm"    
-    # 创建cloudflared启动脚本
+    path_prefix = f"/{uuid_str}"
+    protocol_ports = get_protocol_ports(port_vm_ws)
+    # gRPC 需要 cloudflared 以 HTTP/2 连接源站
+    origin_flags = shared_utils.cloudflared_origin_flags(shared_utils.served_protocols(list(protocol_ports), uses_path_routing()))
+    # 创建cloudflared启动脚本，协议/IP 版本/连接数取自 tune 保存的 profile
+    cf_flags = shared_utils.cloudflared_tunnel_flags(shared_utils.load_cloudflared_profile(get_state_store()))
     cf_start_script = INSTALL_DIR / "start_cf.sh"
     if nginx_installed:
         print("🤝 将以【Nginx协同模式】运行。Cloudflared将指向Nginx。")
@@ -952,16 +824,7 @@ cd {INSTALL_DIR}
 # 请将此片段 'include' 到您的 nginx.conf 的 http 块中
 # 例如: include {os.path.abspath(NGINX_SNIPPET_FILE)};
 
-location = {ws_path} {{
-    proxy_pass http://127.0.0.1:{port_vm_ws};
-    proxy_http_version 1.1;
-    proxy_set_header Upgrade $http_upgrade;
-    proxy_set_header Connection "upgrade";
-    proxy_set_header Host $host;
-    proxy_set_header X-Real-IP $remote_addr;
-    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-}}
-"""
+{shared_utils.render_nginx_locations(protocol_ports, path_prefix)}"""
         with open(NGINX_SNIPPET_FILE, "w") as f:
             f.write(nginx_snippet)
         print(f"✅ 已生成Nginx配置片段: {NGINX_SNIPPET_FILE}")
@@ -970,13 +833,13 @@ location = {ws_path} {{
         # 模式二：没有Nginx，cloudflared直接指向sing-box
         print("🚀 将以【独立模式】运行。Cloudflared将直连sing-box。")
         # cloudflared直连时需要完整的URL路径
-        ws_path_full = f"{ws_path}?ed=2048"
+        ws_path_full = shared_utils.ws_path_with_early_data(ws_path, get_perf_options())
         cloudflared_url = f"http://localhost:{port_vm_ws}{ws_path_full}"
     with open(str(cf_start_script), 'w') as f:
         # 使用灵活的--url参数
         f.write(f'''#!/bin/bash
 cd {INSTALL_DIR}
-./cloudflared tunnel --url {cloudflared_url} --edge-ip-version auto --no-autoupdate --protocol http2 > argo.log 2>&1 & echo $! > sbargopid.log
+./cloudflared tunnel --url {cloudflared_url} --no-autoupdate {cf_flags}{origin_flags} > argo.log 2>&1 & echo $! > sbargopid.log
 ''')
     os.chmod(str(cf_start_script), 0o755)
     
@@ -995,6 +858,11 @@ def start_services():
     print("等待服务启动...")
     time.sleep(3)  # 等待服务完全启动
     
+    # 启动脚本写下的 PID 同步到状态库
+    store = get_state_store()
+    for service_name, pid_file in [("sing-box", SB_PID_FILE), ("cloudflared", ARGO_PID_FILE)]:
+        shared_utils.sync_service_pid(store, service_name, pid_file)
+    
     write_debug_log("服务已启动")
 
 # 获取tunnel域名
@@ -1023,6 +891,99 @@ def get_tunnel_domain():
     
     return None
 
+# Cloudflare 优选 IP
+def run_optimize(argv):
+    opts = shared_utils.parse_edge_scan_args(argv, prog=f"{os.path.basename(__file__)} optimize")
+    if opts.selftest:
+        sys.exit(0 if shared_utils.selftest_edge_scanner() else 1)
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装\033[0m")
+        sys.exit(1)
+    domain = get_tunnel_domain()
+    if not shared_utils.optimize_edges(store, opts, sni=domain):
+        sys.exit(1)
+    if domain:
+        print("🔄 使用优选 IP 重新生成节点...")
+        generate_links(domain, config["port_vm_ws"], config["uuid_str"])
+    else:
+        print("⚠️ 无法获取隧道域名，优选结果将在下次生成节点时生效")
+
+# 重新上传订阅
+def run_upload(argv):
+    if "--selftest" in argv:
+        sys.exit(0 if shared_utils.selftest_uploader() else 1)
+    links = get_state_store().get_links(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else []
+    if not links:
+        print("\033[31m状态库中没有节点信息，请先安装或运行status命令\033[0m")
+        sys.exit(1)
+    content = base64.b64encode("\n".join(links).encode()).decode()
+    sys.exit(0 if upload_to_api(content, force="--force" in argv) else 1)
+
+# cloudflared 传输测速
+def run_tune_tunnel(argv):
+    opts = shared_utils.parse_cloudflared_tune_args(argv, prog=f"{os.path.basename(__file__)} tune")
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装\033[0m")
+        sys.exit(1)
+    shared_utils.tune_cloudflared(store, ARGOSB_INSTALL, opts)
+    create_startup_script(config["port_vm_ws"], config["uuid_str"])
+    print("✅ 已按新参数重新生成 start_cf.sh，重启 cloudflared 后生效")
+    print("⚠️ 临时隧道重启后域名会变化，重启后请运行 status 重新生成节点")
+
+# 多用户管理
+def manage_users(params):
+    store = get_state_store()
+    config = store.get_install(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else None
+    if not config:
+        print("\033[31m未检测到安装，请先安装\033[0m")
+        sys.exit(1)
+    if not shared_utils.user_command(store, ARGOSB_INSTALL, params):
+        return
+    # 重新生成 sing-box 配置与各用户节点，再通知 sing-box 热重载
+    create_sing_box_config(config["port_vm_ws"], config["uuid_str"])
+    exported = shared_utils.export_user_links(store, ARGOSB_INSTALL, INSTALL_DIR, config.get("link_templates") or [])
+    if not config.get("link_templates"):
+        print("⚠️ 尚未生成节点模板，请先运行 status 或重新安装后再导出用户节点")
+    else:
+        print(f"📄 已更新 {exported} 个用户的节点文件: {INSTALL_DIR / 'users'}/<用户名>/allnodes.txt, sub.txt")
+    shared_utils.reload_singbox(INSTALL_DIR / "sing-box", INSTALL_DIR / "sb.json", SB_PID_FILE)
+
+# 多路复用基准测试
+def run_mux_benchmark(rounds=50):
+    singbox_path = INSTALL_DIR / "sing-box"
+    if not singbox_path.exists():
+        print("\033[31m未找到 sing-box，请先安装\033[0m")
+        sys.exit(1)
+    perf = get_perf_options()
+    if perf["mux"] == "off":
+        perf["mux"] = "smux"  # 基准测试总是对比开启多路复用的情况
+    print(f"⏱️ 正在测试新建连接延迟 ({rounds} 次/模式)...")
+    try:
+        results = shared_utils.benchmark_singbox_mux(singbox_path, INSTALL_DIR / "bench", perf, rounds)
+    except Exception as e:
+        print(f"\033[31m基准测试失败: {e}\033[0m")
+        sys.exit(1)
+    shared_utils.print_mux_benchmark(results)
+
+# 协议吞吐与 CPU 开销基准测试
+def run_protocol_benchmark(size_mb=64):
+    singbox_path = INSTALL_DIR / "sing-box"
+    if not singbox_path.exists():
+        print("\033[31m未找到 sing-box，请先安装\033[0m")
+        sys.exit(1)
+    protocols = shared_utils.parse_protocol_list(os.environ["protocols"]) if os.environ.get("protocols") else list(shared_utils.ARGOSB_PROTOCOLS)
+    print(f"📊 正在测试 {len(protocols)} 个协议的吞吐与 CPU 开销 ({size_mb}MB/协议)...")
+    try:
+        results = shared_utils.benchmark_singbox_throughput(singbox_path, INSTALL_DIR / "bench", protocols, get_perf_options(), size_mb)
+    except Exception as e:
+        print(f"\033[31m基准测试失败: {e}\033[0m")
+        sys.exit(1)
+    shared_utils.print_throughput_benchmark(results, size_mb)
+
 # 主函数
 def main():
     print_info()
@@ -1040,19 +1001,36 @@ def main():
             upgrade()
             sys.exit(0)
         elif action == "status":
+            if "--all" in sys.argv[2:]:
+                sys.exit(0 if shared_utils.print_instances_status() else 1)
             if not check_status():
                 pass
             sys.exit(0)
+        elif action == "bench":
+            run_mux_benchmark()
+            sys.exit(0)
+        elif action == "optimize":
+            run_optimize(sys.argv[2:])
+            sys.exit(0)
+        elif action == "tune":
+            run_tune_tunnel(sys.argv[2:])
+            sys.exit(0)
+        elif action == "upload":
+            run_upload(sys.argv[2:])
+        elif action == "user":
+            manage_users(sys.argv[2:])
+            sys.exit(0)
+        elif action == "bench-proto":
+            run_protocol_benchmark()
+            sys.exit(0)
         elif action == "cat":
             # 新增cat命令，直接输出所有节点
-            all_nodes_file = INSTALL_DIR / "allnodes.txt"
-            if os.path.exists(str(all_nodes_file)):
-                with open(str(all_nodes_file), 'r') as f:
-                    all_links = f.read().splitlines()
-                    for link in all_links:
-                        print(link)
+            all_links = get_state_store().get_links(ARGOSB_INSTALL) if os.path.exists(str(INSTALL_DIR)) else []
+            if all_links:
+                for link in all_links:
+                    print(link)
             else:
-                print("\033[31m找不到节点文件，请先安装或运行status命令\033[0m")
+                print("\033[31m状态库中没有节点信息，请先安装或运行status命令\033[0m")
             sys.exit(0)
         elif action == "testapi":
             # 测试API服务器连接
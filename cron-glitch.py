@@ -2,6 +2,7 @@ import time
 import random
 import requests
 import logging
+import logging.handlers
 from datetime import datetime
 import uuid
 import platform
@@ -9,167 +10,534 @@ import json
 import os
 import sys
 import signal
+import atexit
+import sqlite3
+import heapq
+import threading
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("requests.log"), logging.StreamHandler()]
-)
+# ==================== 日志 ====================
+# 每个请求只记录一行（文本或 JSON），响应头和响应内容等详细信息按采样率记录；
+# 日志文件按大小和时间轮转，最近的日志同时保存在内存环形缓冲区中，
+# 运行中的进程通过 unix socket 提供给 tail 子命令读取，无需读盘。
+
+LOG_FILE = "requests.log"
+LOG_SOCKET = "glitch.sock"
+LOG_OPTIONS = {
+    'format': 'text',          # text 或 json
+    'max_bytes': 5 * 1024 * 1024,
+    'backup_count': 3,
+    'rotate_hours': 0,         # 0 表示不按时间轮转
+    'sample': 0.01,            # 记录响应头/响应内容的请求比例
+    'buffer': 500,             # 内存环形缓冲区行数
+    'level': logging.INFO,
+}
+
+class SizeTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """文件超过 max_bytes 或距上次轮转超过 rotate_hours 时轮转"""
+
+    def __init__(self, filename, max_bytes, backup_count, rotate_hours=0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rotate_seconds = rotate_hours * 3600
+        self.rollover_at = time.time() + self.rotate_seconds
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.rotate_seconds
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，请求记录的字段放在顶层"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(fields)
+        else:
+            data['msg'] = record.getMessage()
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+class RingBufferHandler(logging.Handler):
+    """把格式化后的日志保存在固定长度的内存缓冲区中"""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.buffer = deque(maxlen=capacity)
+        self.seq = 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self.seq += 1
+            self.buffer.append((self.seq, line))
+
+    def lines_after(self, after_seq, limit):
+        with self.lock:
+            lines = [item for item in self.buffer if item[0] > after_seq]
+        return lines[-limit:] if limit else lines
+
+ring_buffer = None
+
+def configure_logging(log_file=LOG_FILE, console=True, **options):
+    """按 LOG_OPTIONS 重新配置根日志器，可重复调用"""
+    global ring_buffer
+    LOG_OPTIONS.update(options)
+    if LOG_OPTIONS['format'] == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    handlers = [SizeTimeRotatingFileHandler(log_file, LOG_OPTIONS['max_bytes'],
+                                            LOG_OPTIONS['backup_count'], LOG_OPTIONS['rotate_hours'])]
+    if console:
+        handlers.append(logging.StreamHandler())
+    previous = ring_buffer
+    ring_buffer = RingBufferHandler(LOG_OPTIONS['buffer'])
+    if previous is not None:
+        ring_buffer.seq = previous.seq
+        ring_buffer.buffer.extend(previous.buffer)
+    handlers.append(ring_buffer)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+    root.setLevel(LOG_OPTIONS['level'])
+    # requests/urllib3 的重试告警每次都带完整异常，只保留错误级别
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+def log_request(target, status=None, latency=None, size=None, session=None, error=None, **extra):
+    """记录一次请求：文本模式一行摘要，JSON 模式一行结构化记录"""
+    fields = {'target': target, 'status': status}
+    if latency is not None:
+        fields['latency_ms'] = round(latency * 1000)
+    if size is not None:
+        fields['bytes'] = size
+    if session:
+        fields['session'] = session
+    if error:
+        fields['error'] = error
+    fields.update(extra)
+
+    parts = [f"{target}"]
+    if status is not None:
+        parts.append(f"状态码: {status}")
+    if latency is not None:
+        parts.append(f"响应时间: {latency:.2f}秒")
+    if size is not None:
+        parts.append(f"{size}字节")
+    if session:
+        parts.append(f"会话: {session}")
+    if error:
+        parts.append(f"错误: {error}")
+    parts.extend(f"{key}: {value}" for key, value in extra.items() if key != 'detail')
+    level = logging.WARNING if error else logging.INFO
+    logger.log(level, " ".join(parts), extra={'fields': fields})
+    if 'detail' in extra and LOG_OPTIONS['format'] != 'json':
+        logger.info(f"详情: {extra['detail']}")
+
+def sample_detail(response, headers):
+    """按采样率返回请求的详细信息，未抽中时返回 None"""
+    if random.random() >= LOG_OPTIONS['sample']:
+        return None
+    return {
+        'user_agent': headers.get('user-agent'),
+        'platform': headers.get('sec-ch-ua-platform'),
+        'response_headers': dict(response.headers),
+        'body': response.text[:100],
+    }
+
+class LogTailServer(threading.Thread):
+    """
+    通过 unix socket 提供环形缓冲区内容
+    请求: "<起始序号> <最多行数>\\n"，响应: 每行 "<序号>\\t<日志>\\n"
+    """
+
+    def __init__(self, path=LOG_SOCKET):
+        super().__init__(daemon=True, name='log-tail')
+        self.path = os.path.abspath(path)
+        self.sock = None
+
+    def bind(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                logger.warning(f"{self.path} 已被其他进程使用，tail 不可用")
+                return False
+            except OSError:
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(4)
+        atexit.register(self.close)
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def run(self):
+        while self.sock is not None:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.settimeout(2)
+                    request = conn.recv(64).decode().split()
+                    after_seq, limit = int(request[0]), int(request[1])
+                    lines = ring_buffer.lines_after(after_seq, limit) if ring_buffer else []
+                    conn.sendall("".join(f"{seq}\t{line}\n" for seq, line in lines).encode())
+                except (OSError, ValueError, IndexError):
+                    pass
+
+def start_log_tail_server():
+    server = LogTailServer()
+    try:
+        if server.bind():
+            server.start()
+    except OSError as e:
+        logger.warning(f"无法创建 {LOG_SOCKET}: {e}")
+
+def tail_logs(count=20, follow=False, path=LOG_SOCKET):
+    """从运行中进程的内存缓冲区读取最近的日志"""
+    after_seq, limit = -1, count
+    while True:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(5)
+                sock.connect(path)
+                sock.sendall(f"{after_seq} {limit}\n".encode())
+                chunks = []
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+        except OSError:
+            print(f"❌ 无法连接 {path}，请确认 cron-glitch 正在当前目录运行")
+            return False
+        for line in b"".join(chunks).decode(errors='replace').splitlines():
+            seq, _, text = line.partition('\t')
+            after_seq = max(after_seq, int(seq))
+            print(text)
+        if not follow:
+            return True
+        limit = 0
+        try:
+            time.sleep(1)
+        except KeyboardInterrupt:
+            return True
+
+# 日志在 main() 解析参数后才配置：tail/stats 不会创建 requests.log
 logger = logging.getLogger(__name__)
 
 # 定义默认URL
 DEFAULT_URL = "https://seemly-organized-thing.glitch.me/"
 URL = DEFAULT_URL
 
-# 创建cookies目录
+# cookies目录与会话库在首次使用时才创建
 COOKIES_DIR = "cookies"
-os.makedirs(COOKIES_DIR, exist_ok=True)
+SESSIONS_DB = os.path.join(COOKIES_DIR, "sessions.db")
 
 # 创建会话管理器
 class SessionManager:
-    def __init__(self):
-        self.sessions = {}
-        self.url_sessions = {}  # 用于存储URL和会话ID的映射
-        self.load_cookies()
-        
-    def load_cookies(self):
-        """从文件加载已保存的cookie"""
+    """
+    会话存储：所有会话保存在 COOKIES_DIR 下的一个 SQLite 文件中
+    - 按 URL 与最后使用时间建索引，挑选会话时不再遍历全部会话
+    - 会话的 cookie 只在被选中时才加载为 requests.Session
+    - 写入按脏标记批量进行：每隔 FLUSH_INTERVAL 秒把有变化的会话一次性写入
+    - 超过 SESSION_TTL 未使用的会话会被定期清理
+    """
+    SESSION_TTL = 86400       # 24小时内的会话可复用
+    FLUSH_INTERVAL = 60       # 批量写入间隔 (秒)
+    SWEEP_INTERVAL = 3600     # 过期清理间隔 (秒)
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or SESSIONS_DB
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL DEFAULT '',
+                user_agent TEXT NOT NULL DEFAULT '',
+                last_used REAL NOT NULL,
+                visit_count INTEGER NOT NULL DEFAULT 0,
+                cookies TEXT NOT NULL DEFAULT '[]'
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_url ON sessions(url, last_used);
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_used ON sessions(last_used);
+        """)
+        self.sessions = {}        # 已加载的会话: session_id -> 会话数据
+        self.dirty = set()        # 元数据有变化的会话
+        self.dirty_cookies = set()  # cookie 有变化的会话
+        self.unsaved = set()      # 新建后尚未写入数据库的会话
+        self.last_flush = time.monotonic()
+        self.last_sweep = 0.0
+        self.import_legacy_cookies()
+        self.sweep_expired()
+
+    def import_legacy_cookies(self):
+        """把旧版 cookies/*.json 一次性导入 SQLite，导入后删除原文件"""
         if not os.path.exists(COOKIES_DIR):
             return
-            
+
+        imported = []
+        now = time.time()
         for file in os.listdir(COOKIES_DIR):
-            if file.endswith('.json'):
-                session_id = file.split('.')[0]
-                try:
-                    with open(os.path.join(COOKIES_DIR, file), 'r') as f:
-                        data = json.load(f)
-                        cookies = data.get('cookies', []) if isinstance(data, dict) else data
-                        url = data.get('url', '') if isinstance(data, dict) else ''
-                        
-                        session = requests.Session()
-                        for cookie in cookies:
-                            session.cookies.set(cookie['name'], cookie['value'])
-                            
-                        self.sessions[session_id] = {
-                            'session': session,
-                            'user_agent': '',
-                            'last_used': datetime.now(),
-                            'visit_count': 0,
-                            'url': url
-                        }
-                        
-                        # 添加URL到会话ID的映射
-                        if url:
-                            if url not in self.url_sessions:
-                                self.url_sessions[url] = []
-                            self.url_sessions[url].append(session_id)
-                            
-                        logger.info(f"已加载会话: {session_id} (URL: {url})")
-                except Exception as e:
-                    logger.error(f"加载cookie文件出错: {e}")
-    
-    def save_cookies(self, session_id, url=''):
-        """保存会话cookie到文件"""
-        if session_id not in self.sessions:
+            if not file.endswith('.json'):
+                continue
+            session_id = file.split('.')[0]
+            path = os.path.join(COOKIES_DIR, file)
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                cookies = data.get('cookies', []) if isinstance(data, dict) else data
+                url = data.get('url', '') if isinstance(data, dict) else ''
+                # 旧文件的修改时间即会话最后一次使用的时间
+                last_used = os.path.getmtime(path)
+                imported.append((session_id, url, '', min(last_used, now), 0, json.dumps(cookies)))
+            except Exception as e:
+                logger.error(f"加载cookie文件出错: {e}")
+
+        if not imported:
             return
-            
-        session = self.sessions[session_id]['session']
-        cookies = []
-        for cookie in session.cookies:
-            cookies.append({
-                'name': cookie.name,
-                'value': cookie.value,
-                'domain': cookie.domain,
-                'path': cookie.path
-            })
-        
-        # 保存会话数据，包括URL    
-        data = {
-            'cookies': cookies,
-            'url': url
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?, ?, ?)", imported)
+        for row in imported:
+            try:
+                os.remove(os.path.join(COOKIES_DIR, f"{row[0]}.json"))
+            except OSError:
+                pass
+        logger.info(f"已从旧版cookie文件导入 {len(imported)} 个会话")
+
+    def create_requests_session(self, cookies=()):
+        """创建带重试策略的 requests.Session"""
+        session = requests.Session()
+        for cookie in cookies:
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+
+        # 配置重试策略
+        retry_strategy = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "POST"]
+        )
+        adapter = HTTPAdapter(max_retries=retry_strategy)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def cookie_list(session):
+        return [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path
+        } for cookie in session.cookies]
+
+    def load_session(self, session_id):
+        """按需把数据库中的会话加载到内存"""
+        if session_id in self.sessions:
+            return self.sessions[session_id]
+        row = self.db.execute(
+            "SELECT url, user_agent, last_used, visit_count, cookies FROM sessions WHERE session_id = ?",
+            (session_id,)).fetchone()
+        if row is None:
+            return None
+        cookies = json.loads(row[4])
+        session_data = {
+            'session': self.create_requests_session(cookies),
+            'user_agent': row[1],
+            'last_used': row[2],
+            'visit_count': row[3],
+            'url': row[0],
+            'cookies': row[4]
         }
-            
-        try:
-            with open(os.path.join(COOKIES_DIR, f"{session_id}.json"), 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            logger.error(f"保存cookie出错: {e}")
-    
+        self.sessions[session_id] = session_data
+        return session_data
+
+    def pick_session_id(self, url, cutoff):
+        """在有效期内随机挑选一个会话，优先选择同一URL的会话（含尚未写入数据库的新会话）"""
+        queries = []
+        if url:
+            queries.append(("url = ? AND last_used >= ?", (url, cutoff), lambda d: d['url'] == url))
+        queries.append(("last_used >= ?", (cutoff,), lambda d: True))
+        for where, params, match in queries:
+            pending = [sid for sid in self.unsaved if match(self.sessions[sid])]
+            count = self.db.execute(f"SELECT COUNT(*) FROM sessions WHERE {where}", params).fetchone()[0]
+            if not count and not pending:
+                continue
+            index = random.randrange(count + len(pending))
+            if index < len(pending):
+                return pending[index]
+            row = self.db.execute(
+                f"SELECT session_id FROM sessions WHERE {where} LIMIT 1 OFFSET ?",
+                params + (index - len(pending),)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def save_cookies(self, session_id, url=''):
+        """记录会话的cookie变化，按批量间隔写入数据库"""
+        with self.lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return
+            if url:
+                session_data['url'] = url
+            cookies = json.dumps(self.cookie_list(session_data['session']), sort_keys=True)
+            if cookies != session_data['cookies']:
+                session_data['cookies'] = cookies
+                self.dirty_cookies.add(session_id)
+            self.dirty.add(session_id)
+            self.maybe_flush()
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self.last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+        if now - self.last_sweep >= self.SWEEP_INTERVAL:
+            self.sweep_expired()
+
+    def flush(self):
+        """把所有脏会话在一个事务中写入数据库"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.dirty and not self.dirty_cookies:
+                return
+            rows = []
+            for session_id in self.dirty | self.dirty_cookies:
+                data = self.sessions.get(session_id)
+                if data is not None:
+                    rows.append((session_id, data['url'], data['user_agent'], data['last_used'],
+                                 data['visit_count'], data['cookies']))
+            try:
+                with self.db:
+                    # 只有 cookie 变化的会话才重写 cookies 列
+                    self.db.executemany("""
+                        INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(session_id) DO UPDATE SET
+                            url = excluded.url, user_agent = excluded.user_agent,
+                            last_used = excluded.last_used, visit_count = excluded.visit_count
+                    """, rows)
+                    self.db.executemany("UPDATE sessions SET cookies = ? WHERE session_id = ?",
+                                        [(r[5], r[0]) for r in rows if r[0] in self.dirty_cookies])
+                self.dirty.clear()
+                self.dirty_cookies.clear()
+                self.unsaved.clear()
+            except sqlite3.Error as e:
+                logger.error(f"保存cookie出错: {e}")
+
+    def sweep_expired(self):
+        """删除超过有效期的会话，并释放内存中对应的 Session"""
+        with self.lock:
+            self.last_sweep = time.monotonic()
+            cutoff = time.time() - self.SESSION_TTL
+            try:
+                with self.db:
+                    removed = self.db.execute("DELETE FROM sessions WHERE last_used < ?", (cutoff,)).rowcount
+            except sqlite3.Error as e:
+                logger.error(f"清理过期会话出错: {e}")
+                return
+            for session_id in [sid for sid, data in self.sessions.items() if data['last_used'] < cutoff]:
+                self.sessions.pop(session_id)['session'].close()
+                self.dirty.discard(session_id)
+                self.dirty_cookies.discard(session_id)
+                self.unsaved.discard(session_id)
+            if removed:
+                logger.info(f"已清理 {removed} 个过期会话")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
     def get_session(self, user_agent, headers, url=''):
         """获取或创建会话"""
-        # 70%概率复用已有会话，30%概率创建新会话
-        existing_sessions = []
-        
-        # 如果有URL对应的会话，优先使用
-        if url in self.url_sessions:
-            for session_id in self.url_sessions[url]:
-                if session_id in self.sessions:
-                    session_data = self.sessions[session_id]
-                    if (datetime.now() - session_data['last_used']).total_seconds() < 86400:  # 24小时内的会话
-                        existing_sessions.append((session_id, session_data))
-        
-        # 如果没有找到URL对应的会话，尝试使用任何可用会话
-        if not existing_sessions:
-            existing_sessions = [s for s in self.sessions.items() 
-                                if (datetime.now() - s[1]['last_used']).total_seconds() < 86400]  # 24小时内的会话
-        
-        if existing_sessions and random.random() < 0.7:
-            # 选择一个现有会话
-            session_id, session_data = random.choice(existing_sessions)
-            session_data['last_used'] = datetime.now()
-            session_data['visit_count'] += 1
-            session_data['url'] = url  # 更新URL
-            
-            # 更新User-Agent以保持一致性
-            headers['user-agent'] = session_data['user_agent'] if session_data['user_agent'] else headers['user-agent']
-            
-            # 更新URL到会话ID的映射
-            if url:
-                if url not in self.url_sessions:
-                    self.url_sessions[url] = []
-                if session_id not in self.url_sessions[url]:
-                    self.url_sessions[url].append(session_id)
-                    
-            logger.info(f"复用会话: {session_id} (访问次数: {session_data['visit_count']})")
-            return session_id, session_data['session']
-        else:
+        with self.lock:
+            now = time.time()
+            # 70%概率复用已有会话，30%概率创建新会话
+            session_id = self.pick_session_id(url, now - self.SESSION_TTL) if random.random() < 0.7 else None
+            session_data = self.load_session(session_id) if session_id else None
+
+            if session_data is not None:
+                session_data['last_used'] = now
+                session_data['visit_count'] += 1
+                session_data['url'] = url or session_data['url']  # 更新URL
+                self.dirty.add(session_id)
+
+                # 更新User-Agent以保持一致性
+                headers['user-agent'] = session_data['user_agent'] if session_data['user_agent'] else headers['user-agent']
+                session_data['user_agent'] = headers['user-agent']
+
+                logger.debug(f"复用会话: {session_id} (访问次数: {session_data['visit_count']})")
+                return session_id, session_data['session']
+
             # 创建新会话
             session_id = str(uuid.uuid4())[:8]
-            session = requests.Session()
-            
-            # 配置重试策略
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=0.3,
-                status_forcelist=[429, 500, 502, 503, 504],
-                allowed_methods=["GET", "POST"]
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-            
+            session = self.create_requests_session()
             self.sessions[session_id] = {
                 'session': session,
                 'user_agent': headers['user-agent'],
-                'last_used': datetime.now(),
+                'last_used': now,
                 'visit_count': 1,
-                'url': url
+                'url': url,
+                'cookies': '[]'
             }
-            
-            # 添加URL到会话ID的映射
-            if url:
-                if url not in self.url_sessions:
-                    self.url_sessions[url] = []
-                self.url_sessions[url].append(session_id)
-                
-            logger.info(f"创建新会话: {session_id}")
+            self.dirty.add(session_id)
+            self.dirty_cookies.add(session_id)
+            self.unsaved.add(session_id)
+
+            logger.debug(f"创建新会话: {session_id}")
             return session_id, session
 
-# 初始化会话管理器
-session_manager = SessionManager()
+session_manager = None
+
+def get_session_manager():
+    """按需创建会话管理器，只读命令 (tail/stats) 不会创建会话库"""
+    global session_manager
+    if session_manager is None:
+        session_manager = SessionManager()
+        atexit.register(session_manager.close)
+    return session_manager
 
 # 预定义的真实User-Agent列表
 REAL_USER_AGENTS = [
@@ -345,8 +713,23 @@ def generate_sec_ch_ua(browser, version):
 # 存储ETag以模拟浏览器缓存行为
 etag = None
 
-def simulate_human_behavior():
-    """模拟人类浏览行为"""
+def next_wait_time():
+    """
+    确保每1-4分钟发送一次请求，防止Glitch休眠
+    60%的概率在1-3分钟之间，40%的概率在3-4分钟之间，并在目标时间上下浮动一点
+    """
+    if random.random() < 0.6:
+        wait_time = random.randint(60, 180)
+    else:
+        wait_time = random.randint(180, 240)
+    jitter = random.uniform(-3, 3)
+    return max(1, wait_time + jitter)
+
+def simulate_human_behavior(blocking=True):
+    """
+    模拟人类浏览行为，返回停留总时长 (秒)
+    blocking=False 时不 sleep，由调度器把停留时间计入该目标的下次到期时间
+    """
     # 模拟页面加载后的行为
     behaviors = [
         {"action": "scroll_down", "probability": 0.7},
@@ -358,6 +741,7 @@ def simulate_human_behavior():
     # 随机选择1-3个行为执行
     num_actions = random.randint(1, 3)
     selected_behaviors = random.sample(behaviors, num_actions)
+    total = 0.0
     
     for behavior in selected_behaviors:
         if random.random() <= behavior["probability"]:
@@ -366,25 +750,28 @@ def simulate_human_behavior():
             
             if action == "scroll_down":
                 scroll_amount = random.randint(300, 1500)
-                logger.info(f"模拟行为: 向下滚动 {scroll_amount}px ({duration:.1f}秒)")
+                logger.debug(f"模拟行为: 向下滚动 {scroll_amount}px ({duration:.1f}秒)")
             elif action == "click_element":
-                logger.info(f"模拟行为: 点击页面元素 ({duration:.1f}秒)")
+                logger.debug(f"模拟行为: 点击页面元素 ({duration:.1f}秒)")
             elif action == "move_mouse":
-                logger.info(f"模拟行为: 移动鼠标 ({duration:.1f}秒)")
+                logger.debug(f"模拟行为: 移动鼠标 ({duration:.1f}秒)")
             elif action == "idle":
                 idle_time = random.uniform(2.0, 10.0)
-                logger.info(f"模拟行为: 停留页面 ({idle_time:.1f}秒)")
+                logger.debug(f"模拟行为: 停留页面 ({idle_time:.1f}秒)")
                 duration = idle_time
                 
-            time.sleep(duration)
+            total += duration
+            if blocking:
+                time.sleep(duration)
+    return total
 
 def send_request():
-    """发送请求并模拟真人行为"""
+    """发送请求并模拟真人行为，返回 (状态码, 响应时间, ETag是否变化)，失败时返回 None"""
     global etag
     headers = get_headers()
     
     # 获取会话
-    session_id, session = session_manager.get_session(headers['user-agent'], headers, URL)
+    session_id, session = get_session_manager().get_session(headers['user-agent'], headers, URL)
     
     # 如果有ETag，添加到请求头中
     if etag and random.random() < 0.9:  # 90%的概率使用缓存
@@ -412,38 +799,537 @@ def send_request():
         request_time = time.time() - start_time
         
         # 记录ETag以便下次请求使用
+        etag_changed = False
         if 'etag' in response.headers:
+            etag_changed = etag is not None and etag != response.headers['etag']
             etag = response.headers['etag']
         
         # 保存会话cookies
-        session_manager.save_cookies(session_id, URL)
-        
-        # 记录请求信息
-        logger.info(f"请求发送到 {URL}")
-        logger.info(f"会话ID: {session_id}")
-        logger.info(f"状态码: {response.status_code}")
-        logger.info(f"响应时间: {request_time:.2f}秒")
-        logger.info(f"User-Agent: {headers['user-agent']}")
-        logger.info(f"Platform: {headers['sec-ch-ua-platform']}")
-        logger.info(f"Cookie数量: {len(session.cookies)}")
+        get_session_manager().save_cookies(session_id, URL)
         
-        # 只在状态码变化或非304状态时打印详细信息
-        if response.status_code != 304:
-            logger.info(f"响应头: {dict(response.headers)}")
-            logger.info(f"响应内容: {response.text[:100]}..." if len(response.text) > 100 else f"响应内容: {response.text}")
-        else:
-            logger.info("内容未修改 (304 Not Modified)")
+        # 每个请求一行记录，响应头和响应内容只按采样率记录
+        extra = {'cookies': len(session.cookies)}
+        detail = sample_detail(response, headers) if response.status_code != 304 else None
+        if detail:
+            extra['detail'] = detail
+        log_request(URL, response.status_code, request_time, len(response.content), session_id, **extra)
         
         # 模拟人类浏览行为
         if response.status_code == 200:
             simulate_human_behavior()
+        return response.status_code, request_time, etag_changed
             
     except requests.exceptions.Timeout:
-        logger.warning("请求超时")
+        log_request(URL, session=session_id, error="请求超时")
     except requests.exceptions.ConnectionError:
-        logger.warning("连接错误")
+        log_request(URL, session=session_id, error="连接错误")
     except Exception as e:
-        logger.error(f"发送请求时出错: {e}")
+        log_request(URL, session=session_id, error=f"发送请求时出错: {e}")
+
+# ==================== 自适应保活间隔 ====================
+# 按目标学习其空闲休眠时间：记录每次请求距上次请求的间隔以及是否发生冷启动，
+# 维护区间 (warm_gap, cold_gap]——warm_gap 是仍保持唤醒的最长间隔，
+# cold_gap 是已出现冷启动的最短间隔。区间较宽时取中点试探，收敛后在 cold_gap
+# 内留出安全余量。学习结果与会话保存在同一个 SQLite 文件中，重启后继续沿用。
+
+ADAPTIVE_MARGIN = 0.15          # 安全余量：在学到的休眠时间前 15% 发出请求
+ADAPTIVE_MIN_INTERVAL = 30
+ADAPTIVE_MAX_INTERVAL = 3600
+ADAPTIVE_INITIAL_INTERVAL = 120
+FIXED_MEAN_INTERVAL = 0.6 * 120 + 0.4 * 210   # 固定策略 (60-240 秒) 的平均间隔
+
+class TargetProfile:
+    """单个目标的冷启动学习状态"""
+    __slots__ = ('url', 'warm_latency', 'warm_gap', 'cold_gap', 'requests', 'cold_starts',
+                 'gap_count', 'active_seconds', 'last_seen', 'last_status')
+
+    def __init__(self, url, warm_latency=None, warm_gap=None, cold_gap=None, requests=0,
+                 cold_starts=0, gap_count=0, active_seconds=0.0, last_seen=None, last_status=None):
+        self.url = url
+        self.warm_latency = warm_latency
+        self.warm_gap = warm_gap
+        self.cold_gap = cold_gap
+        self.requests = requests
+        self.cold_starts = cold_starts
+        self.gap_count = gap_count
+        self.active_seconds = active_seconds
+        self.last_seen = last_seen
+        self.last_status = last_status
+
+    def is_cold_start(self, status, latency, etag_changed):
+        """根据状态码变化、延迟突增以及 304 之后内容变化判断是否经历了冷启动"""
+        if status in (502, 503, 504):
+            return True
+        if self.last_status is not None and (self.last_status >= 500) != (status >= 500):
+            return True
+        if etag_changed and self.last_status == 304:
+            return True
+        if self.warm_latency is not None and self.requests >= 3:
+            return latency > max(self.warm_latency * 3, self.warm_latency + 2.0)
+        return False
+
+    def observe(self, status, latency, etag_changed=False, now=None):
+        """记录一次请求结果，返回是否判定为冷启动"""
+        now = time.time() if now is None else now
+        gap = now - self.last_seen if self.last_seen else None
+        # 脚本停止期间的长间隔既不反映休眠时间，也不计入统计
+        if gap is not None and gap > 2 * ADAPTIVE_MAX_INTERVAL:
+            gap = None
+        cold = self.is_cold_start(status, latency, etag_changed)
+
+        if gap is not None:
+            self.gap_count += 1
+            self.active_seconds += gap
+            if cold:
+                self.cold_starts += 1
+                self.cold_gap = min(self.cold_gap or gap, gap)
+                # 休眠时间变短了：之前认为安全的间隔也不再可信
+                if self.warm_gap and self.warm_gap >= gap:
+                    self.warm_gap = gap * (1 - ADAPTIVE_MARGIN)
+            else:
+                self.warm_gap = max(self.warm_gap or 0, gap)
+                # 休眠时间变长了：重新向上试探
+                if self.cold_gap and gap >= self.cold_gap:
+                    self.cold_gap = None
+
+        if not cold and status < 500:
+            self.warm_latency = latency if self.warm_latency is None else self.warm_latency * 0.8 + latency * 0.2
+        self.requests += 1
+        self.last_seen = now
+        self.last_status = status
+        return cold
+
+    def next_interval(self):
+        """下次请求的间隔：未见冷启动时逐步拉长，区间宽时二分试探，收敛后留出余量"""
+        if self.cold_gap is None:
+            interval = self.warm_gap * 1.25 if self.warm_gap else ADAPTIVE_INITIAL_INTERVAL
+        elif self.warm_gap and self.cold_gap > self.warm_gap * (1 + 2 * ADAPTIVE_MARGIN):
+            interval = (self.warm_gap + self.cold_gap) / 2
+        else:
+            interval = self.cold_gap * (1 - ADAPTIVE_MARGIN)
+        interval *= random.uniform(0.97, 1.0)
+        return min(ADAPTIVE_MAX_INTERVAL, max(ADAPTIVE_MIN_INTERVAL, interval))
+
+    def safe_interval(self):
+        """学到的保活间隔：最短冷启动间隔减去安全余量"""
+        return self.cold_gap * (1 - ADAPTIVE_MARGIN) if self.cold_gap else None
+
+    def requests_saved(self):
+        """与固定 60-240 秒策略相比节省的请求数"""
+        return self.active_seconds / FIXED_MEAN_INTERVAL - self.gap_count
+
+class AdaptiveStore:
+    """目标学习状态的持久化，和会话存储一样按脏标记批量写入"""
+    FLUSH_INTERVAL = 60
+    FIELDS = TargetProfile.__slots__
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or SESSIONS_DB
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS targets (
+                url TEXT PRIMARY KEY,
+                warm_latency REAL,
+                warm_gap REAL,
+                cold_gap REAL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                cold_starts INTEGER NOT NULL DEFAULT 0,
+                gap_count INTEGER NOT NULL DEFAULT 0,
+                active_seconds REAL NOT NULL DEFAULT 0,
+                last_seen REAL,
+                last_status INTEGER
+            )
+        """)
+        self.profiles = {}
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+
+    def get(self, url):
+        with self.lock:
+            profile = self.profiles.get(url)
+            if profile is None:
+                row = self.db.execute(
+                    f"SELECT {', '.join(self.FIELDS)} FROM targets WHERE url = ?", (url,)).fetchone()
+                profile = TargetProfile(*row) if row else TargetProfile(url)
+                self.profiles[url] = profile
+            return profile
+
+    def observe(self, url, status, latency, etag_changed=False):
+        with self.lock:
+            profile = self.get(url)
+            cold = profile.observe(status, latency, etag_changed)
+            self.dirty.add(url)
+            if time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL:
+                self.flush()
+            return profile, cold
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.dirty:
+                return
+            rows = [tuple(getattr(self.profiles[url], field) for field in self.FIELDS) for url in self.dirty]
+            try:
+                with self.db:
+                    self.db.executemany(
+                        f"INSERT OR REPLACE INTO targets ({', '.join(self.FIELDS)}) "
+                        f"VALUES ({', '.join('?' * len(self.FIELDS))})", rows)
+                self.dirty.clear()
+            except sqlite3.Error as e:
+                logger.error(f"保存自适应状态出错: {e}")
+
+    def all_profiles(self):
+        self.flush()
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM targets ORDER BY url").fetchall()
+        return [TargetProfile(*row) for row in rows]
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+adaptive_store = None
+
+def get_adaptive_store():
+    """按需创建自适应状态存储，未启用自适应模式时不创建表"""
+    global adaptive_store
+    if adaptive_store is None:
+        adaptive_store = AdaptiveStore()
+        atexit.register(adaptive_store.close)
+    return adaptive_store
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    return f"{seconds / 60:.1f}分" if seconds >= 90 else f"{seconds:.0f}秒"
+
+def show_adaptive_stats():
+    """显示各目标学到的休眠时间，以及相对固定策略节省的请求数"""
+    # 还没有会话库时直接显示暂无数据，不为查看统计而创建它
+    profiles = get_adaptive_store().all_profiles() if os.path.exists(SESSIONS_DB) else []
+    print("\033[36m┌──────────────── 自适应保活统计 ────────────────┐\033[0m")
+    if not profiles:
+        print("\033[36m│ 暂无数据，使用 --adaptive 运行后再查看\033[0m")
+        print("\033[36m└────────────────────────────────────────────────┘\033[0m")
+        return
+    total_requests = 0
+    total_saved = 0.0
+    for profile in profiles:
+        saved = profile.requests_saved()
+        total_requests += profile.requests
+        total_saved += saved
+        state = "已收敛" if profile.cold_gap and profile.warm_gap and \
+            profile.cold_gap <= profile.warm_gap * (1 + 2 * ADAPTIVE_MARGIN) else "学习中"
+        print(f"\033[36m│ {profile.url}\033[0m")
+        print(f"\033[36m│   保活间隔: {format_seconds(profile.safe_interval())} ({state}), "
+              f"休眠时间区间: {format_seconds(profile.warm_gap)} ~ {format_seconds(profile.cold_gap)}\033[0m")
+        print(f"\033[36m│   请求: {profile.requests}, 冷启动: {profile.cold_starts}, "
+              f"正常延迟: {(profile.warm_latency or 0) * 1000:.0f}ms, 节省请求: {saved:.0f}\033[0m")
+    fixed = total_requests + total_saved
+    ratio = total_saved / fixed * 100 if fixed > 0 else 0
+    print("\033[36m├────────────────────────────────────────────────┤\033[0m")
+    print(f"\033[36m│ 合计: 实际请求 {total_requests}, 固定策略约需 {fixed:.0f}, 节省 {total_saved:.0f} ({ratio:.0f}%)\033[0m")
+    print("\033[36m└────────────────────────────────────────────────┘\033[0m")
+
+# ==================== 多目标调度模式 ====================
+# 单进程同时为成百上千个目标保活：
+#   - 最小堆保存各目标的下次到期时间，主线程只在最近的到期点醒来
+#   - 到期请求交给有界线程池执行，同时在途的请求数不超过 workers
+#   - 所有目标共用一个 Session，其连接池按主机保持 keep-alive 连接，cookie 按域名隔离
+#   - 浏览行为的停留时间不再 sleep 占用线程，而是计入该目标的下次到期时间
+
+DEFAULT_WORKERS = 16
+
+class Target:
+    """单个保活目标，只保存调度必需的状态"""
+    __slots__ = ('url', 'min_interval', 'max_interval', 'etag', 'requests', 'failures', 'adaptive')
+
+    def __init__(self, url, min_interval=None, max_interval=None, adaptive=False):
+        self.url = url
+        self.adaptive = adaptive and min_interval is None
+        self.min_interval = min_interval
+        self.max_interval = max_interval if max_interval is not None else min_interval
+        self.etag = None
+        self.requests = 0
+        self.failures = 0
+
+    def next_interval(self):
+        """自适应目标使用学到的间隔，未指定间隔时沿用单目标模式的 1-4 分钟分布"""
+        if self.adaptive:
+            return get_adaptive_store().get(self.url).next_interval()
+        if self.min_interval is None:
+            return next_wait_time()
+        wait_time = random.uniform(self.min_interval, self.max_interval)
+        jitter = random.uniform(-3, 3) if wait_time >= 30 else 0
+        return max(1, wait_time + jitter)
+
+def parse_interval(text):
+    """解析 "120" 或 "60-180" 形式的间隔（秒）"""
+    low, _, high = text.partition('-')
+    low = float(low)
+    high = float(high) if high else low
+    if low <= 0 or high < low:
+        raise ValueError(f"无效的间隔: {text}")
+    return low, high
+
+def load_targets(path, adaptive=False):
+    """
+    读取目标列表文件，每行一个目标：
+        URL [间隔]      间隔为秒数或 "最小-最大"，省略时使用默认的 1-4 分钟分布
+                        (adaptive=True 时省略间隔的目标改用自适应间隔)
+    空行和 # 开头的行会被忽略
+    """
+    targets = []
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            if not fields[0].startswith(('http://', 'https://')):
+                raise ValueError(f"{path}:{line_no}: 不是有效的URL: {fields[0]}")
+            if len(fields) > 1:
+                try:
+                    low, high = parse_interval(fields[1])
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: {e}")
+                targets.append(Target(fields[0], low, high))
+            else:
+                targets.append(Target(fields[0], adaptive=adaptive))
+    return targets
+
+def create_shared_session(targets, workers):
+    """创建所有目标共用的 Session：每个主机一个连接池，每个池最多 workers 条连接"""
+    hosts = {urlsplit(target.url).netloc for target in targets}
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST"]
+    )
+    adapter = HTTPAdapter(pool_connections=max(1, len(hosts)),
+                          pool_maxsize=max(1, workers),
+                          max_retries=retry_strategy)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_target(session, target, timeout=10):
+    """向单个目标发送一次请求，返回需要额外停留的秒数"""
+    headers = get_headers()
+    if target.etag and random.random() < 0.9:  # 90%的概率使用缓存
+        headers["if-none-match"] = target.etag
+
+    start_time = time.time()
+    response = session.get(target.url, headers=headers, timeout=timeout)
+    request_time = time.time() - start_time
+    # 读完响应体，连接才能放回连接池复用
+    size = len(response.content)
+    target.requests += 1
+
+    etag_changed = False
+    if 'etag' in response.headers:
+        etag_changed = target.etag is not None and target.etag != response.headers['etag']
+        target.etag = response.headers['etag']
+    extra = {}
+    if target.adaptive:
+        _, extra['cold'] = get_adaptive_store().observe(target.url, response.status_code, request_time, etag_changed)
+    detail = sample_detail(response, headers) if response.status_code != 304 else None
+    if detail:
+        extra['detail'] = detail
+    log_request(target.url, response.status_code, request_time, size, **extra)
+
+    # 模拟人类浏览行为（不阻塞工作线程）
+    if response.status_code == 200:
+        return simulate_human_behavior(blocking=False)
+    return 0.0
+
+class KeepAliveScheduler:
+    """最小堆 + 有界线程池的多目标保活调度器"""
+
+    def __init__(self, targets, workers=DEFAULT_WORKERS, session=None, timeout=10, initial_spread=None):
+        self.targets = targets
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.session = session or create_shared_session(targets, self.workers)
+        self.heap = []
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.stopped = False
+        self.total_requests = 0
+        self.total_failures = 0
+
+        # 首轮请求在一个间隔内随机铺开，避免启动瞬间所有目标同时发起请求
+        now = time.monotonic()
+        for index, target in enumerate(targets):
+            spread = initial_spread if initial_spread is not None else target.next_interval()
+            heapq.heappush(self.heap, (now + random.uniform(0, spread), index, target))
+
+    def _run_one(self, index, target):
+        dwell = 0.0
+        try:
+            dwell = fetch_target(self.session, target, self.timeout)
+            target.failures = 0
+        except requests.exceptions.Timeout:
+            target.failures += 1
+            log_request(target.url, error="请求超时")
+        except requests.exceptions.ConnectionError:
+            target.failures += 1
+            log_request(target.url, error="连接错误")
+        except Exception as e:
+            target.failures += 1
+            log_request(target.url, error=f"发送请求时出错: {e}")
+
+        # 连续失败时适当推迟，最多推迟到正常间隔的 4 倍
+        # 自适应目标的间隔已贴近休眠时间，停留时间不再额外叠加
+        delay = target.next_interval() * min(4, 1 + target.failures) + (0 if target.adaptive else dwell)
+        with self.cond:
+            self.in_flight -= 1
+            self.total_requests += 1
+            self.total_failures += target.failures > 0
+            heapq.heappush(self.heap, (time.monotonic() + delay, index, target))
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def run(self, duration=None):
+        """运行调度循环，duration 为 None 时一直运行直到 stop()"""
+        deadline = time.monotonic() + duration if duration else None
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='glitch') as pool:
+            with self.cond:
+                while not self.stopped:
+                    now = time.monotonic()
+                    if deadline and now >= deadline:
+                        break
+                    if self.in_flight >= self.workers or not self.heap:
+                        self.cond.wait(None if deadline is None else deadline - now)
+                        continue
+                    due, index, target = self.heap[0]
+                    if due > now:
+                        wait = due - now
+                        if deadline:
+                            wait = min(wait, deadline - now)
+                        self.cond.wait(wait)
+                        continue
+                    heapq.heappop(self.heap)
+                    self.in_flight += 1
+                    pool.submit(self._run_one, index, target)
+                self.stopped = True
+        self.session.close()
+
+def run_scheduler(targets_file, workers=DEFAULT_WORKERS, adaptive=False):
+    """多目标调度模式入口"""
+    try:
+        targets = load_targets(targets_file, adaptive)
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取目标列表失败: {e}")
+        sys.exit(1)
+    if not targets:
+        print(f"❌ 目标列表为空: {targets_file}")
+        sys.exit(1)
+
+    scheduler = KeepAliveScheduler(targets, workers)
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+    logger.info(f"调度模式启动: {len(targets)} 个目标, {scheduler.workers} 个工作线程")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("程序被用户中断")
+        scheduler.stop()
+    logger.info(f"调度结束: 共发送 {scheduler.total_requests} 次请求, 失败 {scheduler.total_failures} 次")
+
+def read_rss_kb():
+    """读取当前进程的常驻内存 (KB)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _bench_server(ports, ready):
+    """基准测试用的本地 HTTP 服务（子进程中运行，不计入调度器内存）"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.headers.get('if-none-match') == '"bench"':
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = b'ok'
+            self.send_response(200)
+            self.send_header('ETag', '"bench"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    servers = [ThreadingHTTPServer(('127.0.0.1', port), Handler) for port in ports]
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.set()
+    servers[0].serve_forever()
+
+def run_scheduler_benchmark(count, seconds=20, workers=DEFAULT_WORKERS):
+    """用本地服务测量调度 count 个目标时每个目标的内存开销"""
+    import multiprocessing
+
+    host_count = min(count, 16)
+    ports = []
+    for _ in range(host_count):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            ports.append(sock.getsockname()[1])
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=_bench_server, args=(ports, ready), daemon=True)
+    server.start()
+    if not ready.wait(10):
+        print("❌ 本地测试服务启动失败")
+        server.terminate()
+        return False
+
+    logger.setLevel(logging.WARNING)
+    base_rss = read_rss_kb()
+    # 间隔压缩到 1-3 秒，让每个目标在测试时间内被请求多次
+    targets = [Target(f"http://127.0.0.1:{ports[i % host_count]}/t{i}", 1, 3) for i in range(count)]
+    scheduler = KeepAliveScheduler(targets, workers, initial_spread=1)
+    started = time.monotonic()
+    try:
+        scheduler.run(duration=seconds)
+    finally:
+        server.terminate()
+        server.join(5)
+    elapsed = time.monotonic() - started
+    peak_rss = read_rss_kb()
+
+    per_target = max(0, peak_rss - base_rss) / count
+    print("\033[36m┌──────────────── 多目标调度基准测试 ────────────────┐\033[0m")
+    print(f"\033[36m│ 目标数: {count} (分布在 {host_count} 个主机), 工作线程: {scheduler.workers}\033[0m")
+    print(f"\033[36m│ 运行时间: {elapsed:.1f} 秒, 请求数: {scheduler.total_requests}, 失败: {scheduler.total_failures}\033[0m")
+    print(f"\033[36m│ 吞吐: {scheduler.total_requests / max(elapsed, 0.001):.1f} 次/秒\033[0m")
+    print(f"\033[36m│ 基础内存: {base_rss / 1024:.1f} MB, 运行后: {peak_rss / 1024:.1f} MB\033[0m")
+    print(f"\033[36m│ 每目标内存: {per_target:.1f} KB\033[0m")
+    print(f"\033[36m│ 每目标一个进程约需: {base_rss * count / 1024:.0f} MB\033[0m")
+    print("\033[36m└────────────────────────────────────────────────────┘\033[0m")
+    return scheduler.total_requests > 0
 
 # 后台运行相关函数
 def run_in_background():
@@ -453,13 +1339,8 @@ def run_in_background():
     with open('glitch.pid', 'w') as f:
         f.write(str(pid))
     
-    # 设置日志输出到文件
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-    
-    file_handler = logging.FileHandler('glitch.log')
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(file_handler)
+    # 设置日志输出到文件（同样按大小/时间轮转）
+    configure_logging('glitch.log', console=False)
     
     logger.info(f"进程已在后台运行，PID: {pid}")
     
@@ -472,6 +1353,15 @@ def main():
     
     # 解析命令行参数
     background = False
+    targets_file = None
+    workers = DEFAULT_WORKERS
+    bench_count = None
+    bench_seconds = 20
+    adaptive = False
+    tail_mode = False
+    tail_count = 20
+    tail_follow = False
+    log_options = {}
     
     # 简单的参数解析
     i = 1
@@ -488,9 +1378,90 @@ def main():
         elif arg == '-b' or arg == '--background':
             background = True
             i += 1
+        elif arg == '-a' or arg == '--adaptive':
+            adaptive = True
+            i += 1
+        elif arg == 'stats':
+            show_adaptive_stats()
+            return
+        elif arg == 'tail':
+            tail_mode = True
+            i += 1
+        elif arg == '-F' or arg == '--follow':
+            tail_follow = True
+            i += 1
+        elif arg == '-v' or arg == '--verbose':
+            log_options['level'] = logging.DEBUG
+            i += 1
+        elif arg == '--log-format':
+            if i + 1 >= len(sys.argv) or sys.argv[i + 1] not in ('text', 'json'):
+                print("错误: --log-format 只能是 text 或 json")
+                sys.exit(1)
+            log_options['format'] = sys.argv[i + 1]
+            i += 2
+        elif arg in ('-n', '--log-max-mb', '--log-backups', '--log-rotate-hours', '--log-sample', '--log-buffer'):
+            if i + 1 >= len(sys.argv):
+                print(f"错误: {arg}参数需要一个值")
+                sys.exit(1)
+            try:
+                value = float(sys.argv[i + 1])
+            except ValueError:
+                print(f"错误: {arg}参数需要一个数字")
+                sys.exit(1)
+            if arg == '-n':
+                tail_count = max(1, int(value))
+            elif arg == '--log-max-mb':
+                log_options['max_bytes'] = int(value * 1024 * 1024)
+            elif arg == '--log-backups':
+                log_options['backup_count'] = int(value)
+            elif arg == '--log-rotate-hours':
+                log_options['rotate_hours'] = value
+            elif arg == '--log-sample':
+                log_options['sample'] = min(1.0, max(0.0, value))
+            else:
+                log_options['buffer'] = max(1, int(value))
+            i += 2
+        elif arg in ('-f', '--targets', '-w', '--workers', '--bench', '--bench-seconds'):
+            if i + 1 >= len(sys.argv):
+                print(f"错误: {arg}参数需要一个值")
+                sys.exit(1)
+            value = sys.argv[i + 1]
+            try:
+                if arg in ('-f', '--targets'):
+                    targets_file = value
+                elif arg in ('-w', '--workers'):
+                    workers = int(value)
+                elif arg == '--bench':
+                    bench_count = int(value)
+                else:
+                    bench_seconds = float(value)
+            except ValueError:
+                print(f"错误: {arg}参数需要一个数字")
+                sys.exit(1)
+            i += 2
         else:
             i += 1
     
+    # 从运行中进程的内存缓冲区读取日志
+    if tail_mode:
+        sys.exit(0 if tail_logs(tail_count, tail_follow) else 1)
+
+    configure_logging(**log_options)
+
+    # 基准测试：测量多目标调度的内存开销
+    if bench_count is not None:
+        sys.exit(0 if run_scheduler_benchmark(max(1, bench_count), bench_seconds, workers) else 1)
+
+    # 多目标调度模式
+    if targets_file:
+        if background:
+            print(f"正在后台启动，目标列表: {targets_file}")
+            print("日志将写入 glitch.log 文件")
+            run_in_background()
+        start_log_tail_server()
+        run_scheduler(targets_file, workers, adaptive)
+        return
+
     # 如果指定后台运行
     if background:
         print(f"正在后台启动，访问URL: {URL}")
@@ -499,27 +1470,28 @@ def main():
     else:
         logger.info("开始运行脚本，模拟真人访问...")
         logger.info(f"目标URL: {URL}")
+    start_log_tail_server()
+    if adaptive:
+        logger.info("已启用自适应保活间隔")
     
     try:
         while True:
-            # 确保每1-4分钟发送一次请求，防止Glitch休眠
-            # 60%的概率在1-3分钟之间
-            # 40%的概率在3-4分钟之间
-            rand = random.random()
-            if rand < 0.6:  # 60%的概率
-                wait_time = random.randint(60, 180)  # 1-3分钟
-            else:  # 40%的概率
-                wait_time = random.randint(180, 240)  # 3-4分钟
-                
+            if adaptive:
+                # 间隔从上次请求开始计算，扣除浏览停留已用掉的时间
+                profile = get_adaptive_store().get(URL)
+                elapsed = time.time() - profile.last_seen if profile.last_seen else 0
+                actual_wait = max(1, profile.next_interval() - elapsed)
+            else:
+                actual_wait = next_wait_time()
             current_time = datetime.now().strftime("%H:%M:%S")
-            logger.info(f"当前时间: {current_time}, 等待 {wait_time} 秒...")
-            
-            # 不是精确等待，而是在目标时间上下浮动一点
-            jitter = random.uniform(-3, 3)
-            actual_wait = max(1, wait_time + jitter)
+            logger.info(f"当前时间: {current_time}, 等待 {actual_wait:.0f} 秒...")
             time.sleep(actual_wait)
             
-            send_request()
+            result = send_request()
+            if adaptive and result:
+                _, cold = get_adaptive_store().observe(URL, *result)
+                if cold:
+                    logger.info("检测到冷启动")
             
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Hysteria2 一键部署工具
+
+模块划分：
+    cli        参数解析与命令分发，按子命令延迟导入
+    status     status 子命令（轻量）
+    help       help 子命令
+    bench      启动耗时回归检查
+    core       安装、增量部署、滚动重启等重量级命令
+    state      SQLite 状态库 (state.db) 与旧状态文件迁移
+    templates  HTML / 脚本模板数据
+"""
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""启动耗时回归检查：用 python -X importtime 测量 status 冷启动的导入开销"""
+import os
+import subprocess
+import sys
+import time
+
+from hy2.paths import ENTRY_SCRIPT
+
+# status 冷启动允许的导入耗时上限（毫秒，已扣除解释器自身启动的导入；含 -X importtime 的计时开销）
+STATUS_IMPORT_BUDGET_MS = 40
+# status 不应加载的重量级模块
+HEAVY_MODULES = ("hy2.core", "shared_utils", "ssl", "urllib.request", "http.client", "tempfile", "argparse")
+
+def measure_imports(args):
+    """运行一次入口脚本，返回 (导入总耗时毫秒, 已导入模块集合)"""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run([sys.executable, "-X", "importtime"] + list(args),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+    total_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|", 2)
+            total_us += int(self_us)
+            modules.add(name.strip())
+        except ValueError:
+            continue
+    return total_us / 1000, modules
+
+def check_status_startup(budget_ms=STATUS_IMPORT_BUDGET_MS, runs=5):
+    """status 冷启动回归检查，超出预算或加载了重量级模块时返回 False"""
+    # 先运行一次生成字节码缓存，之后的测量才代表日常调用
+    measure_imports([ENTRY_SCRIPT, "status"])
+    samples = []
+    wall_samples = []
+    modules = set()
+    baseline_modules = set()
+    for _ in range(runs):
+        baseline_ms, baseline_modules = measure_imports(["-c", "pass"])
+        started = time.perf_counter()
+        total_ms, modules = measure_imports([ENTRY_SCRIPT, "status"])
+        wall_samples.append((time.perf_counter() - started) * 1000)
+        samples.append(max(total_ms - baseline_ms, 0.0))
+    samples.sort()
+    wall_samples.sort()
+    median_ms = samples[len(samples) // 2]
+    # 只统计 status 新增的模块，解释器启动时 site 已导入的不算
+    added_modules = modules - baseline_modules
+    leaked = [name for name in HEAVY_MODULES if name in added_modules]
+
+    print(f"⏱️  status 导入耗时 ({runs} 次): min {samples[0]:.2f}ms / median {median_ms:.2f}ms (预算 {budget_ms}ms)")
+    print(f"⏱️  status 总耗时 (含 importtime 开销): median {wall_samples[len(wall_samples) // 2]:.2f}ms")
+    print(f"📦 新增导入模块数: {len(added_modules)}")
+    ok = median_ms <= budget_ms and not leaked
+    if leaked:
+        print(f"❌ status 加载了重量级模块: {', '.join(leaked)}")
+    print("✅ status 冷启动检查通过" if ok else "❌ status 冷启动检查未通过")
+    return ok
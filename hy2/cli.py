@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""命令行入口：解析参数后按子命令延迟导入对应模块，status/help 不加载部署核心"""
+import sys
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description='Hysteria2 一键部署工具（防墙增强版）')
+    parser.add_argument('command', nargs='?', default='install',
+                      help='命令: install, reconcile, reload, upgrade, del, status, help, setup-nginx, client, fix, bench-startup')
+    parser.add_argument('--ip', help='指定服务器IP地址或域名')
+    parser.add_argument('--port', type=int, help='指定服务器端口（推荐443）')
+    parser.add_argument('--password', help='指定密码')
+    parser.add_argument('--domain', help='指定域名（用于获取真实证书）')
+    parser.add_argument('--email', help='Let\'s Encrypt证书邮箱地址')
+    parser.add_argument('--use-real-cert', action='store_true', 
+                      help='使用真实域名证书（需要域名指向服务器）')
+    parser.add_argument('--web-masquerade', action='store_true', default=True,
+                      help='启用Web伪装（默认启用）')
+    parser.add_argument('--auto-nginx', action='store_true', default=True,
+                      help='安装时自动配置nginx (默认启用)')
+    
+    # 真正的Hysteria2防墙功能选项
+    parser.add_argument('--port-hopping', action='store_true',
+                      help='启用端口跳跃（动态切换端口，防封锁）')
+    parser.add_argument('--obfs-password', 
+                      help='启用Salamander混淆密码（防DPI检测）')
+    parser.add_argument('--http3-masquerade', action='store_true',
+                      help='启用HTTP/3伪装（流量看起来像正常HTTP/3）')
+    parser.add_argument('--one-click', action='store_true',
+                      help='一键部署（自动启用所有防墙功能）')
+    parser.add_argument('--simple', action='store_true',
+                      help='简化一键部署（端口跳跃+混淆+nginx Web伪装）')
+    parser.add_argument('--port-range', 
+                      help='指定端口跳跃范围 (格式: 起始端口-结束端口，如: 28888-29999)')
+    parser.add_argument('--enable-bbr', action='store_true',
+                      help='启用BBR拥塞控制算法优化网络性能')   
+    parser.add_argument('--no-systemd', action='store_true',
+                      help='不使用 Systemd，使用临时的 nohup 启动方式')    
+    parser.add_argument('--resume', action='store_true',
+                      help='从上次中断的步骤继续简化一键部署（跳过检查点中已完成的步骤）')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='reconcile 时只显示需要变更的组件，不做修改')
+    parser.add_argument('--grace', type=int, default=None,
+                      help='滚动重启时旧实例的排空时间（秒），0 表示直接重启 (默认: reload/upgrade 为 30，reconcile 为 0)')
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # 无选项的轻量命令直接分发，连 argparse 也不导入
+    if argv in (['status'], ['help']):
+        command = argv[0]
+    else:
+        args = build_parser().parse_args(argv)
+        command = args.command
+
+    if command == 'status':
+        from hy2.status import show_status
+        show_status()
+    elif command == 'help':
+        from hy2.help import show_help
+        show_help()
+    elif command == 'bench-startup':
+        # status 冷启动导入耗时回归检查
+        from hy2.bench import check_status_startup
+        if not check_status_startup():
+            sys.exit(1)
+    else:
+        from hy2.core import run_command
+        run_command(args)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""help 子命令"""
+
+def show_help():
+    """显示帮助信息"""
+    print("""
+🛡️ Hysteria2 一键部署工具 (防墙增强版)
+
+重要说明：Hysteria2基于UDP/QUIC协议，支持端口跳跃、混淆和HTTP/3伪装！
+
+使用方法:
+    python3 hy2.py [命令] [选项]
+
+可用命令:
+    install      安装 Hysteria2 (一键部署，自动优化配置)
+    reconcile    增量更新 (只重写/重启配置变化的组件，如更换密码、端口范围)
+    reload       零中断滚动重启 (新实例接管新连接，旧实例排空后重启)
+    upgrade      升级 Hysteria2 二进制并滚动重启
+    client       显示客户端连接指南 (各平台详细说明)
+    fix          修复nginx配置和权限问题
+    setup-nginx  设置nginx Web伪装
+    
+    del          删除 Hysteria2
+    status       查看 Hysteria2 状态
+    help         显示此帮助信息
+    bench-startup  status 冷启动耗时回归检查 (超出预算时退出码为 1)
+
+🔧 基础选项:
+    --ip IP           指定服务器IP地址
+    --port PORT       指定服务器端口 (推荐: 443)
+    --password PWD    指定密码
+
+🔐 防墙增强选项:
+    --domain DOMAIN         指定域名 (推荐用于真实证书)
+    --email EMAIL           Let's Encrypt证书邮箱地址  
+    --use-real-cert         使用真实域名证书 (需域名指向服务器)
+    --web-masquerade        启用Web伪装 (默认启用)
+    --auto-nginx            自动配置nginx (默认启用)
+
+🚀 高级防墙选项:
+    --simple                🎯 简化一键部署 (端口跳跃+混淆+nginx Web伪装)
+    --port-range RANGE      指定端口跳跃范围 (如: 28888-29999)
+    --enable-bbr            启用BBR拥塞控制算法优化网络性能
+    --port-hopping          启用端口跳跃 (动态切换端口，防封锁)
+    --obfs-password PWD     启用Salamander混淆 (防DPI检测)
+    --http3-masquerade      启用HTTP/3伪装 (流量看起来像正常HTTP/3)
+    --one-click             一键部署 (自动启用所有防墙功能)
+    --resume                从上次失败的步骤继续简化一键部署 (跳过已完成步骤)
+    
+
+📋 示例:
+
+    # 🎯 简化一键部署 (推荐！端口跳跃+混淆+nginx Web伪装)
+    python3 hy2.py install --simple
+
+    # 🔥 高位端口 + BBR优化 (最强性能)
+    python3 hy2.py install --simple --port-range 28888-29999 --enable-bbr
+
+    # 部署中途失败，修复后从失败步骤继续 (不重复下载和生成证书)
+    python3 hy2.py install --resume
+
+    # 更换密码 (只重写配置并直接重启hysteria，不重启nginx；加 --grace 60 改为滚动重启)
+    python3 hy2.py reconcile --password "newPassword"
+
+    # 预览端口范围变更会影响哪些组件
+    python3 hy2.py reconcile --port-range 30000-31000 --dry-run
+
+    # 滚动重启，旧连接排空60秒后再切换
+    python3 hy2.py reload --grace 60
+
+    # 完整一键部署 (自动启用所有防墙功能)
+    python3 hy2.py install --one-click
+
+    # 基础安装
+    python3 hy2.py install
+
+    # 最强防墙配置
+    python3 hy2.py install --port-hopping --obfs-password "random123" --http3-masquerade --domain your.domain.com --use-real-cert
+
+    # 端口跳跃模式 (防端口封锁)
+    python3 hy2.py install --port-hopping --port 443
+
+    # 流量混淆模式 (防DPI检测)
+    python3 hy2.py install --obfs-password "myObfsKey" --port 8443
+
+    # HTTP/3伪装模式
+    python3 hy2.py install --http3-masquerade --port 443
+
+🛡️ Hysteria2 真实防墙技术:
+
+🎯 支持的防墙功能:
+1️⃣ 端口跳跃 (Port Hopping): 动态切换端口，防止端口封锁
+2️⃣ Salamander混淆: 加密流量特征，防DPI深度包检测  
+3️⃣ HTTP/3伪装: 流量看起来像正常HTTP/3网站访问
+4️⃣ Web页面伪装: nginx显示正常网站页面
+
+🔒 防护级别:
+• 🔥 顶级防护: 端口跳跃 + 混淆 + HTTP/3伪装 + Web伪装
+• 🔥 高级防护: 混淆 + HTTP/3伪装 + Web伪装
+• 🔒 中级防护: 端口跳跃 + Web伪装
+• ✅ 基础防护: Web伪装
+• ⚡ 高速模式: 纯UDP无额外防护
+
+⚠️ 重要提醒:
+- Hysteria2使用UDP协议，防火墙必须开放UDP端口
+- 端口跳跃模式需要开放端口范围
+- 混淆模式客户端和服务端必须使用相同密码
+- HTTP/3伪装提供最佳流量隐蔽性
+
+🌟 推荐配置:
+1️⃣ 🎯 最佳推荐: --simple (端口跳跃+混淆+nginx Web伪装)
+2️⃣ 完整功能: --one-click (一键部署所有功能)
+3️⃣ 速度优先: 基础安装
+4️⃣ 稳定优先: --port-hopping
+5️⃣ 隐蔽优先: --obfs-password + --http3-masquerade
+""")
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""路径相关的公共定义（不引入任何重量级模块）"""
+import os
+
+# 入口脚本路径，kk 等生成的脚本通过它回调部署工具
+ENTRY_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nginx-hysteria2.py")
+
+def get_user_home():
+    """
+    修改核心功能：强制返回/root目录，以确保与现有nginx.conf路径匹配。
+    这解决了不同用户执行脚本导致路径不一致的问题。
+    """
+    return "/root"
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Hysteria2 状态库：~/.hysteria2/state.db，取代 global_config.json 等散落的状态文件"""
+import json
+import os
+import time
+
+import shared_utils
+
+from hy2.paths import get_user_home
+
+HYSTERIA_INSTALL = "hysteria2"
+CONFIG_SERVER_PORT = 8085
+
+def get_state_db_path(base_dir=None):
+    base_dir = base_dir or f"{get_user_home()}/.hysteria2"
+    return os.path.join(base_dir, shared_utils.STATE_DB_NAME)
+
+def open_hysteria_state(base_dir=None):
+    """打开状态库并完成旧文件迁移"""
+    base_dir = base_dir or f"{get_user_home()}/.hysteria2"
+    store = shared_utils.open_state_store(base_dir)
+    migrate_hysteria_legacy_files(store, base_dir)
+    return store
+
+def migrate_hysteria_legacy_files(store, base_dir):
+    """首次打开状态库时导入 global_config.json 与服务端配置中的端口/证书 (只执行一次)"""
+    if store.get_setting("legacy_imported_at"):
+        return False
+    imported = []
+    now = time.time()
+    with store.transaction() as conn:
+        try:
+            with open(f"{base_dir}/global_config.json", 'r', encoding='utf-8') as f:
+                conn.execute("INSERT OR REPLACE INTO installs (name, config, updated_at) VALUES (?, ?, ?)",
+                             (HYSTERIA_INSTALL, json.dumps(json.load(f), ensure_ascii=False), now))
+            imported.append("global_config.json")
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(f"{base_dir}/config/config.json", 'r', encoding='utf-8') as f:
+                server_config = json.load(f)
+            port = int(server_config.get("listen", ":443").rsplit(':', 1)[-1])
+            conn.execute("INSERT OR REPLACE INTO ports (port, proto, owner, purpose, updated_at) VALUES (?, 'udp', ?, 'listen', ?)",
+                         (port, HYSTERIA_INSTALL, now))
+            tls = server_config.get("tls") or {}
+            if tls.get("cert") and tls.get("key"):
+                # 真实证书与自签名证书都复制为 cert/server.crt，只能通过 certbot 目录区分
+                domain = tls.get("sni") or HYSTERIA_INSTALL
+                conn.execute("INSERT OR REPLACE INTO certificates (domain, cert_path, key_path, self_signed, updated_at) VALUES (?, ?, ?, ?, ?)",
+                             (domain, tls["cert"], tls["key"], int(not os.path.isdir(f"/etc/letsencrypt/live/{domain}")), now))
+            imported.append("config/config.json")
+        except (OSError, ValueError, KeyError):
+            pass
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('legacy_imported_at', ?)", (str(now),))
+    if imported:
+        print(f"📦 已将旧状态文件导入状态库: {', '.join(imported)}")
+    return True
+
+def _write_port_reservations(conn, port, hop_range=None, with_fileserver=True, now=None):
+    """重写本工具的端口预留：监听端口、端口跳跃范围与配置文件服务器"""
+    now = now or time.time()
+    conn.execute("DELETE FROM ports WHERE owner = ?", (HYSTERIA_INSTALL,))
+    conn.execute("INSERT OR REPLACE INTO ports (port, proto, owner, purpose, updated_at) VALUES (?, 'udp', ?, 'listen', ?)",
+                 (int(port), HYSTERIA_INSTALL, now))
+    if hop_range:
+        conn.executemany("INSERT OR IGNORE INTO ports (port, proto, owner, purpose, updated_at) VALUES (?, 'udp', ?, 'hop', ?)",
+                         [(p, HYSTERIA_INSTALL, now) for p in range(hop_range[0], hop_range[1] + 1)])
+    if with_fileserver:
+        conn.execute("INSERT OR REPLACE INTO ports (port, proto, owner, purpose, updated_at) VALUES (?, 'tcp', ?, 'fileserver', ?)",
+                     (CONFIG_SERVER_PORT, HYSTERIA_INSTALL, now))
+
+def parse_hop_range(port_range):
+    try:
+        start, end = (int(x) for x in str(port_range).split('-', 1))
+        return (start, end) if start <= end else None
+    except (TypeError, ValueError):
+        return None
+
+def get_reserved_hop_range(store):
+    """返回已预留的端口跳跃范围 (start, end)，没有则返回 None"""
+    row = store.conn.execute("SELECT MIN(port), MAX(port) FROM ports WHERE owner = ? AND purpose = 'hop'",
+                             (HYSTERIA_INSTALL,)).fetchone()
+    return (row[0], row[1]) if row and row[0] is not None else None
+
+def reserve_hysteria_ports(store, port, hop_range=None):
+    with store.transaction() as conn:
+        _write_port_reservations(conn, port, hop_range)
+
+def record_hysteria_install(store, install_config, port, with_fileserver=True):
+    """在一个事务内写入安装信息与端口占用"""
+    now = time.time()
+    with store.transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO installs (name, config, updated_at) VALUES (?, ?, ?)",
+                     (HYSTERIA_INSTALL, json.dumps(install_config, ensure_ascii=False), now))
+        _write_port_reservations(conn, port, parse_hop_range(install_config.get("port_range")), with_fileserver, now)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""模板数据（HTML、kk 脚本、配置下载服务脚本），用到时才从磁盘读取"""
+import os
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_template(name):
+    """读取 hy2/templates 下的模板文件"""
+    with open(os.path.join(TEMPLATE_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
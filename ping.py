@@ -1,15 +1,33 @@
 #!/usr/bin/python3
-import subprocess
+import argparse
+import errno
+import heapq
+import ipaddress
+import json
+import math
+import os
+import queue
+import selectors
+import shutil
+import socket
+import sqlite3
+import ssl
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+import time
 from operator import itemgetter
 from time import strftime
-import threading
-import re
+from urllib.parse import urlsplit
 import requests
 
 hostname = "杭州办公室橙域备线路机器通知"
 
-def send_webhook_alert(message):
-    webhook_url = "https://oapi.dingtalk.com/robot/send?access_token=b0deef874b979eeb97d3e374e9c9867cb269d110427e9f590038bef0c4025eca"
+DEFAULT_WEBHOOK_URL = "https://oapi.dingtalk.com/robot/send?access_token=b0deef874b979eeb97d3e374e9c9867cb269d110427e9f590038bef0c4025eca"
+
+def post_webhook(webhook_url, message, timeout=10):
+    """发送一条钉钉文本消息，成功返回 True"""
     headers = {
         "Content-Type": "application/json"
     }
@@ -20,55 +38,1719 @@ def send_webhook_alert(message):
         }
     }
     try:
-        response = requests.post(webhook_url, json=payload, headers=headers)
-        if response.status_code == 200:
-            print("Webhook警报发送成功")
-        else:
+        response = requests.post(webhook_url, json=payload, headers=headers, timeout=timeout)
+        if response.status_code != 200:
             print(f"无法发送Webhook警报，状态码: {response.status_code}")
+            return False
+        # 钉钉在 HTTP 200 中用 errcode 表示失败（如触发限流）
+        try:
+            errcode = response.json().get('errcode', 0)
+        except ValueError:
+            errcode = 0
+        if errcode:
+            print(f"无法发送Webhook警报，错误码: {errcode}")
+            return False
+        print("Webhook警报发送成功")
+        return True
     except Exception as e:
         print(f"发送Webhook警报时出错: {e}")
+        return False
+
+def send_webhook_alert(message, webhook_url=DEFAULT_WEBHOOK_URL):
+    return post_webhook(webhook_url, message)
+
+# ==================== 探测引擎 ====================
+# 所有主机的探测在同一个 selectors 事件循环中并发进行：
+#   - 优先使用无需 root 的 ICMP 数据报套接字 (SOCK_DGRAM + IPPROTO_ICMP/ICMPV6)，
+#     需要 net.ipv4.ping_group_range 包含当前用户组
+#   - 不可用时退化为 TCP connect 计时：连接建立或被 RST 拒绝都说明对端可达
+# 每个主机按 interval 间隔发送 count 个探测，超过 timeout 未回复记为丢包。
+
+DEFAULT_COUNT = 10
+DEFAULT_INTERVAL = 1.0
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_TCP_PORT = 443
+
+ICMP_ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ICMP_ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+ICMP_PROTO = {socket.AF_INET: socket.IPPROTO_ICMP, socket.AF_INET6: socket.IPPROTO_ICMPV6}
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+def open_icmp_socket(family):
+    """创建无特权 ICMP 套接字，系统不允许时返回 None"""
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM, ICMP_PROTO[family])
+    except OSError:
+        return None
+    sock.setblocking(False)
+    return sock
+
+def parse_target(text, default_port=DEFAULT_TCP_PORT):
+    """解析 host、host:port 或 [v6]:port，显式给出端口时固定使用 TCP 探测"""
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        port = rest.lstrip(':')
+    elif text.count(':') == 1:
+        host, port = text.split(':')
+    else:
+        host, port = text, ''
+    if port:
+        return host, int(port), True
+    return host, default_port, False
+
+def percentile(values, fraction):
+    """线性插值百分位数，values 需已排序"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(rtts, sent):
+    """计算 min/avg/max/p50/p95/抖动/丢包率 (毫秒)，抖动为相邻 RTT 差值的平均"""
+    ordered = sorted(rtts)
+    jitter = None
+    if len(rtts) > 1:
+        jitter = sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+    return {
+        'sent': sent,
+        'received': len(rtts),
+        'loss': (sent - len(rtts)) / sent * 100 if sent else 0.0,
+        'min': ordered[0] if ordered else None,
+        'avg': sum(ordered) / len(ordered) if ordered else None,
+        'max': ordered[-1] if ordered else None,
+        'p50': percentile(ordered, 0.5),
+        'p95': percentile(ordered, 0.95),
+        'jitter': jitter,
+    }
+
+class ProbeTarget:
+    """单个主机的探测状态"""
+
+    def __init__(self, name, port, force_tcp=False):
+        self.name = name
+        self.port = port
+        self.force_tcp = force_tcp
+        self.family = None
+        self.address = None
+        self.mode = None
+        self.sock = None            # ICMP 模式下的套接字
+        self.sent = 0
+        self.sent_at = {}           # 序号 -> 发送时的墙上时间
+        self.pending = {}           # 序号 -> (发送时间, TCP 套接字或 None)
+        self.replies = []           # (序号, RTT 毫秒)
+        self.error = None
+
+    @property
+    def rtts(self):
+        return [rtt for _, rtt in sorted(self.replies)]
+
+    def samples(self):
+        """每个已发送探测的 (时间戳, RTT 毫秒)，丢包的 RTT 为 None"""
+        replies = dict(self.replies)
+        return [(ts, replies.get(seq)) for seq, ts in sorted(self.sent_at.items())]
+
+    def result(self):
+        stats = summarize(self.rtts, self.sent)
+        label = f"{self.name}:{self.port}" if self.force_tcp else self.name
+        stats.update(host=self.name, target=label, address=self.address and self.address[0],
+                     mode=self.mode, replies=sorted(self.replies), samples=self.samples(),
+                     error=self.error)
+        return stats
+
+class ProbeEngine:
+    """在单个事件循环中并发探测多个主机"""
+
+    def __init__(self, targets, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL,
+                 timeout=DEFAULT_TIMEOUT, mode='auto'):
+        self.targets = targets
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self.mode = mode
+        self.selector = selectors.DefaultSelector()
+        self.icmp_ident = os.getpid() & 0xffff
+
+    def prepare(self, target):
+        """解析地址并选择探测方式"""
+        try:
+            info = socket.getaddrinfo(target.name, target.port, type=socket.SOCK_STREAM)[0]
+        except socket.gaierror as e:
+            target.error = f"解析失败: {e}"
+            return False
+        target.family, target.address = info[0], info[4]
+        if self.mode != 'tcp' and not target.force_tcp:
+            target.sock = open_icmp_socket(target.family)
+            if target.sock is not None:
+                target.mode = 'icmp'
+                self.selector.register(target.sock, selectors.EVENT_READ, (target, None))
+                return True
+            if self.mode == 'icmp':
+                target.error = "系统不允许无特权 ICMP (net.ipv4.ping_group_range)"
+                return False
+        target.mode = 'tcp'
+        return True
+
+    def send_probe(self, target, seq, now):
+        target.sent += 1
+        target.sent_at[seq] = time.time()
+        if target.mode == 'icmp':
+            payload = struct.pack('!d', now) + b'agsbpro-ping'
+            header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST[target.family], 0, 0, self.icmp_ident, seq)
+            checksum = icmp_checksum(header + payload) if target.family == socket.AF_INET else 0
+            packet = struct.pack('!BBHHH', ICMP_ECHO_REQUEST[target.family], 0, checksum, self.icmp_ident, seq) + payload
+            try:
+                target.sock.sendto(packet, target.address[:1] + (0,) + target.address[2:])
+                target.pending[seq] = (now, None)
+            except OSError as e:
+                target.error = str(e)
+            return
+
+        sock = socket.socket(target.family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        code = sock.connect_ex(target.address)
+        if code in (0, errno.ECONNREFUSED):
+            target.replies.append((seq, (time.monotonic() - now) * 1000))
+            sock.close()
+        elif code in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            target.pending[seq] = (now, sock)
+            self.selector.register(sock, selectors.EVENT_WRITE, (target, seq))
+        else:
+            target.error = os.strerror(code)
+            sock.close()
+
+    def handle_icmp(self, target, now):
+        while True:
+            try:
+                packet, _ = target.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                target.error = str(e)
+                return
+            if len(packet) < 8:
+                continue
+            icmp_type, _, _, _, seq = struct.unpack('!BBHHH', packet[:8])
+            if icmp_type != ICMP_ECHO_REPLY[target.family] or seq not in target.pending:
+                continue
+            sent_at, _ = target.pending.pop(seq)
+            target.replies.append((seq, (now - sent_at) * 1000))
+
+    def handle_tcp(self, target, seq, sock, now):
+        self.selector.unregister(sock)
+        code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        sent_at, _ = target.pending.pop(seq)
+        sock.close()
+        if code in (0, errno.ECONNREFUSED):
+            target.replies.append((seq, (now - sent_at) * 1000))
+
+    def expire(self, target, now):
+        for seq, (sent_at, sock) in list(target.pending.items()):
+            if now - sent_at >= self.timeout:
+                del target.pending[seq]
+                if sock is not None:
+                    self.selector.unregister(sock)
+                    sock.close()
+
+    def run(self):
+        """执行探测，返回每个主机的统计结果"""
+        active = [target for target in self.targets if self.prepare(target)]
+        start = time.monotonic()
+        # (发送时间, 主机序号, 序号)，各主机错开一点，避免同一瞬间突发
+        schedule = []
+        for index, target in enumerate(active):
+            offset = self.interval * index / max(1, len(active))
+            for seq in range(self.count):
+                schedule.append((start + offset + seq * self.interval, index, seq))
+        heapq.heapify(schedule)
+
+        try:
+            while True:
+                now = time.monotonic()
+                while schedule and schedule[0][0] <= now:
+                    _, index, seq = heapq.heappop(schedule)
+                    self.send_probe(active[index], seq, now)
+                for target in active:
+                    self.expire(target, now)
+                if not schedule and not any(target.pending for target in active):
+                    break
+
+                deadlines = [schedule[0][0]] if schedule else []
+                deadlines += [sent_at + self.timeout for target in active for sent_at, _ in target.pending.values()]
+                wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else 0.0
+                for key, _ in self.selector.select(wait):
+                    target, seq = key.data
+                    now = time.monotonic()
+                    if seq is None:
+                        self.handle_icmp(target, now)
+                    else:
+                        self.handle_tcp(target, seq, key.fileobj, now)
+        finally:
+            for target in active:
+                if target.sock is not None:
+                    self.selector.unregister(target.sock)
+                    target.sock.close()
+            self.selector.close()
+        return [target.result() for target in self.targets]
+
+def probe_hosts(hosts, count=DEFAULT_COUNT, interval=DEFAULT_INTERVAL, timeout=DEFAULT_TIMEOUT,
+                mode='auto', port=DEFAULT_TCP_PORT):
+    """并发探测一组主机，返回与 hosts 顺序一致的统计结果"""
+    targets = [ProbeTarget(*parse_target(host, port)) for host in hosts]
+    return ProbeEngine(targets, count, interval, timeout, mode).run()
+
+def format_ms(value):
+    return "-" if value is None else f"{value:.2f}"
+
+def print_probe_result(stats):
+    print(f"{strftime('%Y-%m-%d %H:%M:%S')} {stats['host']} ({stats['address'] or '-'}, {stats['mode'] or '-'}):")
+    if stats['error'] and not stats['received']:
+        print(f"  探测失败: {stats['error']}\n")
+        return
+    print(f"  发送 {stats['sent']}，收到 {stats['received']}，丢包 {stats['loss']:.0f}%")
+    print(f"  延迟 min/avg/max = {format_ms(stats['min'])}/{format_ms(stats['avg'])}/{format_ms(stats['max'])} 毫秒")
+    print(f"  p50/p95 = {format_ms(stats['p50'])}/{format_ms(stats['p95'])} 毫秒，抖动 {format_ms(stats['jitter'])} 毫秒\n")
+
+# ==================== 时间序列存储 ====================
+# 探测结果写入 SQLite：原始样本短期保留，同时按分钟/小时汇总。
+# 汇总行保存对数分桶直方图（相邻桶相差 5%），不同时间段的直方图可以直接相加，
+# 因此任意时间窗口的百分位都能由汇总行合并得到，相对误差约 2.5%。
+
+DEFAULT_DB = "/opt/shell/ping.db"
+DEFAULT_RETENTION = {'raw': 2, 'minute': 14, 'hour': 400}   # 保留天数
+HIST_BASE = 1.05
+HIST_MIN_MS = 0.01
+ROLLUP_SECONDS = {'minute': 60, 'hour': 3600}
+
+def hist_index(rtt):
+    return max(0, int(math.log(max(rtt, HIST_MIN_MS) / HIST_MIN_MS) / math.log(HIST_BASE)))
+
+def hist_value(index):
+    """桶的代表值取桶内几何中点"""
+    return HIST_MIN_MS * HIST_BASE ** (index + 0.5)
+
+def pack_hist(hist):
+    return b"".join(struct.pack('<HI', index, count) for index, count in sorted(hist.items()))
+
+def unpack_hist(blob, into=None):
+    hist = into if into is not None else {}
+    for index, count in struct.iter_unpack('<HI', blob):
+        hist[index] = hist.get(index, 0) + count
+    return hist
+
+def hist_percentile(hist, fraction, low=None, high=None):
+    total = sum(hist.values())
+    if not total:
+        return None
+    rank = fraction * (total - 1)
+    seen = 0
+    for index in sorted(hist):
+        seen += hist[index]
+        if seen > rank:
+            value = hist_value(index)
+            if low is not None:
+                value = max(low, value)
+            if high is not None:
+                value = min(high, value)
+            return value
+    return high
+
+def parse_duration(text):
+    """解析 30m、24h、7d 形式的时长，返回秒"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def parse_time(text):
+    """解析时间戳或 "YYYY-MM-DD[ HH:MM[:SS]]" 形式的本地时间"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间: {text}")
+
+class TimeSeriesStore:
+    """探测结果的 SQLite 存储，写入时同步更新分钟/小时汇总并按保留策略清理"""
+
+    def __init__(self, path=DEFAULT_DB, retention=None):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS hosts (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS samples (
+                host_id INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                rtt REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_samples_host_ts ON samples(host_id, ts);
+            CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples(ts);
+            CREATE TABLE IF NOT EXISTS proxy_phases (
+                host_id INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                dns REAL,
+                connect REAL,
+                tls REAL,
+                ttfb REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_proxy_phases_host_ts ON proxy_phases(host_id, ts);
+        """)
+        for level in ROLLUP_SECONDS:
+            self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS rollup_{level} (
+                    host_id INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    sent INTEGER NOT NULL,
+                    received INTEGER NOT NULL,
+                    rtt_sum REAL NOT NULL,
+                    rtt_min REAL,
+                    rtt_max REAL,
+                    hist BLOB NOT NULL,
+                    PRIMARY KEY (host_id, bucket)
+                ) WITHOUT ROWID
+            """)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def host_id(self, name, create=True):
+        row = self.db.execute("SELECT id FROM hosts WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row[0]
+        if not create:
+            return None
+        return self.db.execute("INSERT INTO hosts (name) VALUES (?)", (name,)).lastrowid
+
+    def record(self, results):
+        """写入一轮探测结果（probe_hosts / probe_proxies 的返回值）"""
+        with self.db:
+            for stats in results:
+                samples = stats.get('samples') or []
+                if not samples:
+                    continue
+                host_id = self.host_id(stats['target'])
+                self.db.executemany("INSERT INTO samples (host_id, ts, rtt) VALUES (?, ?, ?)",
+                                    [(host_id, ts, rtt) for ts, rtt in samples])
+                if stats.get('phase_samples'):
+                    self.db.executemany("INSERT INTO proxy_phases (host_id, ts, dns, connect, tls, ttfb) "
+                                        "VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(host_id,) + row for row in stats['phase_samples']])
+                for level, width in ROLLUP_SECONDS.items():
+                    groups = {}
+                    for ts, rtt in samples:
+                        groups.setdefault(int(ts // width * width), []).append(rtt)
+                    for bucket, rtts in groups.items():
+                        self.merge_rollup(level, host_id, bucket, rtts)
+            self.prune()
+
+    def merge_rollup(self, level, host_id, bucket, rtts):
+        received = [rtt for rtt in rtts if rtt is not None]
+        row = self.db.execute(
+            f"SELECT sent, received, rtt_sum, rtt_min, rtt_max, hist FROM rollup_{level} "
+            f"WHERE host_id = ? AND bucket = ?", (host_id, bucket)).fetchone()
+        sent, count, total, low, high, hist = row if row else (0, 0, 0.0, None, None, b"")
+        hist = unpack_hist(hist)
+        for rtt in received:
+            index = hist_index(rtt)
+            hist[index] = hist.get(index, 0) + 1
+        if received:
+            low = min(received) if low is None else min(low, min(received))
+            high = max(received) if high is None else max(high, max(received))
+        self.db.execute(
+            f"INSERT OR REPLACE INTO rollup_{level} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (host_id, bucket, sent + len(rtts), count + len(received), total + sum(received),
+             low, high, pack_hist(hist)))
+
+    def prune(self, now=None):
+        """按保留天数删除过期的原始样本和汇总行"""
+        now = time.time() if now is None else now
+        self.db.execute("DELETE FROM samples WHERE ts < ?", (now - self.retention['raw'] * 86400,))
+        self.db.execute("DELETE FROM proxy_phases WHERE ts < ?", (now - self.retention['raw'] * 86400,))
+        for level in ROLLUP_SECONDS:
+            self.db.execute(f"DELETE FROM rollup_{level} WHERE bucket < ?",
+                            (now - self.retention[level] * 86400,))
+
+    def resolution_for(self, start, now=None):
+        """选择能覆盖起始时间的最细粒度数据源"""
+        now = time.time() if now is None else now
+        for source in ('raw', 'minute', 'hour'):
+            if start >= now - self.retention[source] * 86400:
+                return source
+        return 'hour'
+
+    def query(self, host, start, end, percentiles=(50, 95, 99), now=None):
+        """返回时间窗口内某主机的丢包率与延迟百分位 (毫秒)"""
+        host_id = self.host_id(host, create=False)
+        source = self.resolution_for(start, now)
+        result = {'host': host, 'start': start, 'end': end, 'source': source,
+                  'sent': 0, 'received': 0, 'loss': None, 'min': None, 'avg': None, 'max': None,
+                  'percentiles': {p: None for p in percentiles}}
+        if host_id is None:
+            return result
+
+        if source == 'raw':
+            rows = self.db.execute("SELECT rtt FROM samples WHERE host_id = ? AND ts >= ? AND ts < ?",
+                                   (host_id, start, end)).fetchall()
+            rtts = sorted(row[0] for row in rows if row[0] is not None)
+            result.update(sent=len(rows), received=len(rtts))
+            if rtts:
+                result.update(min=rtts[0], max=rtts[-1], avg=sum(rtts) / len(rtts))
+                result['percentiles'] = {p: percentile(rtts, p / 100) for p in percentiles}
+        else:
+            width = ROLLUP_SECONDS[source]
+            rows = self.db.execute(
+                f"SELECT sent, received, rtt_sum, rtt_min, rtt_max, hist FROM rollup_{source} "
+                f"WHERE host_id = ? AND bucket >= ? AND bucket < ?",
+                (host_id, int(start // width * width), end)).fetchall()
+            hist = {}
+            total = 0.0
+            for sent, received, rtt_sum, low, high, blob in rows:
+                result['sent'] += sent
+                result['received'] += received
+                total += rtt_sum
+                if low is not None:
+                    result['min'] = low if result['min'] is None else min(result['min'], low)
+                    result['max'] = high if result['max'] is None else max(result['max'], high)
+                unpack_hist(blob, hist)
+            if result['received']:
+                result['avg'] = total / result['received']
+                result['percentiles'] = {p: hist_percentile(hist, p / 100, result['min'], result['max'])
+                                         for p in percentiles}
+        if result['sent']:
+            result['loss'] = (result['sent'] - result['received']) / result['sent'] * 100
+        return result
+
+def print_query_result(result):
+    source_names = {'raw': "原始样本", 'minute': "分钟汇总", 'hour': "小时汇总"}
+    print(f"{result['host']}  {strftime('%Y-%m-%d %H:%M', time.localtime(result['start']))} ~ "
+          f"{strftime('%Y-%m-%d %H:%M', time.localtime(result['end']))} ({source_names[result['source']]})")
+    if not result['sent']:
+        print("  该时间段没有数据")
+        return
+    print(f"  探测 {result['sent']}，收到 {result['received']}，丢包 {result['loss']:.1f}%")
+    print(f"  延迟 min/avg/max = {format_ms(result['min'])}/{format_ms(result['avg'])}/{format_ms(result['max'])} 毫秒")
+    print("  " + "，".join(f"p{p} = {format_ms(value)}" for p, value in result['percentiles'].items()) + " 毫秒")
+
+def run_query(argv):
+    parser = argparse.ArgumentParser(prog="ping.py query", description="查询某主机在一段时间内的延迟百分位")
+    parser.add_argument('host', help="探测时使用的主机名")
+    parser.add_argument('--since', default='24h', help="查询最近多长时间，如 30m、24h、7d (默认 24h)")
+    parser.add_argument('--from', dest='start', help="起始时间，如 \"2024-05-01 08:00\"，优先于 --since")
+    parser.add_argument('--to', dest='end', help="结束时间，默认为现在")
+    parser.add_argument('-P', '--percentiles', default='50,95,99', help="百分位列表，逗号分隔")
+    parser.add_argument('--db', default=DEFAULT_DB, help="数据库路径")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出")
+    args = parser.parse_args(argv)
+
+    try:
+        end = parse_time(args.end) if args.end else time.time()
+        start = parse_time(args.start) if args.start else end - parse_duration(args.since)
+        percentiles = [float(p) if '.' in p else int(p) for p in args.percentiles.split(',') if p.strip()]
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    if not os.path.exists(args.db):
+        print(f"❌ 数据库不存在: {args.db}")
+        return False
+
+    store = TimeSeriesStore(args.db)
+    try:
+        result = store.query(args.host, start, end, percentiles)
+    finally:
+        store.close()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_query_result(result)
+    return True
+
+# ==================== 路径诊断 (MTR) ====================
+# 与 tracepath 相同，不需要 root：每个 TTL 一个 UDP 套接字并开启 IP_RECVERR，
+# 路由器返回的 ICMP 超时/不可达报文从套接字的错误队列读出，其中带有回报路由器的地址。
+# 所有 TTL 在同一事件循环中同时发送，共发 count 轮；原始目的端口编码了轮次，
+# 错误队列返回的 msg_name 即原始目的地址，据此把回报对应到具体的探测。
+
+TRACE_BASE_PORT = 33434
+TRACE_MAX_HOPS = 30
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+IPV6_RECVERR = getattr(socket, 'IPV6_RECVERR', 25)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+SO_EE_ORIGIN_ICMP, SO_EE_ORIGIN_ICMP6 = 2, 3
+ICMP_TIME_EXCEEDED = {socket.AF_INET: 11, socket.AF_INET6: 3}
+ICMP_UNREACH = {socket.AF_INET: 3, socket.AF_INET6: 1}
+ICMP_PORT_UNREACH = {socket.AF_INET: 3, socket.AF_INET6: 4}
+
+def open_trace_socket(family, ttl):
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+        sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+    else:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+        sock.setsockopt(socket.IPPROTO_IPV6, IPV6_RECVERR, 1)
+    return sock
+
+def parse_extended_error(family, data):
+    """解析 sock_extended_err，返回 (ICMP 类型, 代码, 回报地址)"""
+    if len(data) < 16:
+        return None
+    _, origin, icmp_type, code, _, _, _ = struct.unpack('=IBBBBII', data[:16])
+    if origin not in (SO_EE_ORIGIN_ICMP, SO_EE_ORIGIN_ICMP6):
+        return None
+    offender = data[16:]
+    if family == socket.AF_INET and len(offender) >= 8:
+        address = socket.inet_ntop(socket.AF_INET, offender[4:8])
+    elif family == socket.AF_INET6 and len(offender) >= 24:
+        address = socket.inet_ntop(socket.AF_INET6, offender[8:24])
+    else:
+        address = None
+    return icmp_type, code, address
+
+def trace_path(host, count=5, interval=0.3, timeout=2.0, max_hops=TRACE_MAX_HOPS):
+    """MTR 式路径诊断，返回每一跳的地址、丢包率和延迟统计"""
+    try:
+        info = socket.getaddrinfo(host, TRACE_BASE_PORT, type=socket.SOCK_DGRAM)[0]
+    except socket.gaierror as e:
+        return {'host': host, 'address': None, 'reached': False, 'hops': [], 'error': f"解析失败: {e}"}
+    family, destination = info[0], info[4][0]
+
+    selector = selectors.DefaultSelector()
+    sockets = {}
+    sent = {}           # (ttl, 轮次) -> 发送时间
+    replies = {}        # ttl -> [(轮次, 地址, RTT)]
+    destination_ttl = None
+    error = None
+    start = time.monotonic()
+    rounds = [start + index * interval for index in range(count)]
+    next_round = 0
+
+    try:
+        for ttl in range(1, max_hops + 1):
+            sock = open_trace_socket(family, ttl)
+            sockets[ttl] = sock
+            selector.register(sock, selectors.EVENT_READ, ttl)
+
+        while True:
+            now = time.monotonic()
+            if next_round < count and rounds[next_round] <= now:
+                # 已知目的地所在的跳数后，后续轮次不再探测更远的 TTL
+                for ttl in range(1, (destination_ttl or max_hops) + 1):
+                    port = TRACE_BASE_PORT + next_round * max_hops + ttl
+                    try:
+                        sockets[ttl].sendto(b'agsbpro-trace', (destination, port))
+                        sent[(ttl, next_round)] = now
+                    except OSError as e:
+                        error = str(e)
+                next_round += 1
+
+            outstanding = [at for key, at in sent.items() if now - at < timeout
+                           and not any(r[0] == key[1] for r in replies.get(key[0], ()))]
+            if next_round >= count and not outstanding:
+                break
+            deadlines = ([rounds[next_round]] if next_round < count else []) + [at + timeout for at in outstanding]
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else 0.0
+
+            for key, _ in selector.select(wait):
+                ttl = key.data
+                while True:
+                    try:
+                        _, ancdata, _, original = key.fileobj.recvmsg(512, 512, MSG_ERRQUEUE)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+                    received_at = time.monotonic()
+                    round_index = (original[1] - TRACE_BASE_PORT - ttl) // max_hops if original else None
+                    if (ttl, round_index) not in sent:
+                        continue
+                    for _, _, data in ancdata:
+                        parsed = parse_extended_error(family, data)
+                        if parsed is None:
+                            continue
+                        icmp_type, code, address = parsed
+                        reached = address == destination or (
+                            icmp_type == ICMP_UNREACH[family] and code == ICMP_PORT_UNREACH[family])
+                        if icmp_type != ICMP_TIME_EXCEEDED[family] and not reached and icmp_type != ICMP_UNREACH[family]:
+                            continue
+                        replies.setdefault(ttl, []).append(
+                            (round_index, address, (received_at - sent[(ttl, round_index)]) * 1000))
+                        if reached and (destination_ttl is None or ttl < destination_ttl):
+                            destination_ttl = ttl
+    except OSError as e:
+        error = str(e)
+    finally:
+        for sock in sockets.values():
+            selector.unregister(sock)
+            sock.close()
+        selector.close()
+
+    last_ttl = destination_ttl or max([ttl for ttl in replies] or [0])
+    # 未到达目的地时多显示一跳，表示此后全部无响应
+    if destination_ttl is None and last_ttl < max_hops:
+        last_ttl += 1
+    hops = []
+    for ttl in range(1, last_ttl + 1):
+        hop_replies = replies.get(ttl, [])
+        rtts = [rtt for _, _, rtt in sorted(hop_replies)]
+        addresses = [address for _, address, _ in hop_replies if address]
+        hop = summarize(rtts, sum(1 for key in sent if key[0] == ttl))
+        hop.update(ttl=ttl, address=max(set(addresses), key=addresses.count) if addresses else None)
+        hops.append(hop)
+    return {'host': host, 'address': destination, 'reached': destination_ttl is not None,
+            'hops': hops, 'error': error}
+
+def format_trace(trace):
+    """把路径诊断结果格式化为适合放进告警消息的文本表格"""
+    if not trace['hops']:
+        return f"  路径诊断失败: {trace['error'] or '无响应'}"
+    lines = [f"  路径诊断 → {trace['address']}{'' if trace['reached'] else ' (未到达)'}",
+             f"  {'跳':>2} {'地址':<24}{'丢包':>6}{'平均':>9}{'最差':>9}"]
+    for hop in trace['hops']:
+        lines.append(f"  {hop['ttl']:>3} {hop['address'] or '*':<26}{hop['loss']:>5.0f}%"
+                     f"{format_ms(hop['avg']):>10}{format_ms(hop['max']):>10}")
+    return "\n".join(lines)
+
+def run_trace(argv):
+    parser = argparse.ArgumentParser(prog="ping.py trace", description="MTR 式路径诊断")
+    parser.add_argument('host', help="目标主机")
+    parser.add_argument('-c', '--count', type=int, default=5, help="每一跳的探测次数")
+    parser.add_argument('-i', '--interval', type=float, default=0.3, help="两轮探测的间隔 (秒)")
+    parser.add_argument('-W', '--timeout', type=float, default=2.0, help="单次探测超时 (秒)")
+    parser.add_argument('-m', '--max-hops', type=int, default=TRACE_MAX_HOPS, help="最大跳数")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出")
+    args = parser.parse_args(argv)
+    trace = trace_path(args.host, max(1, args.count), max(0.01, args.interval), args.timeout,
+                       min(64, max(1, args.max_hops)))
+    if args.json:
+        print(json.dumps(trace, ensure_ascii=False))
+    else:
+        print(f"{strftime('%Y-%m-%d %H:%M:%S')} {args.host}")
+        print(format_trace(trace))
+    return bool(trace['hops'])
+
+# ==================== 经代理的端到端延迟 ====================
+# ICMP 只反映到公网主机的链路，用户实际体验取决于经 hysteria2 / ArgoSB 节点访问目标的耗时。
+# proxy 子命令为 allnodes.txt / hysteria2-multi-port-links.txt 中的每个节点启动本地
+# sing-box SOCKS5 入站（也可用 --socks/--http 直接指定已有的客户端端口），
+# 每轮新建连接请求目标 URL，分阶段计时：
+#   DNS    经代理向 --dns 发起 DNS-over-TCP 查询 (--dns remote 时交给代理解析，不单独计时)
+#   连接   SOCKS5 / HTTP CONNECT 建立到目标 IP 的隧道
+#   TLS    与目标完成 TLS 握手 (https 目标)
+#   首字节 发出 GET 到收到第一个响应字节
+# 节点之间并发，总耗时以 proxy:<节点名> 写入探测数据库，可直接用 query 子命令查询；
+# 各阶段耗时另存 proxy_phases 表。
+
+DEFAULT_PROXY_TARGET = "https://www.gstatic.com/generate_204"
+DEFAULT_PROXY_DNS = "1.1.1.1"
+DEFAULT_PROXY_COUNT = 3
+DEFAULT_PROXY_TIMEOUT = 10.0
+DEFAULT_NODE_FILES = [os.path.expanduser("~/.agsb/allnodes.txt"),
+                      "/root/.hysteria2/hysteria2-multi-port-links.txt"]
+PROXY_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'total')
+PROXY_PHASE_LABELS = {'dns': "DNS", 'connect': "连接", 'tls': "TLS", 'ttfb': "首字节", 'total': "总耗时"}
+
+def import_shared_utils():
+    """节点链接解析与 sing-box 客户端配置复用 shared_utils，仅 proxy 子命令需要"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import shared_utils
+    return shared_utils
+
+def parse_proxy_endpoint(text, scheme):
+    """解析 host:port[=名称]，返回代理端点描述"""
+    address, _, name = text.partition('=')
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"代理地址格式应为 host:port[=名称]: {text}")
+    host = host.strip('[]')
+    return {'name': name or address, 'scheme': scheme, 'host': host, 'port': int(port)}
+
+def is_ip_address(text):
+    try:
+        ipaddress.ip_address(text)
+        return True
+    except ValueError:
+        return False
+
+def elapsed_ms(since):
+    return (time.perf_counter() - since) * 1000
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise RuntimeError("代理提前关闭了连接")
+        data += chunk
+    return data
+
+def proxy_connect(endpoint, host, port, timeout=DEFAULT_PROXY_TIMEOUT):
+    """经 SOCKS5 或 HTTP CONNECT 代理建立到 host:port 的隧道，返回套接字"""
+    sock = socket.create_connection((endpoint['host'], endpoint['port']), timeout=timeout)
+    try:
+        if endpoint['scheme'] == 'socks5':
+            sock.sendall(b"\x05\x01\x00")
+            if recv_exact(sock, 2) != b"\x05\x00":
+                raise RuntimeError("SOCKS5 握手被拒绝")
+            if is_ip_address(host):
+                family = socket.AF_INET6 if ':' in host else socket.AF_INET
+                address = (b"\x04" if family == socket.AF_INET6 else b"\x01") + socket.inet_pton(family, host)
+            else:
+                encoded = host.encode('idna')
+                address = b"\x03" + bytes([len(encoded)]) + encoded
+            sock.sendall(b"\x05\x01\x00" + address + port.to_bytes(2, 'big'))
+            reply = recv_exact(sock, 4)
+            if reply[1] != 0:
+                raise RuntimeError(f"SOCKS5 连接失败 (代码 {reply[1]})")
+            # 跳过代理回报的绑定地址
+            bound = {1: 4, 4: 16}.get(reply[3])
+            recv_exact(sock, (bound if bound else recv_exact(sock, 1)[0]) + 2)
+        else:
+            authority = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+            sock.sendall(f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n\r\n".encode())
+            response = b""
+            while b"\r\n\r\n" not in response:
+                chunk = sock.recv(1024)
+                if not chunk or len(response) > 8192:
+                    raise RuntimeError("HTTP 代理响应不完整")
+                response += chunk
+            status_line = response.split(b"\r\n", 1)[0].decode('latin-1')
+            if status_line.split()[1:2] != ['200']:
+                raise RuntimeError(f"HTTP 代理拒绝 CONNECT: {status_line}")
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+def build_dns_query(name, query_id):
+    """构造 A 记录查询报文"""
+    question = b"".join(bytes([len(label)]) + label for label in name.rstrip('.').encode('idna').split(b'.'))
+    return struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + question + b"\x00" + struct.pack('!HH', 1, 1)
+
+def skip_dns_name(data, offset):
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
 
-def ping_host(host):
-    print(f"{strftime('%Y-%m-%d %H:%M:%S')} 正在Ping {host}:\n")
-    result = []
-    timeout_count = 0
+def parse_dns_answer(data, query_id):
+    """从应答中取出第一条 A 记录"""
+    if len(data) < 12:
+        raise RuntimeError("DNS 应答过短")
+    answer_id, flags, questions, answers = struct.unpack('!HHHH', data[:8])
+    if answer_id != query_id:
+        raise RuntimeError("DNS 应答 ID 不匹配")
+    if flags & 0x000F:
+        raise RuntimeError(f"DNS 查询失败 (rcode {flags & 0x000F})")
+    offset = 12
+    for _ in range(questions):
+        offset = skip_dns_name(data, offset) + 4
+    for _ in range(answers):
+        offset = skip_dns_name(data, offset)
+        record_type, _, _, length = struct.unpack('!HHIH', data[offset:offset + 10])
+        offset += 10
+        if record_type == 1 and length == 4:
+            return socket.inet_ntoa(data[offset:offset + 4])
+        offset += length
+    raise RuntimeError("DNS 应答中没有 A 记录")
 
-    for i in range(10):
+def resolve_through_proxy(endpoint, name, dns_server, timeout=DEFAULT_PROXY_TIMEOUT):
+    """经代理向 dns_server 发起 DNS-over-TCP 查询，避免本机 DNS 影响结果"""
+    host, port = parse_target(dns_server, 53)[:2]
+    query_id = int.from_bytes(os.urandom(2), 'big')
+    query = build_dns_query(name, query_id)
+    with proxy_connect(endpoint, host, port, timeout) as sock:
+        sock.sendall(struct.pack('!H', len(query)) + query)
+        length = struct.unpack('!H', recv_exact(sock, 2))[0]
+        return parse_dns_answer(recv_exact(sock, length), query_id)
+
+def measure_through_proxy(endpoint, target, dns_server=DEFAULT_PROXY_DNS, timeout=DEFAULT_PROXY_TIMEOUT,
+                          insecure=False):
+    """经代理请求一次目标 URL，返回 (各阶段耗时 (毫秒), HTTP 状态码)"""
+    url = urlsplit(target)
+    host = url.hostname
+    use_tls = url.scheme == 'https'
+    port = url.port or (443 if use_tls else 80)
+    phases = dict.fromkeys(PROXY_PHASES)
+
+    started = time.perf_counter()
+    address = host
+    if dns_server and not is_ip_address(host):
+        address = resolve_through_proxy(endpoint, host, dns_server, timeout)
+        phases['dns'] = elapsed_ms(started)
+
+    mark = time.perf_counter()
+    sock = proxy_connect(endpoint, address, port, timeout)
+    try:
+        phases['connect'] = elapsed_ms(mark)
+        if use_tls:
+            mark = time.perf_counter()
+            context = ssl.create_default_context()
+            if insecure:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=host)
+            phases['tls'] = elapsed_ms(mark)
+        path = (url.path or '/') + (f"?{url.query}" if url.query else '')
+        host_header = host if url.port is None else f"{host}:{port}"
+        mark = time.perf_counter()
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: ping.py\r\n"
+                     f"Accept: */*\r\nConnection: close\r\n\r\n".encode())
+        first = sock.recv(4096)
+        if not first:
+            raise RuntimeError("目标在响应前关闭了连接")
+        phases['ttfb'] = elapsed_ms(mark)
+        phases['total'] = elapsed_ms(started)
+    finally:
+        sock.close()
+    status_line = first.split(b"\r\n", 1)[0].split()
+    status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else None
+    return phases, status
+
+def probe_proxy_node(endpoint, target=DEFAULT_PROXY_TARGET, count=DEFAULT_PROXY_COUNT, interval=DEFAULT_INTERVAL,
+                     timeout=DEFAULT_PROXY_TIMEOUT, dns_server=DEFAULT_PROXY_DNS, insecure=False):
+    """对单个代理端点串行请求 count 次 (每次新建连接)，返回与 probe_hosts 相同结构的统计"""
+    totals, samples, replies, phase_samples = [], [], [], []
+    error = status = None
+    for seq in range(count):
+        if seq:
+            time.sleep(interval)
+        ts = time.time()
+        try:
+            phases, status = measure_through_proxy(endpoint, target, dns_server, timeout, insecure)
+        except (OSError, RuntimeError, UnicodeError) as e:
+            error = str(e) or e.__class__.__name__
+            samples.append((ts, None))
+            continue
+        totals.append(phases['total'])
+        samples.append((ts, phases['total']))
+        replies.append((seq + 1, phases['total']))
+        phase_samples.append((ts,) + tuple(phases[phase] for phase in PROXY_PHASES[:-1]))
+    stats = summarize(totals, count)
+    medians = {}
+    for index, phase in enumerate(PROXY_PHASES[:-1], start=1):
+        medians[phase] = percentile(sorted(row[index] for row in phase_samples if row[index] is not None), 0.5)
+    medians['total'] = stats['p50']
+    stats.update(host=endpoint['name'], target=f"proxy:{endpoint['name']}",
+                 address=f"{endpoint['host']}:{endpoint['port']}", mode=endpoint['scheme'],
+                 replies=replies, samples=samples, phase_samples=phase_samples, phases=medians,
+                 status=status, error=error)
+    return stats
+
+def probe_proxies(endpoints, workers=16, **options):
+    """各节点并发探测，返回与 endpoints 顺序一致的统计结果"""
+    if not endpoints:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(endpoints)))) as pool:
+        return list(pool.map(lambda endpoint: probe_proxy_node(endpoint, **options), endpoints))
+
+def print_proxy_result(stats):
+    print(f"{strftime('%Y-%m-%d %H:%M:%S')} {stats['host']} (经 {stats['mode']} {stats['address']}):")
+    if not stats['received']:
+        print(f"  请求失败: {stats['error']}\n")
+        return
+    print("  " + " / ".join(f"{PROXY_PHASE_LABELS[phase]} {format_ms(stats['phases'][phase])}"
+                            for phase in PROXY_PHASES) + " 毫秒 (中位数)")
+    print(f"  请求 {stats['sent']}，成功 {stats['received']}，失败 {stats['loss']:.0f}%，"
+          f"HTTP {stats['status'] or '-'}")
+    print(f"  总耗时 min/avg/max = {format_ms(stats['min'])}/{format_ms(stats['avg'])}/{format_ms(stats['max'])} 毫秒，"
+          f"p95 = {format_ms(stats['p95'])} 毫秒" + (f"\n  最近错误: {stats['error']}" if stats['error'] else "") + "\n")
+
+def find_singbox(path=None):
+    """依次尝试 --singbox、PATH 与 ArgoSB 安装目录中的 sing-box"""
+    for candidate in (path, shutil.which('sing-box'), os.path.expanduser("~/.agsb/sing-box")):
+        if candidate and os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+def unique_node_names(nodes):
+    """节点名用作数据库中的主机名，重名时追加序号"""
+    seen = {}
+    for node in nodes:
+        name = node['ps']
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            node['ps'] = f"{name}#{seen[name]}"
+    return nodes
+
+def run_proxy(argv):
+    parser = argparse.ArgumentParser(prog="ping.py proxy", description="经已部署节点测量端到端访问延迟")
+    parser.add_argument('--nodes', action='append', metavar='FILE',
+                        help=f"节点链接文件，可重复 (默认 {', '.join(DEFAULT_NODE_FILES)})")
+    parser.add_argument('--socks', action='append', default=[], metavar='HOST:PORT[=NAME]',
+                        help="直接使用已有的 SOCKS5 客户端端口，可重复")
+    parser.add_argument('--http', action='append', default=[], metavar='HOST:PORT[=NAME]',
+                        help="直接使用已有的 HTTP 代理端口，可重复")
+    parser.add_argument('--target', default=DEFAULT_PROXY_TARGET, help="请求的目标 URL")
+    parser.add_argument('--dns', default=DEFAULT_PROXY_DNS,
+                        help="经代理查询的 DNS 服务器，remote 表示交给代理解析")
+    parser.add_argument('-k', '--insecure', action='store_true', help="不校验目标证书")
+    parser.add_argument('-c', '--count', type=int, default=DEFAULT_PROXY_COUNT, help="每个节点的请求次数")
+    parser.add_argument('-i', '--interval', type=float, default=DEFAULT_INTERVAL, help="同一节点两次请求的间隔 (秒)")
+    parser.add_argument('-W', '--timeout', type=float, default=DEFAULT_PROXY_TIMEOUT, help="单次请求超时 (秒)")
+    parser.add_argument('-j', '--workers', type=int, default=16, help="同时探测的节点数")
+    parser.add_argument('--singbox', help="sing-box 可执行文件路径")
+    parser.add_argument('--db', default=DEFAULT_DB, help="探测数据库路径")
+    parser.add_argument('--no-store', action='store_true', help="不写入探测数据库")
+    parser.add_argument('--loop', type=float, metavar='SECONDS', help="常驻运行，每隔指定秒数探测一轮")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出")
+    args = parser.parse_args(argv)
+
+    try:
+        endpoints = [parse_proxy_endpoint(text, 'socks5') for text in args.socks]
+        endpoints += [parse_proxy_endpoint(text, 'http') for text in args.http]
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    nodes = []
+    if not endpoints:
+        shared_utils = import_shared_utils()
+        for path in args.nodes or DEFAULT_NODE_FILES:
+            nodes.extend(shared_utils.load_share_links(path))
+        if not nodes:
+            print("❌ 没有找到可用的节点链接，请用 --nodes 指定文件或用 --socks/--http 指定客户端端口")
+            return False
+        singbox_path = find_singbox(args.singbox)
+        if singbox_path is None:
+            print("❌ 找不到 sing-box，请用 --singbox 指定路径")
+            return False
+
+    store = None
+    if not args.no_store:
         try:
-            output = subprocess.check_output(f"ping -c 1 {host}", shell=True, stderr=subprocess.STDOUT)
-            lines = output.splitlines()
-            line = lines[1].decode()  # 包含ping结果的行
-            match = re.search(r'time=(\d+\.?\d*)', line)  # 在行中查找延迟信息
-            if match:
-                delay = float(match.group(1))
-                result.append((i, delay))
-                print(f"数据包 {i}，延迟 {delay} 毫秒\n")
+            store = TimeSeriesStore(args.db)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 无法打开探测数据库 {args.db}: {e}")
+    options = dict(target=args.target, count=max(1, args.count), interval=max(0.0, args.interval),
+                   timeout=args.timeout, dns_server=None if args.dns == 'remote' else args.dns,
+                   insecure=args.insecure)
+
+    def run_rounds(endpoints):
+        ok = False
+        while True:
+            started = time.monotonic()
+            results = probe_proxies(endpoints, max(1, args.workers), **options)
+            if store is not None:
+                try:
+                    store.record(results)
+                except sqlite3.Error as e:
+                    print(f"⚠️ 写入探测数据失败: {e}")
+            for stats in results:
+                if args.json:
+                    print(json.dumps({k: v for k, v in stats.items() if k not in ('samples', 'phase_samples')},
+                                     ensure_ascii=False))
+                else:
+                    print_proxy_result(stats)
+            ok = any(stats['received'] for stats in results)
+            if not args.loop:
+                return ok
+            time.sleep(max(0.0, args.loop - (time.monotonic() - started)))
+
+    try:
+        if endpoints:
+            return run_rounds(endpoints)
+        import tempfile
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                with shared_utils.singbox_node_clients(singbox_path, workdir, unique_node_names(nodes)) as clients:
+                    print(f"🚀 已为 {len(clients)} 个节点启动本地 SOCKS5 客户端")
+                    return run_rounds([{'name': name, 'scheme': 'socks5', 'host': '127.0.0.1', 'port': port}
+                                       for name, port in clients])
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                return False
+    except KeyboardInterrupt:
+        return True
+    finally:
+        if store is not None:
+            store.close()
+
+# ==================== 告警 ====================
+# 每个主机维护 正常/劣化/中断 三态状态机：变差需连续 raise_after 轮、恢复需连续
+# clear_after 轮才切换，避免链路抖动时反复告警。同一主机同一状态在 dedup_window
+# 内只告警一次，持续异常时每个窗口提醒一次。一轮产生的所有告警合并为一条消息，
+# 由令牌桶限速后交给后台线程发送（失败重试），探测不再被 webhook 阻塞。
+# 状态、去重记录、令牌桶和未发出的告警都保存在探测数据库中，跨次运行保持；
+# 已交给后台的告警在确认送达前一直留在队列里，发送失败时按原始条目重新排队。
+
+ALERT_POLICY = {
+    'raise_after': 2,          # 连续几轮异常才进入劣化/中断
+    'clear_after': 3,          # 连续几轮好转才恢复
+    'dedup_window': 1800,      # 同一告警的最短重复间隔 (秒)
+    'degraded_loss': 20,       # 丢包率 (%) 达到即为劣化
+    'down_loss': 50,           # 丢包率 (%) 达到即为中断，对应原来的 10 次中超时 5 次
+    'high_latency': 1000,      # 最大延迟 (毫秒) 超过即为劣化
+    'bucket_capacity': 5,      # 令牌桶容量 (条消息)
+    'bucket_refill': 60,       # 每多少秒补充一个令牌
+    'max_digest_lines': 20,
+    'max_pending': 200,
+    'trace': True,             # 进入劣化/中断时自动做路径诊断
+    'max_traces': 3,           # 每轮最多诊断几个主机，防止大面积中断时同时发起大量诊断
+    'trace_count': 5,          # 诊断时每一跳的探测次数
+}
+STATE_RANK = {'ok': 0, 'degraded': 1, 'down': 2}
+STATE_LABELS = {'ok': "正常", 'degraded': "劣化", 'down': "中断"}
+
+def classify(stats, policy=ALERT_POLICY):
+    """根据一轮探测结果判断主机状态，返回 (状态, 原因)"""
+    if not stats['sent']:
+        return 'down', stats['error'] or "无法探测"
+    if stats['loss'] >= policy['down_loss']:
+        return 'down', f"超时 {stats['sent'] - stats['received']}/{stats['sent']} 次"
+    if stats['max'] is not None and stats['max'] > policy['high_latency']:
+        return 'degraded', f"高延迟 {stats['max']:.1f} 毫秒"
+    if stats['loss'] >= policy['degraded_loss']:
+        return 'degraded', f"丢包 {stats['loss']:.0f}%"
+    return 'ok', f"平均延迟 {format_ms(stats['avg'])} 毫秒"
+
+class WebhookDispatcher(threading.Thread):
+    """后台发送告警消息，失败按指数退避重试；每条消息的结果放入 results，由调用方确认或重新排队"""
+
+    def __init__(self, url, attempts=3, backoff=1.0, timeout=10):
+        super().__init__(daemon=True, name='webhook')
+        self.url = url
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.results = queue.Queue()
+        self.failed = []
+        self.delivered = 0
+        self.start()
+
+    def submit(self, message, batch=None):
+        self.queue.put((batch, message))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch, message = item
+            for attempt in range(self.attempts):
+                if post_webhook(self.url, message, self.timeout):
+                    self.delivered += 1
+                    self.results.put((batch, True))
+                    break
+                if attempt + 1 < self.attempts:
+                    time.sleep(self.backoff * 2 ** attempt)
             else:
-                print(f"数据包 {i}，未找到延迟信息。\n")
-        except subprocess.CalledProcessError as e:
-            print(f"数据包 {i}，Ping失败。{e.output.decode()}")
-            timeout_count += 1
-        except Exception as e:
-            print(f"Ping过程中出现意外错误: {e}")
-            timeout_count += 1
-
-    if timeout_count >= 5:
-        send_webhook_alert(f"{hostname}:    {host}的Ping超时 {timeout_count} 次")
-
-    result.sort(key=itemgetter(1), reverse=True)
+                self.failed.append(message)
+                self.results.put((batch, False))
+
+    def close(self, timeout=30):
+        """等待队列中的消息发完，返回最终发送失败的消息"""
+        self.queue.put(None)
+        self.join(timeout)
+        return list(self.failed)
+
+class AlertManager:
+    """主机状态机 + 去重 + 令牌桶限速 + 摘要合并"""
+
+    def __init__(self, db=None, webhook_url=None, policy=None, dispatcher=None):
+        self.db = db if db is not None else sqlite3.connect(":memory:")
+        self.policy = dict(ALERT_POLICY, **(policy or {}))
+        self.dispatcher = dispatcher or WebhookDispatcher(webhook_url or DEFAULT_WEBHOOK_URL)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS alert_state (
+                host TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                candidate TEXT,
+                streak INTEGER NOT NULL DEFAULT 0,
+                since REAL NOT NULL,
+                alerted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS alert_sent (
+                host TEXT NOT NULL,
+                state TEXT NOT NULL,
+                sent_at REAL NOT NULL,
+                PRIMARY KEY (host, state)
+            );
+            CREATE TABLE IF NOT EXISTS alert_pending (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                text TEXT NOT NULL,
+                batch INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS alert_traces (
+                id INTEGER PRIMARY KEY,
+                host TEXT NOT NULL,
+                created REAL NOT NULL,
+                event TEXT NOT NULL,
+                trace TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_alert_traces_host ON alert_traces(host, created);
+            CREATE TABLE IF NOT EXISTS alert_bucket (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+        # 上次运行未确认送达的摘要 (进程中途退出) 重新排队
+        self.db.execute("UPDATE alert_pending SET batch = NULL WHERE batch IS NOT NULL")
+        self.db.commit()
+
+    def step(self, host, observed, reason, now):
+        """推进单个主机的状态机，返回 (告警文本, 类型)，类型为 raise/reminder/recover"""
+        row = self.db.execute("SELECT state, candidate, streak, since, alerted FROM alert_state WHERE host = ?",
+                              (host,)).fetchone()
+        state, candidate, streak, since, alerted = row if row else ('ok', None, 0, now, 0)
+
+        event = kind = None
+        if observed == state:
+            candidate, streak = None, 0
+        else:
+            direction = STATE_RANK[observed] > STATE_RANK[state]
+            if candidate is not None and (STATE_RANK[candidate] > STATE_RANK[state]) == direction:
+                streak += 1
+            else:
+                streak = 1
+            candidate = observed
+            needed = self.policy['raise_after'] if direction else self.policy['clear_after']
+            if streak >= needed:
+                previous, state, since = state, observed, now
+                candidate, streak = None, 0
+                if state == 'ok':
+                    if alerted:
+                        event = f"✅ {host} 已恢复{STATE_LABELS['ok']} (此前{STATE_LABELS[previous]}，{reason})"
+                        kind = 'recover'
+                    alerted = 0
+                elif self.should_send(host, state, now):
+                    event = f"{'🔴' if state == 'down' else '🟡'} {host} {STATE_LABELS[previous]}→{STATE_LABELS[state]}：{reason}"
+                    kind = 'raise'
+
+        # 持续异常时，每个去重窗口提醒一次
+        if event is None and state != 'ok' and observed != 'ok' and self.should_send(host, state, now):
+            minutes = (now - since) / 60
+            event = f"{'🔴' if state == 'down' else '🟡'} {host} 仍然{STATE_LABELS[state]} ({minutes:.0f} 分钟)：{reason}"
+            kind = 'reminder'
+
+        if event is not None and state != 'ok':
+            alerted = 1
+            self.db.execute("INSERT OR REPLACE INTO alert_sent VALUES (?, ?, ?)", (host, state, now))
+        self.db.execute("INSERT OR REPLACE INTO alert_state VALUES (?, ?, ?, ?, ?, ?)",
+                        (host, state, candidate, streak, since, alerted))
+        return event, kind
+
+    def should_send(self, host, state, now):
+        row = self.db.execute("SELECT sent_at FROM alert_sent WHERE host = ? AND state = ?", (host, state)).fetchone()
+        return row is None or now - row[0] >= self.policy['dedup_window']
+
+    def take_token(self, now):
+        """令牌桶：有令牌时消耗一个并返回 True"""
+        row = self.db.execute("SELECT tokens, updated FROM alert_bucket WHERE id = 1").fetchone()
+        capacity = self.policy['bucket_capacity']
+        tokens, updated = row if row else (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - updated) / self.policy['bucket_refill'])
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.db.execute("INSERT OR REPLACE INTO alert_bucket VALUES (1, ?, ?)", (tokens, now))
+        return allowed
+
+    def attach_traces(self, events, raised, now):
+        """对新进入劣化/中断的主机并行做路径诊断，把结果附在告警后面并保存"""
+        selected = raised[:self.policy['max_traces']]
+        with ThreadPoolExecutor(max_workers=max(1, len(selected))) as pool:
+            futures = [(index, host, pool.submit(trace_path, stats['address'] or stats['host'],
+                                                 self.policy['trace_count']))
+                       for index, host, stats in selected]
+            for index, host, future in futures:
+                try:
+                    trace = future.result()
+                except Exception as e:
+                    trace = {'host': host, 'address': None, 'reached': False, 'hops': [], 'error': str(e)}
+                events[index] += "\n" + format_trace(trace)
+                self.db.execute("INSERT INTO alert_traces (host, created, event, trace) VALUES (?, ?, ?, ?)",
+                                (host, now, events[index].split("\n", 1)[0], json.dumps(trace, ensure_ascii=False)))
+        for index, _, _ in raised[len(selected):]:
+            events[index] += "\n  (本轮诊断数已达上限，未做路径诊断)"
+
+    def queue_events(self, events, now):
+        self.db.executemany("INSERT INTO alert_pending (created, text) VALUES (?, ?)",
+                            [(now, text) for text in events])
+        # 队列过长时丢弃最旧的告警
+        self.db.execute("DELETE FROM alert_pending WHERE id NOT IN "
+                        "(SELECT id FROM alert_pending ORDER BY id DESC LIMIT ?)", (self.policy['max_pending'],))
+
+    def settle(self):
+        """处理后台发送结果：送达的摘要删除对应告警，失败的告警重新排队，返回失败的告警"""
+        failed = []
+        while True:
+            try:
+                batch, delivered = self.dispatcher.results.get_nowait()
+            except queue.Empty:
+                break
+            if delivered:
+                self.db.execute("DELETE FROM alert_pending WHERE batch = ?", (batch,))
+            else:
+                failed.extend(text for text, in self.db.execute(
+                    "SELECT text FROM alert_pending WHERE batch = ? ORDER BY id", (batch,)))
+                self.db.execute("UPDATE alert_pending SET batch = NULL WHERE batch = ?", (batch,))
+        return failed
+
+    def flush(self, now=None):
+        """把排队的告警合并为一条摘要，令牌允许时交给后台发送"""
+        now = time.time() if now is None else now
+        self.settle()
+        rows = self.db.execute("SELECT id, created, text FROM alert_pending WHERE batch IS NULL ORDER BY id").fetchall()
+        if not rows or not self.take_token(now):
+            self.db.commit()
+            return None
+        limit = self.policy['max_digest_lines']
+        lines = [f"[{strftime('%H:%M', time.localtime(created))}] {text}" for _, created, text in rows[:limit]]
+        if len(rows) > limit:
+            lines.append(f"……另有 {len(rows) - limit} 条告警")
+        message = f"{hostname} 网络告警 ({strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))})\n" + "\n".join(lines)
+        # 以本批最大 id 作为批次号，送达确认后才删除
+        batch = rows[-1][0]
+        self.db.execute("UPDATE alert_pending SET batch = ? WHERE batch IS NULL AND id <= ?", (batch, batch))
+        self.db.commit()
+        self.dispatcher.submit(message, batch)
+        return message
+
+    def process(self, results, now=None):
+        """处理一轮探测结果，返回本轮新产生的告警"""
+        now = time.time() if now is None else now
+        events = []
+        raised = []
+        for stats in results:
+            state, reason = classify(stats, self.policy)
+            host = stats.get('target', stats['host'])
+            event, kind = self.step(host, state, reason, now)
+            if event:
+                events.append(event)
+                if kind == 'raise':
+                    raised.append((len(events) - 1, host, stats))
+        if raised and self.policy['trace']:
+            self.attach_traces(events, raised, now)
+        if events:
+            self.queue_events(events, now)
+        self.flush(now)
+        return events
+
+    def close(self, timeout=30):
+        """等待后台发送完成，发送失败的告警保留在队列中，下次运行时再发"""
+        self.dispatcher.close(timeout)
+        failed = self.settle()
+        self.db.commit()
+        return failed
+
+def report_host(stats, log_path="/opt/shell/ping.txt"):
+    """保持原有的记录格式：记录最慢的 3 个包（告警由 AlertManager 负责）"""
+    host = stats['host']
+    result = sorted(stats['replies'], key=itemgetter(1), reverse=True)
     top3 = result[:3]
 
-    with open("/opt/shell/ping.txt", "a") as f:
+    with open(log_path, "a") as f:
         f.write(f"{strftime('%Y-%m-%d %H:%M:%S')} 正在Ping {host}:\n")
         for i, delay in top3:
-            f.write(f"数据包 {i}，延迟 {delay} 毫秒\n")
-            if delay > 1000:
-                send_webhook_alert(f"{hostname}:    检测到高延迟：{delay} 毫秒，主机：{host}")
+            f.write(f"数据包 {i}，延迟 {delay:.1f} 毫秒\n")
         f.write("\n")
 
-def ping_hosts(hosts):
-    for host in hosts:
-        ping_host(host)
+def ping_host(host, store=None, alerts=None, **options):
+    return ping_hosts([host], store, alerts, **options)[0]
+
+def ping_hosts(hosts, store=None, alerts=None, **options):
+    results = probe_hosts(hosts, **options)
+    if store is not None:
+        try:
+            store.record(results)
+        except sqlite3.Error as e:
+            print(f"⚠️ 写入探测数据失败: {e}")
+    if alerts is not None:
+        try:
+            for event in alerts.process(results):
+                print(f"🔔 {event}")
+        except sqlite3.Error as e:
+            print(f"⚠️ 处理告警失败: {e}")
+    for stats in results:
+        print_probe_result(stats)
+        report_host(stats)
+    return results
+
+def selftest_store(live_result):
+    """在临时数据库中检查写入、汇总、保留策略与查询"""
+    import random
+    import tempfile
+
+    checks = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = TimeSeriesStore(os.path.join(directory, "ping.db"))
+        try:
+            store.record([live_result])
+            now = time.time()
+            live = store.query(live_result['target'], now - 60, now + 1)
+            checks.append(("存储: 写入本轮探测", live['sent'] == live_result['sent'] and live['source'] == 'raw'))
+
+            # 模拟 60 天的历史数据：每 5 分钟 10 个样本，其中 1 个丢包
+            rng = random.Random(1)
+            history = {'host': 'history', 'target': 'history', 'samples': []}
+            exact = []
+            for step in range(60 * 288):
+                ts = now - 60 * 86400 + step * 300
+                for seq in range(10):
+                    rtt = None if seq == 9 else rng.lognormvariate(3, 0.4)
+                    history['samples'].append((ts + seq, rtt))
+                    if rtt is not None and ts >= now - 30 * 86400:
+                        exact.append(rtt)
+            started = time.monotonic()
+            store.record([history])
+            exact.sort()
+            result = store.query('history', now - 30 * 86400, now, (50, 95))
+            elapsed = time.monotonic() - started
+            p95_error = abs(result['percentiles'][95] - percentile(exact, 0.95)) / percentile(exact, 0.95)
+            checks.append((f"存储: 30 天窗口使用小时汇总 (p95 误差 {p95_error * 100:.1f}%)",
+                           result['source'] == 'hour' and p95_error < 0.05 and abs(result['loss'] - 10) < 0.01))
+            checks.append((f"存储: 写入+查询 {len(history['samples'])} 个样本 ({elapsed:.2f}秒)", elapsed < 30))
+
+            raw_rows = store.db.execute("SELECT MIN(ts) FROM samples").fetchone()[0]
+            minute_rows = store.db.execute("SELECT MIN(bucket) FROM rollup_minute").fetchone()[0]
+            checks.append(("存储: 保留策略", raw_rows >= now - 2 * 86400 - 1 and minute_rows >= now - 14 * 86400 - 60))
+        finally:
+            store.close()
+    return checks
+
+def selftest_alerts():
+    """用本地 webhook 替身检查状态机、去重、限速、摘要合并与重试"""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    received = []
+    failures = {'remaining': 1}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if failures['remaining'] > 0:
+                failures['remaining'] -= 1
+                self.send_response(500)
+                self.end_headers()
+                return
+            received.append(body['text']['content'])
+            payload = b'{"errcode":0}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/robot/send"
+
+    def stats(host, loss=0.0, max_rtt=20.0):
+        sent = 10
+        return {'host': host, 'target': host, 'sent': sent, 'received': round(sent * (1 - loss / 100)),
+                'loss': loss, 'max': max_rtt, 'avg': max_rtt / 2, 'error': None}
+
+    checks = []
+    dispatcher = WebhookDispatcher(url, attempts=3, backoff=0.05, timeout=2)
+    alerts = AlertManager(None, policy={'bucket_capacity': 2, 'bucket_refill': 1_000_000, 'trace': False},
+                          dispatcher=dispatcher)
+    try:
+        now = 1_000_000.0
+        # 链路抖动：异常与正常交替，不满足连续 2 轮，不告警
+        flaps = [alerts.process([stats('flap', loss=100 if i % 2 else 0)], now + i * 60) for i in range(6)]
+        checks.append(("告警: 抖动被滞后过滤", not any(flaps)))
+
+        # 三个主机同时中断：第 2 轮才告警，并合并为一条摘要
+        down = [stats(h, loss=100) for h in ('a', 'b', 'c')]
+        first = alerts.process(down, now + 600)
+        second = alerts.process(down, now + 660)
+        checks.append(("告警: 连续异常后告警", not first and len(second) == 3))
+
+        # 去重窗口内持续中断不重复告警，窗口过后提醒一次
+        repeat = alerts.process(down, now + 720)
+        reminder = alerts.process(down, now + 660 + 1800)
+        checks.append(("告警: 去重窗口与持续提醒", not repeat and len(reminder) == 3 and "仍然" in reminder[0]))
+
+        # 令牌桶容量 2 已用完：恢复告警排队，补充令牌后随下一条摘要发出
+        for i in range(3):
+            alerts.process([stats(h) for h in ('a', 'b', 'c')], now + 2500 + i * 60)
+        queued = "SELECT COUNT(*) FROM alert_pending WHERE batch IS NULL"
+        pending = alerts.db.execute(queued).fetchone()[0]
+        alerts.process([stats('d', max_rtt=1500)], now + 2700)
+        alerts.process([stats('d', max_rtt=1500)], now + 2760)
+        pending_limited = alerts.db.execute(queued).fetchone()[0]
+        alerts.flush(now + 2760 + 1_000_000)
+        checks.append(("告警: 令牌桶限速后补发", pending == 3 and pending_limited == 4
+                       and alerts.db.execute(queued).fetchone()[0] == 0))
+        failed = alerts.close(timeout=10)
+        checks.append(("告警: 送达确认后才出队",
+                       alerts.db.execute("SELECT COUNT(*) FROM alert_pending").fetchone()[0] == 0))
+
+        # 4 个主机同时中断，只对前 2 个做路径诊断 (回环地址一跳即到达)
+        traced = AlertManager(None, policy={'raise_after': 1, 'max_traces': 2, 'trace_count': 2},
+                              dispatcher=WebhookDispatcher(url, attempts=3, backoff=0.05, timeout=2))
+        outage = [dict(stats(f"lo{i}", loss=100), address='127.0.0.1') for i in range(4)]
+        started = time.monotonic()
+        events = traced.process(outage, now)
+        elapsed = time.monotonic() - started
+        rows = traced.db.execute("SELECT trace FROM alert_traces").fetchall()
+        hops = json.loads(rows[0][0])['hops'] if rows else []
+        checks.append((f"诊断: 并发上限与结果保存 ({elapsed:.2f}秒)",
+                       len(events) == 4 and sum("路径诊断 →" in e for e in events) == 2
+                       and sum("未做路径诊断" in e for e in events) == 2 and len(rows) == 2
+                       and len(hops) == 1 and hops[0]['address'] == '127.0.0.1'))
+        traced.close(timeout=10)
+
+        # 重试全部失败：原始告警重新排队，不会把摘要再包进下一条摘要
+        failures['remaining'] = 2
+        lost = AlertManager(None, policy={'raise_after': 1, 'trace_count': 1},
+                            dispatcher=WebhookDispatcher(url, attempts=2, backoff=0.05, timeout=2))
+        lost.process([dict(stats('e', loss=100), address='127.0.0.1')], now)
+        requeued = lost.close(timeout=10)
+        rows = lost.db.execute("SELECT text, batch FROM alert_pending").fetchall()
+        checks.append(("告警: 发送失败按原始告警重新排队",
+                       len(requeued) == 1 and len(rows) == 1 and rows[0][1] is None
+                       and rows[0][0] == requeued[0] and "网络告警" not in rows[0][0]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # 第一条摘要首次发送返回 500，重试后成功；共 4 条摘要
+    checks.append((f"告警: 后台发送与重试 ({len(received)} 条摘要)",
+                   not failed and len(received) == 4 and failures['remaining'] == 0))
+    checks.append(("告警: 摘要内容", "a" in received[0] and "中断" in received[0]
+                   and "已恢复" in received[2] and "劣化" in received[2] and "路径诊断" in received[3]))
+    return checks
+
+def selftest_proxy():
+    """用本地 SOCKS5 / HTTP 代理、DNS 与源站替身检查分阶段计时、并发、存储与节点链接解析"""
+    import socketserver
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    proxy_delay = 0.05   # 模拟节点到目标的建连耗时
+    origin_delay = 0.02
+
+    class Origin(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(origin_delay)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class Dns(socketserver.BaseRequestHandler):
+        """所有 A 记录查询都应答 127.0.0.1"""
+        def handle(self):
+            length = struct.unpack('!H', recv_exact(self.request, 2))[0]
+            query = recv_exact(self.request, length)
+            answer = (query[:2] + struct.pack('!HHHHH', 0x8180, 1, 1, 0, 0) + query[12:]
+                      + b"\xc0\x0c" + struct.pack('!HHIH', 1, 1, 60, 4) + socket.inet_aton('127.0.0.1'))
+            self.request.sendall(struct.pack('!H', len(answer)) + answer)
+
+    class Proxy(socketserver.BaseRequestHandler):
+        def handle(self):
+            sock = self.request
+            socks = self.server.scheme == 'socks5'
+            if socks:
+                recv_exact(sock, 3)
+                sock.sendall(b"\x05\x00")
+                header = recv_exact(sock, 4)
+                if header[3] == 1:
+                    host = socket.inet_ntoa(recv_exact(sock, 4))
+                else:
+                    host = recv_exact(sock, recv_exact(sock, 1)[0]).decode()
+                port = int.from_bytes(recv_exact(sock, 2), 'big')
+            else:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    chunk = sock.recv(1024)
+                    if not chunk:
+                        return
+                    request += chunk
+                host, _, port = request.split()[1].decode().rpartition(':')
+                port = int(port)
+            time.sleep(proxy_delay)
+            try:
+                upstream = socket.create_connection((host, port), timeout=5)
+            except OSError:
+                sock.sendall(b"\x05\x05\x00\x01" + bytes(6) if socks else b"HTTP/1.1 502 Bad Gateway\r\n\r\n")
+                return
+            sock.sendall(b"\x05\x00\x00\x01" + bytes(6) if socks else b"HTTP/1.1 200 Connection established\r\n\r\n")
+
+            def pump(source, destination):
+                try:
+                    while True:
+                        data = source.recv(65536)
+                        if not data:
+                            break
+                        destination.sendall(data)
+                    destination.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+
+            reverse = threading.Thread(target=pump, args=(upstream, sock), daemon=True)
+            reverse.start()
+            pump(sock, upstream)
+            reverse.join(5)
+            upstream.close()
+
+    def serve(server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    origin = serve(ThreadingHTTPServer(('127.0.0.1', 0), Origin))
+    dns = serve(Server(('127.0.0.1', 0), Dns))
+    proxies = []
+    for scheme in ('socks5', 'http'):
+        server = Server(('127.0.0.1', 0), Proxy)
+        server.scheme = scheme
+        proxies.append(serve(server))
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    dead_port = closed.getsockname()[1]
+    closed.close()
+
+    socks_port, http_port = (server.server_address[1] for server in proxies)
+    endpoints = [
+        {'name': 'socks', 'scheme': 'socks5', 'host': '127.0.0.1', 'port': socks_port},
+        {'name': 'http', 'scheme': 'http', 'host': '127.0.0.1', 'port': http_port},
+        {'name': 'socks-2', 'scheme': 'socks5', 'host': '127.0.0.1', 'port': socks_port},
+        {'name': 'dead', 'scheme': 'socks5', 'host': '127.0.0.1', 'port': dead_port},
+    ]
+    target = f"http://origin.test:{origin.server_address[1]}/generate_204"
+    dns_server = f"127.0.0.1:{dns.server_address[1]}"
+
+    checks = []
+    try:
+        started = time.monotonic()
+        results = probe_proxies(endpoints, target=target, count=3, interval=0, timeout=2, dns_server=dns_server)
+        elapsed = time.monotonic() - started
+        socks, http, _, dead = results
+        phases = socks['phases']
+        checks.append(("代理: SOCKS5 分阶段计时",
+                       socks['received'] == 3 and socks['status'] == 204 and phases['tls'] is None
+                       and phases['dns'] >= proxy_delay * 1000 and phases['connect'] >= proxy_delay * 1000
+                       and phases['ttfb'] >= origin_delay * 1000
+                       and phases['total'] >= phases['dns'] + phases['connect'] + phases['ttfb'] - 1))
+        checks.append(("代理: HTTP CONNECT", http['received'] == 3 and http['status'] == 204
+                       and http['phases']['connect'] >= proxy_delay * 1000))
+        checks.append(("代理: 不可用的端点计为失败", dead['received'] == 0 and dead['loss'] == 100 and dead['error']))
+        # 3 个可用节点各请求 3 次，串行耗时为各次总耗时之和
+        serial = sum(sum(rtt for _, rtt in stats['replies']) for stats in results) / 1000
+        checks.append((f"代理: 节点并发 ({elapsed:.2f}秒，串行约 {serial:.2f}秒)", elapsed < serial * 0.6))
+
+        remote = probe_proxy_node(endpoints[1], f"http://localhost:{origin.server_address[1]}/", count=1,
+                                  timeout=2, dns_server=None)
+        checks.append(("代理: 交给代理解析域名", remote['received'] == 1 and remote['phases']['dns'] is None))
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = TimeSeriesStore(os.path.join(directory, "ping.db"))
+            try:
+                store.record(results)
+                now = time.time()
+                stored = store.query('proxy:socks', now - 60, now + 1)
+                lost = store.query('proxy:dead', now - 60, now + 1)
+                phase_rows = store.db.execute(
+                    "SELECT COUNT(*) FROM proxy_phases WHERE host_id = ? AND dns IS NOT NULL",
+                    (store.host_id('proxy:socks', create=False),)).fetchone()[0]
+            finally:
+                store.close()
+        checks.append(("代理: 写入探测数据库", stored['received'] == 3 and lost['loss'] == 100 and phase_rows == 3))
+    finally:
+        for server in [origin, dns] + proxies:
+            server.shutdown()
+            server.server_close()
+
+    shared_utils = import_shared_utils()
+    base = {"ps": "node", "add": "example.com", "port": 443, "id": "1f5e4b7c-6a0d-4c3e-9f0b-2d8a7c6e5b41",
+            "host": "example.com", "tls": "tls"}
+    perf = shared_utils.SINGBOX_PERF_DEFAULTS
+    links = [shared_utils.generate_vmess_link(dict(base, path=shared_utils.ws_path_with_early_data("/p-vm", perf)))]
+    links += [shared_utils.build_protocol_link(name, base, "/p", perf)[0] for name in ('vless-grpc', 'trojan-ws')]
+    links.append("hysteria2://pass%40word@203.0.113.1:443?insecure=1&sni=203.0.113.1"
+                 "&obfs=salamander&obfs-password=secret#V2Ray-443-01")
+    with tempfile.TemporaryDirectory() as directory:
+        node_file = os.path.join(directory, "links.txt")
+        with open(node_file, "w") as f:
+            f.write("# Hysteria2 多端口配置文件\n\n" + "\n".join(links) + "\nnot-a-link\n")
+        nodes = shared_utils.load_share_links(node_file)
+    config = shared_utils.build_node_client_config(nodes, [30001, 30002, 30003, 30004])
+    outbounds = config['outbounds']
+    checks.append(("代理: 节点链接解析与客户端配置",
+                   [o['type'] for o in outbounds] == ['vmess', 'vless', 'trojan', 'hysteria2']
+                   and outbounds[0]['transport'].get('max_early_data') == 2048
+                   and not any('multiplex' in o for o in outbounds)
+                   and outbounds[1]['transport'] == {'type': 'grpc', 'service_name': 'p-vlgrpc'}
+                   and outbounds[3]['password'] == 'pass@word' and outbounds[3]['obfs']['password'] == 'secret'
+                   and [r['outbound'] for r in config['route']['rules']] == [o['tag'] for o in outbounds]))
+    return checks
+
+def selftest():
+    """针对回环地址自检探测引擎，不发送告警、不写记录文件"""
+    checks = []
+
+    stats = summarize([1.0, 3.0, 2.0, 4.0], 5)
+    checks.append(("统计计算", stats['min'] == 1.0 and stats['max'] == 4.0 and stats['avg'] == 2.5
+                   and stats['p50'] == 2.5 and stats['loss'] == 20.0 and abs(stats['jitter'] - 5 / 3) < 1e-9))
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(64)
+    open_port = listener.getsockname()[1]
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    closed_port = closed.getsockname()[1]
+    closed.close()
+
+    started = time.monotonic()
+    results = probe_hosts([f"127.0.0.1:{open_port}", f"127.0.0.1:{closed_port}", "127.0.0.1", "no-such-host.invalid"],
+                          count=5, interval=0.1, timeout=1.0)
+    elapsed = time.monotonic() - started
+    listener.close()
+    tcp_open, tcp_closed, icmp, unresolved = results
+
+    checks.append(("TCP 监听端口", tcp_open['mode'] == 'tcp' and tcp_open['received'] == 5))
+    checks.append(("TCP 拒绝连接计为可达", tcp_closed['received'] == 5 and tcp_closed['loss'] == 0))
+    checks.append((f"回环自动探测 ({icmp['mode']})", icmp['received'] == 5 and icmp['p95'] is not None))
+    checks.append(("无法解析的主机", unresolved['error'] is not None and unresolved['sent'] == 0))
+    # 4 个主机各 5 个包，串行至少需要 2 秒；并发时约为 0.5 秒
+    checks.append((f"并发执行 ({elapsed:.2f}秒)", elapsed < 1.5))
+
+    checks.extend(selftest_store(tcp_open))
+    checks.extend(selftest_alerts())
+    checks.extend(selftest_proxy())
+
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in checks)
+
 hosts = [
     'api.chandler.bet',
     'api.mapbox.com',
@@ -76,5 +1758,66 @@ hosts = [
     '8.8.8.8'
 ]
 
+def main():
+    parser = argparse.ArgumentParser(description="并发 ICMP/TCP 延迟探测")
+    parser.add_argument('hosts', nargs='*', help="目标主机，可写作 host 或 host:port (指定端口时使用 TCP)")
+    parser.add_argument('-c', '--count', type=int, default=DEFAULT_COUNT, help="每个主机的探测次数")
+    parser.add_argument('-i', '--interval', type=float, default=DEFAULT_INTERVAL, help="同一主机两次探测的间隔 (秒)")
+    parser.add_argument('-W', '--timeout', type=float, default=DEFAULT_TIMEOUT, help="单次探测超时 (秒)")
+    parser.add_argument('--mode', choices=['auto', 'icmp', 'tcp'], default='auto',
+                        help="探测方式，auto 在 ICMP 不可用时改用 TCP")
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_TCP_PORT, help="TCP 探测的默认端口")
+    parser.add_argument('--db', default=DEFAULT_DB, help="探测数据库路径")
+    parser.add_argument('--no-store', action='store_true', help="不写入探测数据库")
+    for level, days in DEFAULT_RETENTION.items():
+        parser.add_argument(f'--keep-{level}', type=float, default=days, metavar='DAYS',
+                            help=f"{'原始样本' if level == 'raw' else level + ' 汇总'}保留天数 (默认 {days})")
+    parser.add_argument('--webhook', default=DEFAULT_WEBHOOK_URL, help="告警 webhook 地址")
+    parser.add_argument('--no-alert', action='store_true', help="不发送告警")
+    parser.add_argument('--no-trace', action='store_true', help="告警时不做路径诊断")
+    parser.add_argument('--max-traces', type=int, default=ALERT_POLICY['max_traces'],
+                        help="每轮最多诊断的主机数")
+    parser.add_argument('--loop', type=float, metavar='SECONDS', help="常驻运行，每隔指定秒数探测一轮")
+    parser.add_argument('--selftest', action='store_true', help="针对回环地址自检探测引擎、存储、告警与代理测速")
+    if sys.argv[1:2] == ['query']:
+        sys.exit(0 if run_query(sys.argv[2:]) else 1)
+    if sys.argv[1:2] == ['trace']:
+        sys.exit(0 if run_trace(sys.argv[2:]) else 1)
+    if sys.argv[1:2] == ['proxy']:
+        sys.exit(0 if run_proxy(sys.argv[2:]) else 1)
+    args = parser.parse_args()
+
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    store = None
+    if not args.no_store:
+        try:
+            store = TimeSeriesStore(args.db, {'raw': args.keep_raw, 'minute': args.keep_minute,
+                                              'hour': args.keep_hour})
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 无法打开探测数据库 {args.db}: {e}")
+    alerts = None
+    if not args.no_alert:
+        alerts = AlertManager(store.db if store is not None else None, args.webhook,
+                              {'trace': not args.no_trace, 'max_traces': max(0, args.max_traces)})
+    options = dict(count=max(1, args.count), interval=max(0.01, args.interval),
+                   timeout=args.timeout, mode=args.mode, port=args.port)
+    try:
+        while True:
+            started = time.monotonic()
+            ping_hosts(args.hosts or hosts, store, alerts, **options)
+            if not args.loop:
+                break
+            time.sleep(max(0.0, args.loop - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if alerts is not None:
+            failed = alerts.close()
+            if failed:
+                print(f"⚠️ {len(failed)} 条告警发送失败，已排队等待下次发送")
+        if store is not None:
+            store.close()
+
 if __name__ == "__main__":
-    threading.Thread(target=ping_hosts, args=(hosts,)).start()
+    main()
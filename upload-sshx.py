@@ -7,27 +7,127 @@ import subprocess
 import time
 import signal
 from pathlib import Path
-import requests
 from datetime import datetime
 import tempfile
 import threading
 import queue
 import re
+import codecs
+import selectors
+
+# 导入共享工具库
+try:
+    import shared_utils
+except ImportError:
+    print("错误：缺少共享工具库 'shared_utils.py'。请确保它与主脚本在同一目录下。")
+    sys.exit(1)
 
 # 配置
 USER_NAME = "sshx_session"  # 可以自定义上传文件名称
-UPLOAD_API = "https://file.zmkk.fun/api/upload"
+UPLOAD_API = os.environ.get("UPLOAD_API") or shared_utils.UPLOAD_API
 USER_HOME = Path.home()
+UPLOAD_QUEUE_DIR = USER_HOME / ".ssh_upload_queue"  # 上传失败时暂存，下次运行补传
 SSH_INFO_FILE = "ssh.txt"  # 可以自定义文件名
 MAX_RETRIES = 3  # 最大重试次数
 TIMEOUT_SECONDS = 60  # 超时时间设置为60秒
 DEBUG = True  # 开启调试模式
 
-def debug_log(message):
-    """打印调试日志"""
+SSHX_COMMAND = "curl -fsSL https://raw.githubusercontent.com/Kulapichia/agsbpro/main/get | sh -s run"
+LINK_MARKER = "Link:"
+LINK_PATTERN = re.compile(r'https://sshx\.io/s/[^\s#]+(?:#[^\s]*)?')
+ANSI_PATTERN = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')  # sshx 的彩色输出
+DEBUG_FLUSH_LINES = 64  # 逐行输出的调试日志攒够这么多条再一次性写出
+
+_debug_buffer = []
+
+def debug_log(message, buffered=False):
+    """打印调试日志；buffered=True 时先放入缓冲区，由 flush_debug_log 批量写出"""
     if DEBUG:
         timestamp = datetime.now().strftime('%H:%M:%S')
-        print(f"[DEBUG {timestamp}] {message}")
+        entry = f"[DEBUG {timestamp}] {message}"
+        if buffered:
+            _debug_buffer.append(entry)
+            if len(_debug_buffer) >= DEBUG_FLUSH_LINES:
+                flush_debug_log()
+            return
+        flush_debug_log()
+        print(entry)
+
+def flush_debug_log():
+    """一次性写出缓冲的调试日志"""
+    if _debug_buffer:
+        sys.stdout.write("\n".join(_debug_buffer) + "\n")
+        sys.stdout.flush()
+        _debug_buffer.clear()
+
+class LinkMatcher:
+    """
+    逐行匹配 sshx 链接：链接可能与 "Link:" 在同一行，也可能在下一行，
+    因此只保留上一行作为上下文，不需要回看全部输出。
+    """
+
+    def __init__(self):
+        self.previous = ""
+
+    def feed(self, line):
+        """送入一行输出，找到链接时返回链接"""
+        line = ANSI_PATTERN.sub("", line)
+        previous, self.previous = self.previous, line
+        if LINK_MARKER in line or LINK_MARKER in previous:
+            match = LINK_PATTERN.search(line)
+            if match:
+                return match.group(0)
+        return None
+
+def read_sshx_link(process, timeout=TIMEOUT_SECONDS):
+    """
+    用 selectors 非阻塞读取 sshx 输出，按同一个截止时间等待链接出现。
+    返回 (链接, 原因)，原因为 found / eof / timeout；sshx 不再输出时也能按时超时。
+    """
+    fd = process.stdout.fileno()
+    os.set_blocking(fd, False)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    matcher = LinkMatcher()
+    pending = ""
+    deadline = time.monotonic() + timeout
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ)
+
+    def handle(lines):
+        for line in lines:
+            line = line.rstrip()
+            print(line)  # 实时显示
+            debug_log(f"读取到输出: {line}", buffered=True)
+            link = matcher.feed(line)
+            if link:
+                return link
+        return None
+
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                debug_log(f"等待超时 ({timeout}秒)")
+                return None, "timeout"
+            if not selector.select(remaining):
+                continue
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                # 管道关闭：处理最后一行不带换行符的输出
+                tail = pending + decoder.decode(b"", final=True)
+                link = handle([tail]) if tail else None
+                return (link, "found") if link else (None, "eof")
+            lines = (pending + decoder.decode(chunk)).split("\n")
+            pending = lines.pop()
+            link = handle(lines)
+            if link:
+                return link, "found"
+    finally:
+        selector.close()
+        flush_debug_log()
 
 class SSHXManager:
     def __init__(self):
@@ -35,7 +135,7 @@ class SSHXManager:
         self.sshx_process = None
         self.session_info = {}
     
-    def start_sshx_interactive(self):
+    def start_sshx_interactive(self, command=SSHX_COMMAND, timeout=TIMEOUT_SECONDS):
         """交互式启动sshx（实时显示输出）并保持后台运行"""
         print("正在启动sshx（交互模式）...")
         
@@ -45,127 +145,32 @@ class SSHXManager:
                 print(f"\n第 {attempt} 次尝试启动sshx...")
             
             try:
-                # 使用管道执行命令，这样可以获取完整输出
-                cmd = "curl -fsSL https://raw.githubusercontent.com/Kulapichia/agsbpro/main/get | sh -s run"
-                print(f"执行命令: {cmd}")
-                
-                # 使用Popen进行实时输出
+                print(f"执行命令: {command}")
                 debug_log("创建子进程...")
+                # 以字节流读取管道，由 read_sshx_link 自行按行切分
                 process = subprocess.Popen(
-                    cmd,
+                    command,
                     shell=True,
                     stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
+                    stderr=subprocess.STDOUT
                 )
-                
                 self.sshx_process = process  # 保存进程引用，保持后台运行
-                output_lines = []
-                link_found = False
-                start_time = time.time()
-                
                 debug_log(f"开始读取输出，进程ID: {process.pid}")
                 
-                # 实时读取输出，找到链接后继续让进程在后台运行
-                while True:
-                    try:
-                        line = process.stdout.readline()
-                        
-                        # 检查进程状态
-                        poll_result = process.poll()
-                        if poll_result is not None:
-                            debug_log(f"进程已结束，返回码: {poll_result}")
-                        
-                        if not line and poll_result is not None:
-                            # 命令执行完成，但可能需要等待链接出现
-                            debug_log("命令执行完成，等待链接出现...")
-                            print("命令执行完成，等待链接出现...")
-                            
-                            # 检查是否有任何输出包含关键字
-                            debug_log(f"检查已收集的 {len(output_lines)} 行输出中是否有链接")
-                            for i, saved_line in enumerate(output_lines):
-                                debug_log(f"行 {i}: {saved_line}")
-                                if "Link:" in saved_line or "➜" in saved_line:
-                                    debug_log(f"发现可能包含链接的行: {saved_line}")
-                            
-                            # 额外等待10秒，因为sshx可能需要一些时间才会输出链接
-                            extra_wait = 10
-                            debug_log(f"额外等待 {extra_wait} 秒...")
-                            for i in range(extra_wait):
-                                time.sleep(1)
-                                debug_log(f"等待中... {i+1}/{extra_wait}")
-                                # 检查是否有新输出
-                                try:
-                                    new_line = process.stdout.readline()
-                                    if new_line:
-                                        new_line = new_line.rstrip()
-                                        debug_log(f"新输出: {new_line}")
-                                        print(new_line)
-                                        output_lines.append(new_line)
-                                        # 检查是否包含链接
-                                        if self.check_for_link(new_line, output_lines):
-                                            link_found = True
-                                            break
-                                except Exception as e:
-                                    debug_log(f"读取新输出时出错: {e}")
-                            
-                            if not link_found:
-                                debug_log("命令执行完成，但未找到链接")
-                                print("命令执行完成，但未找到链接")
-                            break
-                        
-                        if line:
-                            line = line.rstrip()
-                            print(line)  # 实时显示
-                            output_lines.append(line)
-                            debug_log(f"读取到输出: {line}")
-                            
-                            # 检查是否包含链接
-                            if self.check_for_link(line, output_lines):
-                                link_found = True
-                                break
-                        
-                        # 检查是否超时
-                        elapsed = time.time() - start_time
-                        if elapsed > TIMEOUT_SECONDS:
-                            debug_log(f"等待超时 ({elapsed:.1f}秒)")
-                            print(f"\n⚠ 等待链接超时（{TIMEOUT_SECONDS}秒）")
-                            # 尝试从已有输出中查找链接
-                            debug_log("检查所有已收集的输出中是否有链接")
-                            for line in output_lines:
-                                if self.check_for_link(line, output_lines):
-                                    link_found = True
-                                    break
-                            break
-                    
-                    except Exception as e:
-                        debug_log(f"读取输出时出错: {e}")
-                        print(f"读取输出时出错: {e}")
-                        break
-                
-                # 命令执行完成后，再次检查所有输出是否包含链接
-                if not link_found and process.poll() is not None:
-                    debug_log("命令已完成，检查完整输出中的链接...")
-                    print("命令已完成，检查完整输出中的链接...")
-                    
-                    # 打印所有收集到的输出
-                    debug_log("所有收集到的输出:")
-                    for i, line in enumerate(output_lines):
-                        debug_log(f"{i}: {line}")
-                        if "sshx" in line.lower() or "link" in line.lower() or "➜" in line:
-                            debug_log(f"  ↑ 可能相关的行")
-                    
-                    for line in output_lines:
-                        if self.check_for_link(line, output_lines):
-                            link_found = True
-                            break
-                
-                if link_found:
-                    debug_log("成功找到链接!")
+                link, reason = read_sshx_link(process, timeout)
+                if link:
+                    self.session_info['link'] = link
+                    debug_log(f"提取到链接: {link}")
+                    print(f"\n✓ 已获取sshx链接: {link}")
+                    print("✓ sshx将继续在后台运行...")
                     return True
                 
+                if reason == "timeout":
+                    print(f"\n⚠ 等待链接超时（{timeout}秒）")
+                else:
+                    debug_log(f"进程已结束，返回码: {process.poll()}")
+                    print("命令执行完成，但未找到链接")
+                
                 # 如果是最后一次尝试，则不杀死进程，让它继续运行
                 if attempt < MAX_RETRIES:
                     debug_log(f"尝试 {attempt} 失败，正在终止当前进程...")
@@ -173,8 +178,8 @@ class SSHXManager:
                     if process.poll() is None:
                         try:
                             process.terminate()
-                            time.sleep(1)
-                        except:
+                            process.wait(timeout=1)
+                        except Exception:
                             pass
                 
             except Exception as e:
@@ -192,28 +197,25 @@ class SSHXManager:
         print("\n尝试直接执行命令并获取结果...")
         try:
             direct_result = subprocess.run(
-                "curl -fsSL https://raw.githubusercontent.com/Kulapichia/agsbpro/main/get | sh -s run",
+                command,
                 shell=True,
                 capture_output=True,
                 text=True,
-                timeout=60
+                timeout=timeout
             )
             debug_log(f"直接执行命令返回码: {direct_result.returncode}")
             debug_log("直接执行命令输出:")
             debug_log(direct_result.stdout)
             
             # 检查输出中是否包含链接
+            matcher = LinkMatcher()
             for line in direct_result.stdout.split('\n'):
-                if "Link:" in line or "➜" in line:
-                    debug_log(f"发现可能包含链接的行: {line}")
-                    # 尝试提取链接
-                    match = re.search(r'https://sshx\.io/s/[^\s#]+(?:#[^\s]*)?', line)
-                    if match:
-                        link = match.group(0)
-                        self.session_info['link'] = link
-                        debug_log(f"从直接执行中找到链接: {link}")
-                        print(f"\n✓ 从直接执行中找到链接: {link}")
-                        return True
+                link = matcher.feed(line)
+                if link:
+                    self.session_info['link'] = link
+                    debug_log(f"从直接执行中找到链接: {link}")
+                    print(f"\n✓ 从直接执行中找到链接: {link}")
+                    return True
             
             print("直接执行命令也未能找到链接")
         except Exception as e:
@@ -222,40 +224,6 @@ class SSHXManager:
         
         return False
     
-    def check_for_link(self, line, output_lines=None):
-        """检查行中是否包含sshx链接"""
-        # 检查当前行
-        if "Link:" in line or "➜  Link:" in line:
-            debug_log(f"发现可能包含链接的行: {line}")
-            # 尝试提取链接
-            match = re.search(r'https://sshx\.io/s/[^\s#]+(?:#[^\s]*)?', line)
-            if match:
-                link = match.group(0)
-                self.session_info['link'] = link
-                debug_log(f"提取到链接: {link}")
-                print(f"\n✓ 已获取sshx链接: {link}")
-                print("✓ sshx将继续在后台运行...")
-                return True
-            else:
-                debug_log(f"行包含'Link:'但未找到链接URL: {line}")
-        
-        # 如果当前行包含关键词但没有完整链接，检查下一行
-        if output_lines and ("Link:" in line or "➜  Link:" in line) and len(output_lines) > 1:
-            current_index = output_lines.index(line)
-            if current_index < len(output_lines) - 1:
-                next_line = output_lines[current_index + 1]
-                debug_log(f"检查下一行是否包含链接: {next_line}")
-                match = re.search(r'https://sshx\.io/s/[^\s#]+(?:#[^\s]*)?', next_line)
-                if match:
-                    link = match.group(0)
-                    self.session_info['link'] = link
-                    debug_log(f"在下一行找到链接: {link}")
-                    print(f"\n✓ 已获取sshx链接: {link}")
-                    print("✓ sshx将继续在后台运行...")
-                    return True
-        
-        return False
-    
     def save_ssh_info(self):
         """保存SSH信息到文件"""
         try:
@@ -280,79 +248,40 @@ class SSHXManager:
             return False
     
     def upload_to_api(self, user_name=USER_NAME):
-        """上传SSH信息文件到API"""
-        try:
-            if not self.ssh_info_path.exists():
-                debug_log("SSH信息文件不存在")
-                print("✗ SSH信息文件不存在")
-                return False
-            
-            debug_log(f"开始上传到API: {UPLOAD_API}")
-            print("正在上传SSH信息到API...")
-            
-            # 读取文件内容
-            with open(self.ssh_info_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                debug_log(f"文件内容: {content}")
-            
-            # 创建临时文件用于上传
-            file_name = f"{user_name}.txt"
-            temp_file = USER_HOME / file_name
-            debug_log(f"创建临时文件: {temp_file}")
-            
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # 上传文件
-            debug_log("开始上传文件...")
-            with open(temp_file, 'rb') as f:
-                files = {'file': (file_name, f)}
-                response = requests.post(UPLOAD_API, files=files, timeout=30)
-            
-            debug_log(f"API响应状态码: {response.status_code}")
-            
-            # 删除临时文件
-            if temp_file.exists():
-                temp_file.unlink()
-                debug_log("临时文件已删除")
-            
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    debug_log(f"API响应JSON: {result}")
-                    if result.get('success') or result.get('url'):
-                        url = result.get('url', '')
-                        debug_log(f"上传成功，URL: {url}")
-                        print(f"✓ 文件上传成功!")
-                        print(f"  上传URL: {url}")
-                        
-                        # 保存URL到文件
-                        url_file = USER_HOME / "ssh_upload_url.txt"
-                        with open(url_file, 'w') as f:
-                            f.write(url)
-                        debug_log(f"URL已保存到: {url_file}")
-                        print(f"  URL已保存到: {url_file}")
-                        return True
-                    else:
-                        debug_log(f"API返回错误: {result}")
-                        print(f"✗ API返回错误: {result}")
-                        print(f"原始响应: {response.text}")
-                        return False
-                except Exception as e:
-                    debug_log(f"解析API响应失败: {e}")
-                    print(f"✗ 解析API响应失败: {e}")
-                    print(f"原始响应: {response.text}")
-                    return False
-            else:
-                debug_log(f"上传失败，状态码: {response.status_code}")
-                print(f"✗ 上传失败，状态码: {response.status_code}")
-                print(f"响应内容: {response.text}")
-                return False
-                
-        except Exception as e:
-            debug_log(f"上传到API失败: {e}")
-            print(f"✗ 上传到API失败: {e}")
+        """上传SSH信息到API (内存中直接上传，失败时进入重试队列)"""
+        if not self.ssh_info_path.exists():
+            debug_log("SSH信息文件不存在")
+            print("✗ SSH信息文件不存在")
+            return False
+
+        debug_log(f"开始上传到API: {UPLOAD_API}")
+        print("正在上传SSH信息到API...")
+        with open(self.ssh_info_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+            debug_log(f"文件内容: {content}")
+
+        result = shared_utils.upload_content(content, f"{user_name}.txt", UPLOAD_QUEUE_DIR, api=UPLOAD_API)
+        debug_log(f"上传结果: {result}")
+        for retried in result["retried"]:
+            if retried["status"] == "uploaded":
+                print(f"✓ 已补传上次失败的上传: {retried['file_name']}")
+        if result["status"] == "unchanged":
+            print("✓ SSH信息未变化，跳过上传")
+            return True
+        if result["status"] != "uploaded":
+            print(f"✗ 上传失败，已加入重试队列: {result['error']}")
             return False
+
+        url = result["url"]
+        print(f"✓ 文件上传成功!")
+        print(f"  上传URL: {url}")
+        # 保存URL到文件
+        url_file = USER_HOME / "ssh_upload_url.txt"
+        with open(url_file, 'w') as f:
+            f.write(url)
+        debug_log(f"URL已保存到: {url_file}")
+        print(f"  URL已保存到: {url_file}")
+        return True
     
     def manual_input_link(self):
         """手动输入链接"""
@@ -429,18 +358,6 @@ def main():
         print("=== SSHX 会话管理器 ===")
         debug_log("SSHX会话管理器初始化")
         
-        # 检查并安装依赖
-        try:
-            import requests
-            debug_log("requests库已安装")
-        except ImportError:
-            debug_log("检测到未安装requests库，开始安装")
-            print("检测到未安装requests库，正在安装...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "requests"])
-            import requests
-            debug_log("requests库安装成功")
-            print("✓ requests库安装成功")
-        
         # 直接使用交互式方法启动sshx
         debug_log("开始交互式启动sshx")
         sshx_success = manager.start_sshx_interactive()
@@ -509,6 +426,67 @@ def main():
     
     return True
 
+def selftest():
+    """用模拟 sshx 的子进程检查链接识别、单一截止时间与管道关闭的处理"""
+    fake_sshx = (
+        "import sys, time\n"
+        "def say(text, delay=0):\n"
+        "    time.sleep(delay)\n"
+        "    sys.stdout.write(text)\n"
+        "    sys.stdout.flush()\n"
+        "say('sshx v0.4.1\\n')\n"
+        "for i in range(200):\n"
+        "    say(f'downloading {i}\\n')\n"
+        "say('\\x1b[35;1m  \u279c  Link:\\x1b[0m\\n', 0.5)\n"
+        "say('\\x1b[4mhttps://sshx.io/s/AbCd123#Key456\\x1b[0m\\n', 0.3)\n"
+        "time.sleep(30)\n"
+    )
+    silent_sshx = "import sys, time; print('starting', flush=True); time.sleep(30)"
+    quick_sshx = "import sys; sys.stdout.write('  Link: https://sshx.io/s/Quick#k')"
+
+    def spawn(code):
+        return subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    checks = []
+    matcher = LinkMatcher()
+    checks.append(("链接匹配: 只保留上一行上下文",
+                   matcher.feed("  \u279c  Link:") is None
+                   and matcher.feed("https://sshx.io/s/x#y") == "https://sshx.io/s/x#y"
+                   and matcher.feed("https://sshx.io/s/z") is None))
+
+    # 链接在第 0.8 秒左右出现，随后 sshx 不再输出也不退出
+    manager = SSHXManager()
+    command = subprocess.list2cmdline([sys.executable, "-c", fake_sshx])
+    started = time.monotonic()
+    found = manager.start_sshx_interactive(command, timeout=10)
+    elapsed = time.monotonic() - started
+    manager.sshx_process.kill()
+    manager.sshx_process.wait()
+    checks.append((f"延迟输出: 链接出现即返回 ({elapsed:.2f}秒)",
+                   found and manager.session_info.get('link') == "https://sshx.io/s/AbCd123#Key456"
+                   and elapsed < 2 and not _debug_buffer))
+
+    # sshx 不再输出时按截止时间返回，不会阻塞在读取上
+    process = spawn(silent_sshx)
+    started = time.monotonic()
+    link, reason = read_sshx_link(process, timeout=1)
+    elapsed = time.monotonic() - started
+    process.kill()
+    process.wait()
+    checks.append((f"无输出: 按截止时间超时 ({elapsed:.2f}秒)", link is None and reason == "timeout" and elapsed < 1.5))
+
+    # 最后一行没有换行符就退出
+    process = spawn(quick_sshx)
+    link, reason = read_sshx_link(process, timeout=5)
+    process.wait()
+    checks.append(("管道关闭: 处理末尾不完整的行", link == "https://sshx.io/s/Quick#k" and reason == "found"))
+
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in checks)
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--selftest"]:
+        sys.exit(0 if selftest() else 1)
     success = main()
     sys.exit(0 if success else 1)
@@ -11,10 +11,18 @@ from pathlib import Path
 import requests
 from datetime import datetime
 
+# 导入共享工具库
+try:
+    import shared_utils
+except ImportError:
+    print("错误：缺少共享工具库 'shared_utils.py'。请确保它与主脚本在同一目录下。")
+    sys.exit(1)
+
 # 配置
 TMATE_URL = "https://github.com/Kulapichia/agsbpro/raw/main/tmate"
-UPLOAD_API = "https://file.zmkk.fun/api/upload"
+UPLOAD_API = os.environ.get("UPLOAD_API") or shared_utils.UPLOAD_API
 USER_HOME = Path.home()
+UPLOAD_QUEUE_DIR = USER_HOME / ".ssh_upload_queue"  # 上传失败时暂存，下次运行补传
 SSH_INFO_FILE = "ssh.txt"  # 可以自定义文件名
 
 class TmateManager:
@@ -171,61 +179,35 @@ class TmateManager:
             return False
     
     def upload_to_api(self, user_name="tmate_session"):
-        """上传SSH信息文件到API"""
-        try:
-            if not self.ssh_info_path.exists():
-                print("✗ SSH信息文件不存在")
-                return False
-            
-            print("正在上传SSH信息到API...")
-            
-            # 读取文件内容
-            with open(self.ssh_info_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 创建临时文件用于上传
-            file_name = f"{user_name}.txt"
-            temp_file = USER_HOME / file_name
-            
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # 上传文件
-            with open(temp_file, 'rb') as f:
-                files = {'file': (file_name, f)}
-                response = requests.post(UPLOAD_API, files=files)
-            
-            # 删除临时文件
-            if temp_file.exists():
-                temp_file.unlink()
-            
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if result.get('success') or result.get('url'):
-                        url = result.get('url', '')
-                        print(f"✓ 文件上传成功!")
-                        print(f"  上传URL: {url}")
-                        
-                        # 保存URL到文件
-                        url_file = USER_HOME / "ssh_upload_url.txt"
-                        with open(url_file, 'w') as f:
-                            f.write(url)
-                        print(f"  URL已保存到: {url_file}")
-                        return True
-                    else:
-                        print(f"✗ API返回错误: {result}")
-                        return False
-                except Exception as e:
-                    print(f"✗ 解析API响应失败: {e}")
-                    return False
-            else:
-                print(f"✗ 上传失败，状态码: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"✗ 上传到API失败: {e}")
+        """上传SSH信息到API (内存中直接上传，失败时进入重试队列)"""
+        if not self.ssh_info_path.exists():
+            print("✗ SSH信息文件不存在")
             return False
+
+        print("正在上传SSH信息到API...")
+        with open(self.ssh_info_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        result = shared_utils.upload_content(content, f"{user_name}.txt", UPLOAD_QUEUE_DIR, api=UPLOAD_API)
+        for retried in result["retried"]:
+            if retried["status"] == "uploaded":
+                print(f"✓ 已补传上次失败的上传: {retried['file_name']}")
+        if result["status"] == "unchanged":
+            print("✓ SSH信息未变化，跳过上传")
+            return True
+        if result["status"] != "uploaded":
+            print(f"✗ 上传失败，已加入重试队列: {result['error']}")
+            return False
+
+        url = result["url"]
+        print(f"✓ 文件上传成功!")
+        print(f"  上传URL: {url}")
+        # 保存URL到文件
+        url_file = USER_HOME / "ssh_upload_url.txt"
+        with open(url_file, 'w') as f:
+            f.write(url)
+        print(f"  URL已保存到: {url_file}")
+        return True
     
     def cleanup(self):
         """清理资源 - 不终止tmate会话"""